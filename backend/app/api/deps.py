@@ -1,4 +1,4 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 from typing import Annotated
 
 import jwt
@@ -7,11 +7,12 @@ from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core import security
 from app.core.config import settings
-from app.core.db import engine
-from app.models import File, TokenPayload, User
+from app.core.db import async_engine, engine, replica_async_engine, replica_engine
+from app.models import DownloadTokenPayload, Run, TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
@@ -26,22 +27,46 @@ def get_db() -> Generator[Session]:
         yield session
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession]:
+    # Async sessions cannot lazy load: objects stay usable after commit and
+    # routes load the relationships they return up front
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+def get_read_db() -> Generator[Session]:
+    with Session(replica_engine) as session:
+        yield session
+
+
+async def get_async_read_db() -> AsyncGenerator[AsyncSession]:
+    async with AsyncSession(replica_async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
+# Read-only sessions on the replica, if configured, for listings and stats
+# that can be a replication delay behind
+ReadSessionDep = Annotated[Session, Depends(get_read_db)]
+AsyncReadSessionDep = Annotated[AsyncSession, Depends(get_async_read_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+def get_token_payload(token: str) -> TokenPayload:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
         )
-        token_data = TokenPayload(**payload)
+        return TokenPayload(**payload)
     except (InvalidTokenError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = session.get(User, token_data.sub)
+
+
+def check_active_user(user: User | None) -> User:
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -51,6 +76,25 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
         raise HTTPException(status_code=400, detail="Inactive user")
     return user
 
+
+def get_current_user(session: SessionDep, token: TokenDep) -> User:
+    token_data = get_token_payload(token)
+    return check_active_user(session.get(User, token_data.sub))
+
+
+async def get_current_user_async(session: AsyncSessionDep, token: TokenDep) -> User:
+    token_data = get_token_payload(token)
+    return check_active_user(await session.get(User, token_data.sub))
+
+
+def is_anonymous_error(e: HTTPException) -> bool:
+    # Invalid or stale credentials do not block public routes,
+    # other errors (404, 400) bubble up
+    return e.status_code in {
+        status.HTTP_401_UNAUTHORIZED,
+        status.HTTP_403_FORBIDDEN,
+    }
+
 def get_current_user_or_anonymous(
     session: SessionDep,
     token: Annotated[str | None, Depends(optional_oauth2)],
@@ -62,26 +106,38 @@ def get_current_user_or_anonymous(
         # valid bearer token → real user
         return get_current_user(session, token)
     except HTTPException as e:
-        # Invalid or stale credentials do not block public routes.
-        if e.status_code in {
-            status.HTTP_401_UNAUTHORIZED,
-            status.HTTP_403_FORBIDDEN,
-        }:
+        if is_anonymous_error(e):
             return None
-        # other errors (404, 400) bubble up
         raise
 
-def get_current_user_from_query(session: SessionDep, token: Annotated[str | None, Query()] = None) -> User:
+async def get_current_user_or_anonymous_async(
+    session: AsyncSessionDep,
+    token: Annotated[str | None, Depends(optional_oauth2)],
+) -> User | None:
+    if token is None:
+        return None
+    try:
+        return await get_current_user_async(session, token)
+    except HTTPException as e:
+        if is_anonymous_error(e):
+            return None
+        raise
+
+async def get_current_user_from_query(session: AsyncSessionDep, token: Annotated[str | None, Query()] = None) -> User:
     if token is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated",
         )
-    return get_current_user(session, token)
+    return await get_current_user_async(session, token)
 
 
 CurrentUser = Annotated[User, Depends(get_current_user)]
 CurrentUserOrAnonymous = Annotated[User | None, Depends(get_current_user_or_anonymous)]
+# For routes on AsyncSessionDep, resolved on the same session
+AsyncCurrentUser = Annotated[User, Depends(get_current_user_async)]
+AsyncCurrentUserOrAnonymous = Annotated[User | None, Depends(get_current_user_or_anonymous_async)]
+QueryUser = Annotated[User, Depends(get_current_user_from_query)]
 
 
 def get_current_active_superuser(current_user: CurrentUser) -> User:
@@ -95,20 +151,40 @@ def get_current_active_superuser(current_user: CurrentUser) -> User:
 SuperUser = Annotated[User, Depends(get_current_active_superuser)]
 
 
-def get_file(session: SessionDep, token: str) -> User:
+def get_download_token_payload(token: str) -> DownloadTokenPayload:
+    """Verify a signed download token without touching the database."""
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
         )
-        token_data = TokenPayload(**payload)
+        token_data = DownloadTokenPayload(**payload)
     except (InvalidTokenError, ValidationError):
         raise HTTPException(
             status_code=403,
             detail="Could not validate credentials",
         )
-    file_metadata = session.get(File, token_data.sub)
-    if not file_metadata:
-        raise HTTPException(status_code=404, detail="File not found")
-    return file_metadata
+    if token_data.typ != security.DOWNLOAD_TOKEN_TYPE:
+        raise HTTPException(
+            status_code=403,
+            detail="Could not validate credentials",
+        )
+    if security.is_download_token_revoked(token_data.sub, token_data.iat):
+        raise HTTPException(status_code=403, detail="Download token has been revoked")
+    return token_data
+
+DownloadTokenDep = Annotated[DownloadTokenPayload, Depends(get_download_token_payload)]
+
+
+def get_run(session: SessionDep, token: str) -> Run:
+    token_data = get_token_payload(token)
+    if token_data.typ != security.RUN_DOWNLOAD_TOKEN_TYPE:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
+    run = session.get(Run, token_data.sub)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
 
-FileDep = Annotated[File, Depends(get_file)]
+RunDep = Annotated[Run, Depends(get_run)]
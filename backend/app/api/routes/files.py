@@ -1,20 +1,55 @@
+import mimetypes
 import uuid
 from datetime import timedelta
 from pathlib import Path
 from typing import Any
-
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, status
-from fastapi.responses import FileResponse
-from sqlalchemy import and_, desc
+from urllib.parse import quote
+
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from sqlalchemy import and_, delete, or_, update
+from sqlalchemy.orm import selectinload
 from sqlmodel import func, select
 
-from app.api.deps import CurrentUser, FileDep, SessionDep, get_current_user
+from app.api.deps import (
+    AsyncCurrentUser,
+    AsyncReadSessionDep,
+    CurrentUser,
+    DownloadTokenDep,
+    ReadSessionDep,
+    SessionDep,
+    get_current_user,
+)
+from app.archive import (
+    ARCHIVE_MEDIA_TYPES,
+    ArchiveEntry,
+    ArchiveFormat,
+    content_disposition,
+    stream_archive,
+    unique_archive_names,
+)
+from app.compaction import iter_stored, open_stored
 from app.core.config import settings
 from app.core.file_types import FileTypeEnum, FileTypeMetadata, file_types
-from app.core.security import create_access_token
+from app.core.security import (
+    MAX_DOWNLOAD_TOKEN_MINUTES,
+    create_download_token,
+    revoke_download_tokens,
+)
 from app.crud import get_file_stats
 from app.crud import rename_file as rename_file_crud
 from app.crud import save_file as save_file_to_filesystem
+from app.housekeeping import delete_files_deferred
 from app.models import (
     File,
     FilePublic,
@@ -23,9 +58,15 @@ from app.models import (
     Message,
     Run,
 )
+from app.pagination import next_cursor, page_query
+from app.storage import storage_for
+from app.tasks import reclaim_storage
 
 router = APIRouter()
 
+# Lifetime of presigned object storage URLs; the client follows the redirect immediately
+DOWNLOAD_REDIRECT_SECONDS = 5 * 60
+
 FILE_SORT_COLUMNS = {
     "created_at": File.created_at,
     "file_type": File.file_type,
@@ -51,18 +92,164 @@ def check_file_access(session: SessionDep, current_user: CurrentUser, file_metad
     return False
 
 
+def is_archive(file_metadata: File) -> bool:
+    """Groups and pairs are downloaded as an archive of their children."""
+    return file_metadata.is_group or file_metadata.file_type == FileTypeEnum.PAIR.value
+
+
+def archive_response(name: str, files: list[File], archive_format: ArchiveFormat) -> StreamingResponse:
+    """
+    Stream an archive of the given files.
+    Content already stored compressed (e.g. fastq.gz, bam) is not recompressed.
+    Members are not checked for existence up front, which would cost a
+    request per member on object storage; missing content aborts the stream.
+    """
+    entries = []
+    for file, entry_name in zip(files, unique_archive_names(f.name for f in files), strict=True):
+        if not file.location:
+            raise HTTPException(status_code=404, detail=f"File not found: {file.id}")
+        file_type = file_types.allowed.get(file.file_type)
+        entries.append(
+            ArchiveEntry(
+                name=entry_name,
+                path=file.location,
+                modified_at=file.created_at,
+                compressed=file_type is not None and file_type.file_format == "binary",
+                compression=file.compression,
+                size=file.size,
+            )
+        )
+    return StreamingResponse(
+        stream_archive(entries, archive_format),
+        media_type=ARCHIVE_MEDIA_TYPES[archive_format],
+        headers={"Content-Disposition": content_disposition(f"{name}.{archive_format.value}")},
+    )
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag (RFC 9110)."""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag.removeprefix("W/") in candidates
+
+
+def offload_response(file_path: Path, name: str, etag: str) -> Response | None:
+    """
+    Hand the transfer over to the reverse proxy with an internal redirect header.
+    Returns None when offloading is disabled or the file is outside STORAGE_PATH.
+    """
+    if settings.DOWNLOAD_OFFLOAD == "none":
+        return None
+    storage_path = Path(settings.STORAGE_PATH)
+    if not file_path.is_relative_to(storage_path):
+        return None
+    media_type, _ = mimetypes.guess_type(name)
+    headers = {
+        "Content-Disposition": content_disposition(name),
+        "ETag": etag,
+    }
+    if settings.DOWNLOAD_OFFLOAD == "x-accel-redirect":
+        prefix = settings.DOWNLOAD_OFFLOAD_PREFIX.rstrip("/")
+        headers["X-Accel-Redirect"] = f"{prefix}/{quote(file_path.relative_to(storage_path).as_posix())}"
+    else:
+        headers["X-Sendfile"] = str(file_path)
+    return Response(media_type=media_type or "application/octet-stream", headers=headers)
+
+
+def file_response(
+    request: Request,
+    *,
+    location: str | None,
+    name: str,
+    checksum: str | None,
+    size: int | None = None,
+    compression: str | None = None,
+) -> Response:
+    """
+    Serve a stored file with byte-range and conditional GET support.
+    Files with a stored checksum get a strong ETag derived from it, otherwise
+    the ETag is derived from the file modification time and size.
+    When DOWNLOAD_OFFLOAD is enabled the proxy streams the bytes instead,
+    content in object storage is downloaded from a short-lived presigned URL.
+    Content compressed by the compactor is decompressed on the fly, without
+    range support.
+    """
+    if not location:
+        raise HTTPException(status_code=404, detail="File not found")
+    download_url = storage_for(location).download_url(
+        location, content_disposition(name), DOWNLOAD_REDIRECT_SECONDS
+    )
+    if download_url is not None:
+        # Object storage serves the content, including ranges and ETags
+        return RedirectResponse(download_url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+    file_path = Path(location)
+    try:
+        stat_result = file_path.stat()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    if compression is None and size is not None and stat_result.st_size != size:
+        # The stored content no longer matches the token
+        raise HTTPException(status_code=404, detail="File not found")
+    headers = {}
+    if checksum:
+        headers["ETag"] = f'"{checksum}"'
+    if compression is not None:
+        return decompressed_response(request, file_path, name, compression, size, headers)
+    response = FileResponse(file_path, filename=name, headers=headers, stat_result=stat_result)
+    # FileResponse handles Range and If-Range itself, but not If-None-Match
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, response.headers["etag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": response.headers["etag"]})
+    return offload_response(file_path, name, response.headers["etag"]) or response
+
+
+def decompressed_response(
+    request: Request, file_path: Path, name: str, compression: str, size: int | None, headers: dict[str, str]
+) -> Response:
+    """Stream compacted content decompressed. Ranges are ignored and the full content is sent."""
+    etag = headers.get("ETag")
+    if_none_match = request.headers.get("if-none-match")
+    if etag and if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    headers = {**headers, "Content-Disposition": content_disposition(name), "Accept-Ranges": "none"}
+    if size is not None:
+        headers["Content-Length"] = str(size)
+    media_type, _ = mimetypes.guess_type(name)
+    return StreamingResponse(
+        iter_stored(file_path, compression),
+        media_type=media_type or "application/octet-stream",
+        headers=headers,
+    )
+
+
+def storage_key(location: str | None) -> str | None:
+    """Location of a stored file relative to STORAGE_PATH, if it is inside it."""
+    if not location:
+        return None
+    path = Path(location)
+    storage_path = Path(settings.STORAGE_PATH)
+    if not path.is_relative_to(storage_path):
+        return None
+    return path.relative_to(storage_path).as_posix()
+
+
 @router.get("/", response_model=FilesPublic)
-def read_files(
-    session: SessionDep,
-    current_user: CurrentUser,
+async def read_files(
+    session: AsyncReadSessionDep,
+    current_user: AsyncCurrentUser,
     skip: int = 0,
     limit: int = 100,
     order_by: str = Query("-created_at", pattern=r"^-?[a-zA-Z_]+$"),
     name: str | None = Query(None, min_length=1, max_length=255),
     types: list[FileTypeEnum] = Query(None),
+    cursor: str | None = None,
+    include_count: bool = True,
 ) -> Any:
     """
-    Retrieve saved files.
+    Retrieve saved files. Pass the `next_cursor` of a page as `cursor` to get
+    the next one without an offset; `skip` is then ignored. Without
+    `include_count` the total is not counted and `count` is null.
     """
     if not types:
         types = []
@@ -81,8 +268,10 @@ def read_files(
         base_where = and_(base_where, File.name.icontains(name, autoescape=True))
 
     # Counting for pagination
-    count_query = select(func.count()).select_from(File).where(base_where)
-    count = session.exec(count_query).one()
+    count = None
+    if include_count:
+        count_query = select(func.count()).select_from(File).where(base_where)
+        count = (await session.exec(count_query)).one()
 
     # Parse the order_by string to determine the column and direction
     descending = order_by.startswith('-')
@@ -92,16 +281,19 @@ def read_files(
     column = FILE_SORT_COLUMNS.get(column_name)
     if column is None:
         raise HTTPException(status_code=400, detail=f"Invalid column name: {column_name}")
-    order_expression = desc(column) if descending else column
 
-    # Build the query based on user role
-    query_base = select(File).where(base_where)
+    # The sort value is selected for the cursor of the next page
+    query_base = select(File, column).where(base_where)
 
     # Apply ordering, pagination and execute
-    files_query = query_base.order_by(order_expression).offset(skip).limit(limit)
-    files = session.exec(files_query).all()
+    files_query = page_query(query_base, column, File.id, order_by, skip, limit, cursor).options(
+        selectinload(File.children)
+    )
+    rows = (await session.exec(files_query)).all()
 
-    return FilesPublic(data=files, count=count)
+    return FilesPublic(
+        data=[file for file, _ in rows], count=count, next_cursor=next_cursor(rows, order_by, limit)
+    )
 
 
 @router.get("/types", response_model=dict[str, FileTypeMetadata], dependencies=[Depends(get_current_user)])
@@ -113,7 +305,7 @@ def get_files_allowed_types() -> Any:
 
 
 @router.get("/types/current", response_model=dict[str, FileTypeMetadata])
-def get_current_file_types(session: SessionDep, current_user: CurrentUser) -> Any:
+def get_current_file_types(session: ReadSessionDep, current_user: CurrentUser) -> Any:
     """
     Get file types present in the current user's saved top-level files.
     """
@@ -134,7 +326,7 @@ def get_current_file_types(session: SessionDep, current_user: CurrentUser) -> An
 
 
 @router.get("/stats", response_model=FilesStatistics)
-def get_files_stats(session: SessionDep, current_user: CurrentUser) -> Any:
+def get_files_stats(session: ReadSessionDep, current_user: CurrentUser) -> Any:
     """
     Get saved files statistics.
     """
@@ -234,23 +426,25 @@ def create_group(
     if len(file_ids) > settings.MAX_FILES_IN_GROUP:
         raise HTTPException(status_code=400, detail=f"A maximum of {settings.MAX_FILES_IN_GROUP} files can be grouped together")
 
-    # Fetch all files and check ownership
-    files = []
-    sum_size = 0
-    file_types_in_group = set()
-
-    for file_id in file_ids:
-        file = session.get(File, file_id)
-        if not file:
-            raise HTTPException(status_code=404, detail=f"File not found: {file_id}")
-        if file.owner_id != current_user.id:
-            raise HTTPException(status_code=400, detail="Not enough permissions")
-        if file.is_group:
-            raise HTTPException(status_code=400, detail="Cannot include a group within another group")
-        files.append(file)
-        sum_size += file.size
-        if file.file_type:
-            file_types_in_group.add(file.file_type)
+    # Check all files in one query, the total size is summed alongside
+    statement = select(
+        File.id,
+        File.owner_id,
+        File.is_group,
+        File.file_type,
+        func.coalesce(func.sum(File.size).over(), 0).label("total_size"),
+    ).where(File.id.in_(file_ids))
+    rows = session.exec(statement).all()
+
+    missing = unique_file_ids - {row.id for row in rows}
+    if missing:
+        raise HTTPException(status_code=404, detail=f"File not found: {next(iter(missing))}")
+    if any(row.owner_id != current_user.id for row in rows):
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+    if any(row.is_group for row in rows):
+        raise HTTPException(status_code=400, detail="Cannot include a group within another group")
+    sum_size = int(rows[0].total_size)
+    file_types_in_group = {row.file_type for row in rows if row.file_type}
 
     # Ensure all files have the same type
     if len(file_types_in_group) > 1:
@@ -259,20 +453,23 @@ def create_group(
     # Determine the file type for the group (use the type of the children, or 'unknown' if no type)
     group_file_type = next(iter(file_types_in_group)) if file_types_in_group else "unknown"
 
-    # Create the group
+    # Create the group, then move the files into it with one UPDATE
     group_metadata = File(
         name=name,
         owner_id=current_user.id,
         file_type=group_file_type,
-        children=files,
         size=sum_size,
         saved=True,
         is_group=True,
     )
     session.add(group_metadata)
+    session.flush()
+    session.execute(
+        update(File).where(File.id.in_(file_ids)).values(parent_id=group_metadata.id),
+        execution_options={"synchronize_session": False},
+    )
     session.commit()
     session.refresh(group_metadata)
-    session.commit()
     print(f"Group created: {group_metadata}")
     return group_metadata
 
@@ -292,20 +489,19 @@ def ungroup_file(session: SessionDep, current_user: CurrentUser, id: uuid.UUID)
     if not group_file.is_group:
         raise HTTPException(status_code=400, detail="File is not a group")
 
-    if not group_file.children:
-        raise HTTPException(status_code=400, detail="Group has no children to ungroup")
-
     # Make all children independent
-    children = list(group_file.children)  # Create a copy to avoid modifying while iterating
-    for child in children:
-        child.parent_id = None
-        session.add(child)
+    ungrouped = session.execute(
+        update(File).where(File.parent_id == id).values(parent_id=None),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    if not ungrouped:
+        raise HTTPException(status_code=400, detail="Group has no children to ungroup")
 
-    # Delete the group file
-    session.delete(group_file)
+    # Delete the group file, a bulk delete does not load the children
+    session.execute(delete(File).where(File.id == id))
     session.commit()
 
-    return Message(message=f"Successfully ungrouped {len(children)} files")
+    return Message(message=f"Successfully ungrouped {ungrouped} files")
 
 
 @router.get("/{id}", response_model=FilePublic)
@@ -366,20 +562,20 @@ def copy_file(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) ->
         for child in source.children:
             if not child.location:
                 raise HTTPException(status_code=404, detail="File not found")
-            path = Path(child.location)
-            if not path.exists():
+            storage = storage_for(child.location)
+            if not storage.exists(child.location):
                 raise HTTPException(status_code=404, detail="File not found")
             files_to_copy.append(child)
-            total_size_to_add += child.size or path.stat().st_size
+            total_size_to_add += child.size or storage.size(child.location)
             files_count_to_add += 1
     else:
         if not source.location:
             raise HTTPException(status_code=404, detail="File not found")
-        path = Path(source.location)
-        if not path.exists():
+        storage = storage_for(source.location)
+        if not storage.exists(source.location):
             raise HTTPException(status_code=404, detail="File not found")
         files_to_copy.append(source)
-        total_size_to_add += source.size or path.stat().st_size
+        total_size_to_add += source.size or storage.size(source.location)
         files_count_to_add += 1
 
     # Enforce storage limits similar to upload
@@ -399,10 +595,9 @@ def copy_file(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) ->
     new_children: list[File] = []
     for original in files_to_copy:
         # Open original content and save as a new file owned by current user
-        file_path = Path(original.location) if original.location else None
-        if not file_path or not file_path.exists():
+        if not original.location or not storage_for(original.location).exists(original.location):
             raise HTTPException(status_code=404, detail="File not found")
-        with open(file_path, "rb") as fsrc:
+        with open_stored(original.location, original.compression) as fsrc:
             copied = save_file_to_filesystem(
                 session=session,
                 name=original.name,
@@ -441,7 +636,12 @@ def copy_file(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) ->
 
 
 @router.delete("/{id}")
-def delete_file(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) -> Any:
+def delete_file(
+    session: SessionDep,
+    current_user: CurrentUser,
+    background_tasks: BackgroundTasks,
+    id: uuid.UUID,
+) -> Any:
     """
     Delete file.
     """
@@ -451,24 +651,19 @@ def delete_file(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) -
     if file_metadata.owner_id != current_user.id:
         raise HTTPException(status_code=400, detail="Not enough permissions")
     try:
-        files_to_delete = [file_metadata]
-        if file_metadata.children:
-            files_to_delete.extend(file_metadata.children)
-        for file_to_delete in files_to_delete:
-            if file_to_delete.location:
-                file_path = Path(file_to_delete.location)
-                if file_path.exists():
-                    file_path.unlink()
-            session.delete(file_to_delete)
-            session.commit()
+        deleted_ids = delete_files_deferred(session, or_(File.id == id, File.parent_id == id))
+        session.commit()
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to delete file")
+    revoke_download_tokens(deleted_ids)
+    background_tasks.add_task(reclaim_storage.kiq)
     return Message(message="File deleted successfully")
 
 @router.delete("/")
 def delete_files(
     session: SessionDep,
     current_user: CurrentUser,
+    background_tasks: BackgroundTasks,
     name: str | None = Query(None, min_length=1, max_length=255),
     types: list[FileTypeEnum] = Query(None),
     top_level_only: bool = False,
@@ -487,52 +682,65 @@ def delete_files(
     if top_level_only:
         base_where = and_(base_where, File.parent_id.is_(None))
 
-    files = session.exec(select(File).where(base_where)).all()
     try:
-        for file_metadata in files:
-            # remove file
-            if file_metadata.location:
-                file_path = Path(file_metadata.location)
-                if file_path.exists():
-                    file_path.unlink()
-            session.delete(file_metadata)
+        deleted_ids = delete_files_deferred(session, base_where)
         session.commit()
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to delete files")
+    revoke_download_tokens(deleted_ids)
+    background_tasks.add_task(reclaim_storage.kiq)
     return Message(message="All files deleted successfully")
 
 @router.get("/{id}/download")
-def download_file(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) -> Any:
+def download_file(
+    request: Request,
+    session: SessionDep,
+    current_user: CurrentUser,
+    id: uuid.UUID,
+    archive_format: ArchiveFormat = ArchiveFormat.zip,
+) -> Any:
     """
-    Download file.
+    Download file. Supports byte ranges and conditional requests.
+    Groups and pairs are streamed as a zip or tar archive.
     """
     file_metadata = session.get(File, id)
     if not file_metadata:
         raise HTTPException(status_code=404, detail="File not found")
     if not check_file_access(session, current_user, file_metadata):
         raise HTTPException(status_code=400, detail="Not enough permissions")
-    if file_metadata.is_group or file_metadata.file_type == FileTypeEnum.PAIR.value:
-        # TODO: Download zipped files?
-        file_type_desc = "Paired files" if file_metadata.file_type == FileTypeEnum.PAIR.value else "Grouped files"
-        raise HTTPException(status_code=400, detail=f"{file_type_desc} cannot be downloaded directly. Please download the files separately.")
-    if not file_metadata.location:
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_metadata.location, filename=file_metadata.name)
+    if is_archive(file_metadata):
+        return archive_response(file_metadata.name, file_metadata.children, archive_format)
+    return file_response(
+        request,
+        location=file_metadata.location,
+        name=file_metadata.name,
+        checksum=file_metadata.checksum,
+        size=file_metadata.size,
+        compression=file_metadata.compression,
+    )
 
 @router.get("/{id}/token", response_model=str)
 def get_download_token(session: SessionDep, current_user: CurrentUser, id: uuid.UUID, minutes: int = 1) -> Any:
     """
     Get signed file download token.
+    The token carries the storage key, size and checksum of the file so
+    downloads (including repeated range requests) do not hit the database.
     """
     file_metadata = session.get(File, id)
     if not file_metadata:
         raise HTTPException(status_code=404, detail="File not found")
     if not check_file_access(session, current_user, file_metadata):
         raise HTTPException(status_code=400, detail="Not enough permissions")
-    access_token_expires = timedelta(minutes=minutes if minutes > 0 and minutes <= 60 * 24 else 1)
-    return create_access_token(
-            str(file_metadata.id), expires_delta=access_token_expires
-        )
+    access_token_expires = timedelta(minutes=minutes if minutes > 0 and minutes <= MAX_DOWNLOAD_TOKEN_MINUTES else 1)
+    return create_download_token(
+        file_metadata.id,
+        # groups and pairs are resolved from the database when downloaded
+        key=None if is_archive(file_metadata) else storage_key(file_metadata.location),
+        size=file_metadata.size,
+        name=file_metadata.name,
+        checksum=file_metadata.checksum,
+        expires_delta=access_token_expires,
+    )
 
 @router.patch("/{id}/rename", response_model=FilePublic)
 def rename_file(
@@ -557,16 +765,40 @@ def rename_file(
     file_metadata = rename_file_crud(session=session, file=file, new_name=name.strip())
     if not file_metadata:
         raise HTTPException(status_code=500, detail="Failed to rename file")
+    # tokens issued before the rename point at the old storage key
+    revoke_download_tokens([file_metadata.id])
     return file_metadata
 
 @router.get("/download/{token}")
-def download_file_with_token(file_metadata: FileDep) -> Any:
-    """
-    Download file by token.
+def download_file_with_token(
+    request: Request,
+    session: SessionDep,
+    token_data: DownloadTokenDep,
+    archive_format: ArchiveFormat = ArchiveFormat.zip,
+) -> Any:
     """
-    if not file_metadata.location:
-        raise HTTPException(status_code=404, detail="File not found")
-    file_path = Path(file_metadata.location)
-    if not file_path.exists():
+    Download file by token. Supports byte ranges and conditional requests.
+    Groups and pairs are streamed as a zip or tar archive.
+    """
+    if token_data.key is not None:
+        # Everything needed is signed into the token, no database lookup
+        return file_response(
+            request,
+            location=str(Path(settings.STORAGE_PATH) / token_data.key),
+            name=token_data.name,
+            checksum=token_data.checksum,
+            size=token_data.size,
+        )
+    file_metadata = session.get(File, token_data.sub)
+    if not file_metadata:
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path, filename=file_metadata.name)
+    if is_archive(file_metadata):
+        return archive_response(file_metadata.name, file_metadata.children, archive_format)
+    return file_response(
+        request,
+        location=file_metadata.location,
+        name=file_metadata.name,
+        checksum=file_metadata.checksum,
+        size=file_metadata.size,
+        compression=file_metadata.compression,
+    )
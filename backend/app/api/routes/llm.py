@@ -1,3 +1,4 @@
+import asyncio
 import uuid
 from enum import StrEnum
 from typing import Any
@@ -5,8 +6,10 @@ from typing import Any
 from fastapi import APIRouter, HTTPException
 from google import genai
 from jinja2 import Environment as JinjaEnvironment
+from sqlalchemy.orm import selectinload
 
-from app.api.deps import CurrentUser, SessionDep
+from app.api.deps import AsyncCurrentUser, AsyncSessionDep
+from app.compaction import open_stored
 from app.core.config import settings
 from app.models import File, Run
 
@@ -23,7 +26,7 @@ def get_file_content_for_prompt(file: File, threshold: int = 10000) -> str:
         # If the file is too big, provide a head+tail preview
         if file.size > threshold:
             half_preview = threshold // 2
-            with open(file.location, "rb") as f:
+            with open_stored(file.location, file.compression) as f:
                 # Read the first half of the preview
                 head = f.read(half_preview)
                 # Seek to the last half_preview bytes of the file
@@ -40,8 +43,8 @@ def get_file_content_for_prompt(file: File, threshold: int = 10000) -> str:
             )
         else:
             # For smaller files, read the entire content in text mode
-            with open(file.location, encoding="utf-8") as f:
-                return f.read()
+            with open_stored(file.location, file.compression) as f:
+                return f.read().decode("utf-8")
     return "File type not supported, content not included."
 
 class Audience(StrEnum):
@@ -53,8 +56,8 @@ class Audience(StrEnum):
 
 @router.post("/summary/{run_id}", response_model=str)
 async def generate_run_summary(
-    session: SessionDep,
-    current_user: CurrentUser,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
     run_id: uuid.UUID,
     audience: Audience = Audience.expert,
 ) -> Any:
@@ -64,7 +67,7 @@ async def generate_run_summary(
     if not settings.GEMINI_API_KEY:
         raise HTTPException(status_code=500, detail="Summary generation is disabled")
     # Counting for pagination
-    run: Run = session.get(Run, run_id)
+    run: Run = await session.get(Run, run_id, options=[selectinload(Run.tool), selectinload(Run.files)])
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
     if run.owner_id != current_user.id:
@@ -118,7 +121,7 @@ async def generate_run_summary(
     client = genai.Client(api_key=settings.GEMINI_API_KEY)
     results = []
     for file in run.files:
-        content = get_file_content_for_prompt(file)
+        content = await asyncio.to_thread(get_file_content_for_prompt, file)
         results.append({"name": file.name, "content": content})
     prompt = template.render(
         name=run.tool.name,
@@ -130,6 +133,8 @@ async def generate_run_summary(
         results=results,
     )
     print(prompt)
+    # Do not hold a pooled connection while the model generates
+    await session.commit()
     try:
         response = await client.aio.models.generate_content(
                 model='gemini-2.0-flash',
@@ -145,5 +150,5 @@ async def generate_run_summary(
     llm_summary_report = response.text.removeprefix("```markdown").removeprefix("```").removesuffix("```").strip()
     run.llm_summary = llm_summary_report
     session.add(run)
-    session.commit()
+    await session.commit()
     return llm_summary_report
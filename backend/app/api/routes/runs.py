@@ -1,26 +1,45 @@
 import json
 import uuid
+from datetime import timedelta
 from pathlib import Path
 from typing import Any
 
-from fastapi import APIRouter, HTTPException, Query, status
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, status
 from jinja2 import Environment as JinjaEnvironment
-from sqlalchemy import and_, desc
+from sqlalchemy import ColumnElement, and_, delete, update
+from sqlalchemy.orm import selectinload
 from sqlmodel import func, select
 
-from app.api.deps import CurrentUser, SessionDep
+from app.api.deps import (
+    AsyncCurrentUser,
+    AsyncReadSessionDep,
+    AsyncSessionDep,
+    CurrentUser,
+    ReadSessionDep,
+    RunDep,
+    SessionDep,
+)
+from app.api.routes.files import archive_response
+from app.archive import ArchiveFormat
 from app.core.file_types import FileTypeEnum
+from app.core.security import create_run_download_token, revoke_download_tokens
+from app.housekeeping import delete_files_deferred
 from app.models import (
     File,
     Message,
     Param,
     Run,
+    RunListItem,
     RunPublic,
+    RunsListPublic,
     RunsPublicMinimal,
     RunStatus,
     Tool,
+    ToolListItem,
+    User,
 )
-from app.tasks import run_tool
+from app.pagination import next_cursor, page_query
+from app.tasks import reclaim_storage, run_tool
 from app.utils import escape, flatten
 from app.wsmanager import manager
 
@@ -38,6 +57,12 @@ RUN_SORT_COLUMNS = {
     "status": Run.status,
 }
 
+# Everything RunPublic serializes, async sessions cannot load it lazily
+RUN_PUBLIC_OPTIONS = (
+    selectinload(Run.tool),
+    selectinload(Run.files).selectinload(File.children),
+)
+
 
 def is_missing_param_value(value: Any) -> bool:
     return (
@@ -47,21 +72,28 @@ def is_missing_param_value(value: Any) -> bool:
     )
 
 
-@router.get("/", response_model=RunsPublicMinimal)
-def read_runs(
-    session: SessionDep,
-    current_user: CurrentUser,
-    skip: int = 0,
-    limit: int = 100,
-    order_by: str = Query("-created_at", pattern=r"^-?[a-zA-Z_]+$"),
-    name: str | None = Query(None, min_length=1, max_length=255),
-    tool_name: str | None = Query(None, min_length=1, max_length=255),
-    statuses: list[RunStatus] = Query(None),
-) -> Any:
+def delete_run_rows(session: SessionDep, run_ids: list[uuid.UUID]) -> list[uuid.UUID]:
     """
-    Retrieve runs with optional ordering.
+    Delete runs with bulk statements. Saved outputs are detached and kept,
+    unsaved outputs are deleted and queued for the storage reclaimer.
+    Returns the ids of the deleted files; the caller commits.
     """
-
+    session.execute(
+        update(File).where(File.run_id.in_(run_ids), File.saved).values(run_id=None)
+    )
+    deleted_file_ids = delete_files_deferred(session, File.run_id.in_(run_ids))
+    session.execute(delete(Run).where(Run.id.in_(run_ids)))
+    return deleted_file_ids
+
+
+def run_listing_filter(
+    current_user: User,
+    order_by: str,
+    name: str | None,
+    tool_name: str | None,
+    statuses: list[RunStatus] | None,
+) -> tuple[ColumnElement[bool], ColumnElement[Any]]:
+    """The WHERE clause and sort column of a run listing."""
     # Parse the order_by string to determine the column and direction
     descending = order_by.startswith('-')
     column_name = order_by[1:] if descending else order_by
@@ -70,7 +102,6 @@ def read_runs(
     column = RUN_SORT_COLUMNS.get(column_name)
     if column is None:
         raise HTTPException(status_code=400, detail=f"Invalid column name: {column_name}")
-    order_expression = desc(column) if descending else column
 
     # Build the query based on user role
     base_where = Run.owner_id == current_user.id
@@ -80,21 +111,92 @@ def read_runs(
         base_where = and_(base_where, Run.tool.has(Tool.name == tool_name))
     if statuses:
         base_where = and_(base_where, Run.status.in_(statuses))
-    query_base = select(Run).where(base_where)
+    return base_where, column
+
+
+@router.get("/", response_model=RunsPublicMinimal)
+async def read_runs(
+    session: AsyncReadSessionDep,
+    current_user: AsyncCurrentUser,
+    skip: int = 0,
+    limit: int = 100,
+    order_by: str = Query("-created_at", pattern=r"^-?[a-zA-Z_]+$"),
+    name: str | None = Query(None, min_length=1, max_length=255),
+    tool_name: str | None = Query(None, min_length=1, max_length=255),
+    statuses: list[RunStatus] = Query(None),
+    cursor: str | None = None,
+    include_count: bool = True,
+) -> Any:
+    """
+    Retrieve runs with optional ordering. Pass the `next_cursor` of a page as
+    `cursor` to get the next one without an offset; `skip` is then ignored.
+    Without `include_count` the total is not counted and `count` is null.
+    """
+    base_where, column = run_listing_filter(current_user, order_by, name, tool_name, statuses)
+    # The sort value is selected for the cursor of the next page
+    query_base = select(Run, column).where(base_where)
 
     # Apply ordering, pagination and execute
-    runs_query = query_base.order_by(order_expression).offset(skip).limit(limit)
-    runs = session.exec(runs_query).all()
+    runs_query = page_query(query_base, column, Run.id, order_by, skip, limit, cursor).options(selectinload(Run.tool))
+    rows = (await session.exec(runs_query)).all()
 
     # Counting for pagination
-    count_query = select(func.count()).select_from(Run).where(base_where)
-    count = session.exec(count_query).one()
+    count = None
+    if include_count:
+        count_query = select(func.count()).select_from(Run).where(base_where)
+        count = (await session.exec(count_query)).one()
 
-    return RunsPublicMinimal(data=runs, count=count)
+    return RunsPublicMinimal(
+        data=[run for run, _ in rows], count=count, next_cursor=next_cursor(rows, order_by, limit)
+    )
+
+
+# Columns of the lean listing, never stdout, command or the tool definition
+RUN_LIST_COLUMNS = [getattr(Run, name) for name in RunListItem.model_fields]
+TOOL_LIST_COLUMNS = [getattr(Tool, name) for name in ToolListItem.model_fields]
+
+
+@router.get("/list", response_model=RunsListPublic)
+async def read_runs_list(
+    session: AsyncReadSessionDep,
+    current_user: AsyncCurrentUser,
+    skip: int = 0,
+    limit: int = 100,
+    order_by: str = Query("-created_at", pattern=r"^-?[a-zA-Z_]+$"),
+    name: str | None = Query(None, min_length=1, max_length=255),
+    tool_name: str | None = Query(None, min_length=1, max_length=255),
+    statuses: list[RunStatus] = Query(None),
+    cursor: str | None = None,
+    include_count: bool = True,
+) -> Any:
+    """
+    Retrieve runs like `GET /runs/` but only with the columns a listing shows.
+    Each run refers to its tool by `tool_id`, the tools are in `tools` once.
+    """
+    base_where, column = run_listing_filter(current_user, order_by, name, tool_name, statuses)
+    query_base = select(*RUN_LIST_COLUMNS, column.label("sort_value")).where(base_where)
+    runs_query = page_query(query_base, column, Run.id, order_by, skip, limit, cursor)
+    rows = (await session.exec(runs_query)).all()
+    runs = [RunListItem.model_validate(row._mapping) for row in rows]
+
+    tools = {}
+    tool_ids = {run.tool_id for run in runs}
+    if tool_ids:
+        tools_query = select(*TOOL_LIST_COLUMNS).where(Tool.id.in_(tool_ids))
+        for row in (await session.exec(tools_query)).all():
+            tools[row.id] = ToolListItem.model_validate(row._mapping)
+
+    count = None
+    if include_count:
+        count_query = select(func.count()).select_from(Run).where(base_where)
+        count = (await session.exec(count_query)).one()
+
+    page = [(run, row.sort_value) for run, row in zip(runs, rows, strict=True)]
+    return RunsListPublic(data=runs, tools=tools, count=count, next_cursor=next_cursor(page, order_by, limit))
 
 
 @router.get("/tools", response_model=list[str])
-def read_run_tool_names(session: SessionDep, current_user: CurrentUser) -> Any:
+def read_run_tool_names(session: ReadSessionDep, current_user: CurrentUser) -> Any:
     """
     Retrieve distinct tool names used by the current user's runs.
     """
@@ -110,7 +212,7 @@ def read_run_tool_names(session: SessionDep, current_user: CurrentUser) -> Any:
 
 @router.post("/", response_model=RunPublic)
 async def create_run(
-    *, session: SessionDep, current_user: CurrentUser, tool_id: uuid.UUID, params: dict, tags: list[str] = None, email_on_completion: bool = False, name: str = None
+    *, session: AsyncSessionDep, current_user: AsyncCurrentUser, tool_id: uuid.UUID, params: dict, tags: list[str] = None, email_on_completion: bool = False, name: str = None
 ) -> Any:
     """
     Create and run a run of a specific tool, validating against predefined tool parameters.
@@ -120,7 +222,7 @@ async def create_run(
     # Fetch tool and parameters
     if tags is None:
         tags = []
-    tool: Tool = session.get(Tool, tool_id)
+    tool: Tool = await session.get(Tool, tool_id)
     if not tool:
         raise HTTPException(status_code=404, detail="Tool not found")
     if not current_user.is_superuser and not tool.enabled:
@@ -133,7 +235,7 @@ async def create_run(
         .where(Run.owner_id == current_user.id)
         .where(Run.status.in_(["pending", "running"]))
     )
-    count = session.exec(count_statement).one()
+    count = (await session.exec(count_statement)).one()
     print(f"User {current_user.id} has {count} active runs")
     if count >= current_user.max_runs:
         raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="You have reached the maximum number of active Runs. Please wait for some to finish!")
@@ -161,14 +263,19 @@ async def create_run(
                     status_code=400, detail=f"For parameter `{param.name}`, expected list with a single file, got {len(file_ids)}"
                 )
             file_names = []
+            parsed_ids = []
             for file_id in file_ids:
                 try:
-                    file_id = uuid.UUID(file_id)
+                    parsed_ids.append(uuid.UUID(file_id))
                 except ValueError:
                     raise HTTPException(
                         status_code=400, detail=f"Invalid file ID: {file_id}"
                     )
-                file = session.get(File, file_id)
+            # All files of the parameter and their children in two queries
+            files_statement = select(File).where(File.id.in_(parsed_ids)).options(selectinload(File.children))
+            files_by_id = {file.id: file for file in (await session.exec(files_statement)).all()}
+            for file_id in parsed_ids:
+                file = files_by_id.get(file_id)
                 if not file:
                     raise HTTPException(
                         status_code=404, detail=f"File not found: {file_id}"
@@ -268,8 +375,8 @@ async def create_run(
         tags=tags,
     )
     session.add(run)
-    session.commit()
-    session.refresh(run)
+    await session.commit()
+    await session.refresh(run)
 
     # run the command
     taskiq_task = await run_tool.kiq(run.id, cmd)
@@ -277,12 +384,12 @@ async def create_run(
     run.taskiq_id = taskiq_task.task_id
     run.email_on_completion = email_on_completion
     session.add(run)
-    session.commit()
-    session.refresh(run)
+    await session.commit()
+    await session.refresh(run, ["tool", "files"])
 
     tool.run_count += 1
     session.add(tool)
-    session.commit()
+    await session.commit()
 
     await manager.broadcast(json.dumps({
         "toolname": tool.name,
@@ -315,6 +422,7 @@ def cancel_runs(session: SessionDep, current_user: CurrentUser) -> Any:
 def delete_runs(
     session: SessionDep,
     current_user: CurrentUser,
+    background_tasks: BackgroundTasks,
     name: str | None = Query(None, min_length=1, max_length=255),
     tool_name: str | None = Query(None, min_length=1, max_length=255),
 ) -> Any:
@@ -329,48 +437,24 @@ def delete_runs(
     if tool_name:
         base_where = and_(base_where, Run.tool.has(Tool.name == tool_name))
 
-    statement = select(Run).where(base_where)
-    runs: list[Run] = session.exec(statement).all()
+    run_ids = session.exec(select(Run.id).where(base_where)).all()
 
-    if not runs:
+    if not run_ids:
         return Message(message="No inactive runs to delete.", status_code=204)
 
-    # Collect IDs of runs to delete
-    run_ids = [run.id for run in runs]
-
-    # Query associated files
-    files_to_preserve = session.query(File).filter(File.run_id.in_(run_ids), File.saved).all()
-    files_to_delete = session.query(File).filter(File.run_id.in_(run_ids), ~File.saved).all()
-
-    # Detach preserved files
-    for file in files_to_preserve:
-        file.run_id = None
-
-    # Delete unsaved files
-    for file in files_to_delete:
-        session.delete(file)
-
-    # Delete the runs
-    session.query(Run).filter(Run.id.in_(run_ids)).delete(synchronize_session="fetch")
-
+    deleted_file_ids = delete_run_rows(session, run_ids)
     session.commit()
+    revoke_download_tokens(deleted_file_ids)
+    background_tasks.add_task(reclaim_storage.kiq)
 
-    # Remove files from the filesystem
-    deleted_files_count = 0
-    for file in files_to_delete:
-        file_path = Path(file.location)
-        if file_path.exists():
-            file_path.unlink()
-            deleted_files_count += 1
-
-    return Message(message=f"Deleted {len(runs)} runs and {deleted_files_count} files.")
+    return Message(message=f"Deleted {len(run_ids)} runs and {len(deleted_file_ids)} files.")
 
 
 
 
 @router.get("/active", response_model=RunsPublicMinimal)
-def read_active_runs(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+async def read_active_runs(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser, skip: int = 0, limit: int = 100
 ) -> Any:
     """
     Retrieve active runs with status pending or running.
@@ -381,24 +465,25 @@ def read_active_runs(
         .where(Run.owner_id == current_user.id)
         .where(Run.status.in_(["pending", "running"]))
     )
-    count = session.exec(count_statement).one()
+    count = (await session.exec(count_statement)).one()
     statement = (
         select(Run)
         .where(Run.owner_id == current_user.id)
         .where(Run.status.in_(["pending", "running"]))
         .offset(skip)
         .limit(limit)
+        .options(selectinload(Run.tool))
     )
-    runs = session.exec(statement).all()
+    runs = (await session.exec(statement)).all()
 
     return RunsPublicMinimal(data=runs, count=count)
 
 @router.get("/{id}", response_model=RunPublic)
-def read_run(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) -> Any:
+async def read_run(session: AsyncSessionDep, current_user: AsyncCurrentUser, id: uuid.UUID) -> Any:
     """
     Retrieve run metadata.
     """
-    run: Run = session.get(Run, id)
+    run: Run = await session.get(Run, id, options=RUN_PUBLIC_OPTIONS)
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
     if run.owner_id != current_user.id and not run.shared:
@@ -407,10 +492,59 @@ def read_run(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) -> A
     # Convert to RunPublic and add owner name if shared
     run_data = RunPublic.model_validate(run)
     if run.shared and run.owner_id != current_user.id:
-        run_data.owner_name = run.owner.full_name
+        owner = await session.get(User, run.owner_id)
+        run_data.owner_name = owner.full_name
 
     return run_data
 
+def run_archive_name(run: Run) -> str:
+    return f"{run.tool.name}-{run.name}" if run.name else f"{run.tool.name}-{run.id}"
+
+
+@router.get("/{id}/download")
+def download_run_outputs(
+    session: SessionDep,
+    current_user: CurrentUser,
+    id: uuid.UUID,
+    archive_format: ArchiveFormat = ArchiveFormat.zip,
+) -> Any:
+    """
+    Download all run outputs as a single zip or tar archive.
+    """
+    run = session.get(Run, id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if run.owner_id != current_user.id and not run.shared:
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+    if not run.files:
+        raise HTTPException(status_code=404, detail="Run has no output files")
+    return archive_response(run_archive_name(run), run.files, archive_format)
+
+
+@router.get("/{id}/token", response_model=str)
+def get_run_download_token(session: SessionDep, current_user: CurrentUser, id: uuid.UUID, minutes: int = 1) -> Any:
+    """
+    Get signed run outputs download token.
+    """
+    run = session.get(Run, id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if run.owner_id != current_user.id and not run.shared:
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+    access_token_expires = timedelta(minutes=minutes if minutes > 0 and minutes <= 60 * 24 else 1)
+    return create_run_download_token(run.id, expires_delta=access_token_expires)
+
+
+@router.get("/download/{token}")
+def download_run_outputs_with_token(run: RunDep, archive_format: ArchiveFormat = ArchiveFormat.zip) -> Any:
+    """
+    Download all run outputs by token as a single zip or tar archive.
+    """
+    if not run.files:
+        raise HTTPException(status_code=404, detail="Run has no output files")
+    return archive_response(run_archive_name(run), run.files, archive_format)
+
+
 @router.patch("/{id}/cancel", response_model=RunPublic)
 def cancel_run(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) -> Any:
     """
@@ -453,7 +587,12 @@ def rename_run(
     return run
 
 @router.delete("/{id}", response_model=Message)
-def delete_run(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) -> Any:
+def delete_run(
+    session: SessionDep,
+    current_user: CurrentUser,
+    background_tasks: BackgroundTasks,
+    id: uuid.UUID,
+) -> Any:
     """
     Delete a specific run by ID.
     """
@@ -469,35 +608,13 @@ def delete_run(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) ->
     # Check if the run is active
     if run.status in ["running", "pending"]:
         raise HTTPException(status_code=400, detail="Run is active and cannot be deleted")
-    # Separate files into those to preserve and those to delete
-
-    files_to_preserve = []
-    files_to_delete = []
-
-    if run.files:
-        for file in run.files:
-            if file.saved:
-                files_to_preserve.append(file)
-                file.run_id = None  # Detach preserved files
-            else:
-                files_to_delete.append(file)
-
-    # Delete the run and unsaved files
-    session.delete(run)
-    for file in files_to_delete:
-        session.delete(file)
 
+    deleted_file_ids = delete_run_rows(session, [id])
     session.commit()
+    revoke_download_tokens(deleted_file_ids)
+    background_tasks.add_task(reclaim_storage.kiq)
 
-    # Delete unsaved files from the filesystem
-    deleted_files_count = 0
-    for file in files_to_delete:
-        file_path = Path(file.location)
-        if file_path.exists():
-            file_path.unlink()
-            deleted_files_count += 1
-
-    return Message(message=f"Deleted run {id} and {deleted_files_count} files")
+    return Message(message=f"Deleted run {id} and {len(deleted_file_ids)} files")
 
 @router.patch("/{id}/share", response_model=RunPublic)
 def toggle_run_sharing(
@@ -1,12 +1,23 @@
 from datetime import datetime, timedelta
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import Session, and_, func, select
 from typing_extensions import TypedDict
 
-from app.api.deps import CurrentUser, get_db
-from app.models import File, Run, RunStatus, Tool, User
+from app.api.deps import CurrentUser, get_read_db
+from app.core.config import settings
+from app.core.db import pool_engines
+from app.input_cache import read_cache_stats
+from app.models import (
+    File,
+    PendingDeletion,
+    ReclaimedStorage,
+    Run,
+    RunStatus,
+    Tool,
+    User,
+)
 
 router = APIRouter()
 
@@ -26,10 +37,14 @@ class FileStats(TypedDict):
     total_size_bytes: int
     saved_size_bytes: int
     temporary_size_bytes: int
+    stored_size_bytes: int
     average_size_bytes: int
     total_size_gb: float
     saved_size_gb: float
     by_type: dict[str, int]
+    pending_deletion: int
+    pending_deletion_bytes: int
+    pending_deletion_failed: int
 
 
 class RunStats(TypedDict):
@@ -78,6 +93,33 @@ class SummaryFileStats(TypedDict):
     total_size_gb: float
 
 
+class ReclaimedStorageDay(TypedDict):
+    day: str
+    reclaimed_files: int
+    reclaimed_bytes: int
+    expired_files: int
+    expired_bytes: int
+
+
+class InputCacheNodeStats(TypedDict):
+    node: str
+    hits: int
+    misses: int
+    hit_rate_percent: float
+    fetched_bytes: int
+    evicted_bytes: int
+
+
+class DbPoolStats(TypedDict):
+    engine: str
+    size: int
+    max_overflow: int
+    checked_out: int
+    checked_in: int
+    overflow: int
+    utilisation_percent: float
+
+
 class StatsResponse(TypedDict):
     users: SummaryUserStats
     tools: SummaryToolStats
@@ -87,7 +129,7 @@ class StatsResponse(TypedDict):
 
 @router.get("/stats")
 def get_system_stats(
-    session: Session = Depends(get_db),
+    session: Session = Depends(get_read_db),
     current_user: CurrentUser = None
 ) -> SystemStats:
     """
@@ -165,6 +207,11 @@ def _get_file_stats(session: Session) -> FileStats:
         select(func.sum(File.size)).select_from(File).where(File.saved)
     ).one() or 0
 
+    # Size on disk, smaller than the total once cold files are compacted
+    stored_size = session.exec(
+        select(func.sum(func.coalesce(File.stored_size, File.size))).select_from(File)
+    ).one() or 0
+
     # Average file size
     avg_size = total_size / total_files if total_files > 0 else 0
 
@@ -178,6 +225,16 @@ def _get_file_stats(session: Session) -> FileStats:
     file_types_result = session.exec(file_types_query).all()
     file_types = dict(file_types_result)
 
+    # Deleted files whose content has not been reclaimed yet
+    pending_deletion, pending_deletion_size = session.exec(
+        select(func.count(), func.coalesce(func.sum(PendingDeletion.size), 0))
+        .select_from(PendingDeletion)
+    ).one()
+    pending_deletion_failed = session.exec(
+        select(func.count()).select_from(PendingDeletion)
+        .where(PendingDeletion.attempts >= settings.STORAGE_RECLAIM_MAX_ATTEMPTS)
+    ).one()
+
     return {
         "files": {
             "total": total_files,
@@ -186,10 +243,14 @@ def _get_file_stats(session: Session) -> FileStats:
             "total_size_bytes": total_size,
             "saved_size_bytes": saved_size,
             "temporary_size_bytes": total_size - saved_size,
+            "stored_size_bytes": stored_size,
             "average_size_bytes": int(avg_size),
             "total_size_gb": round(total_size / (1024**3), 2),
             "saved_size_gb": round(saved_size / (1024**3), 2),
             "by_type": file_types,
+            "pending_deletion": pending_deletion,
+            "pending_deletion_bytes": pending_deletion_size,
+            "pending_deletion_failed": pending_deletion_failed,
         }
     }
 
@@ -298,9 +359,116 @@ def _get_tool_stats(session: Session) -> ToolStats:
     }
 
 
+@router.get("/stats/storage")
+def get_storage_stats(
+    session: Session = Depends(get_read_db),
+    current_user: CurrentUser = None,
+    days: int = Query(30, ge=1, le=365),
+) -> list[ReclaimedStorageDay]:
+    """
+    Get storage reclaimed per day over the last `days` days for admin panel.
+
+    Reclaimed counts include all deletions, expired counts only the unsaved
+    run outputs removed by the retention policy.
+    Requires superuser privileges.
+    """
+
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Superuser access required")
+
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    rows = session.exec(
+        select(ReclaimedStorage)
+        .where(ReclaimedStorage.day >= since)
+        .order_by(ReclaimedStorage.day)
+    ).all()
+
+    return [
+        {
+            "day": row.day.isoformat(),
+            "reclaimed_files": row.reclaimed_files,
+            "reclaimed_bytes": row.reclaimed_bytes,
+            "expired_files": row.expired_files,
+            "expired_bytes": row.expired_bytes,
+        }
+        for row in rows
+    ]
+
+
+@router.get("/stats/input-cache")
+def get_input_cache_stats(
+    current_user: CurrentUser = None,
+) -> list[InputCacheNodeStats]:
+    """
+    Get hit rates of the worker input caches, per worker node.
+
+    Requires superuser privileges.
+    """
+
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Superuser access required")
+
+    nodes = []
+    for node, stats in sorted(read_cache_stats().items()):
+        lookups = stats.hits + stats.misses
+        nodes.append(
+            {
+                "node": node,
+                "hits": stats.hits,
+                "misses": stats.misses,
+                "hit_rate_percent": round(stats.hits / lookups * 100, 2) if lookups else 0.0,
+                "fetched_bytes": stats.fetched_bytes,
+                "evicted_bytes": stats.evicted_bytes,
+            }
+        )
+    return nodes
+
+
+@router.get("/stats/db-pool")
+def get_db_pool_stats(
+    current_user: CurrentUser = None,
+) -> list[DbPoolStats]:
+    """
+    Get connection pool utilisation of the API process serving the request.
+
+    Utilisation is the share of the pool, overflow included, checked out.
+    Requires superuser privileges.
+    """
+
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Superuser access required")
+
+    pools = []
+    for name, engine in pool_engines().items():
+        pool = engine.pool
+        capacity = pool.size() + settings.POSTGRES_MAX_OVERFLOW
+        pools.append(
+            {
+                "engine": name,
+                "size": pool.size(),
+                "max_overflow": settings.POSTGRES_MAX_OVERFLOW,
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                # Negative while the pool has not filled up yet
+                "overflow": max(pool.overflow(), 0),
+                "utilisation_percent": round(pool.checkedout() / capacity * 100, 2) if capacity else 0.0,
+            }
+        )
+    return pools
+
+
 @router.get("/stats/summary")
 def get_stats_summary(
-    session: Session = Depends(get_db),
+    session: Session = Depends(get_read_db),
     current_user: CurrentUser = None,
 ) -> StatsResponse:
     """
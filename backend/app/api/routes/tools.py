@@ -1,5 +1,6 @@
 import uuid
 from enum import StrEnum
+from pathlib import Path
 from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException
@@ -7,13 +8,20 @@ from sqlalchemy import or_
 from sqlmodel import func, select
 
 from app.api.deps import (
+    AsyncCurrentUserOrAnonymous,
+    AsyncReadSessionDep,
+    AsyncSessionDep,
     CurrentUser,
-    CurrentUserOrAnonymous,
     SessionDep,
     SuperUser,
     get_current_active_superuser,
 )
+from app.conda import conda_env_key, conda_env_path
+from app.core.config import settings
 from app.models import (
+    CondaEnvHealth,
+    CondaEnvironmentPublic,
+    CondaEnvironmentsPublic,
     Message,
     Tool,
     ToolCreate,
@@ -34,9 +42,9 @@ class ToolsOrderBy(StrEnum):
 
 
 @router.get("/", response_model=ToolsPublic)
-def read_tools(
-    session: SessionDep,
-    current_user: CurrentUserOrAnonymous,
+async def read_tools(
+    session: AsyncReadSessionDep,
+    current_user: AsyncCurrentUserOrAnonymous,
     skip: int = 0,
     limit: int = 100,
     order_by: ToolsOrderBy = ToolsOrderBy.run_count,
@@ -49,9 +57,9 @@ def read_tools(
     if current_user is None:
         # If the user is anonymous, we don't need to join with UserFavouriteToolsLink
         query = select(Tool).order_by(getattr(Tool, order_by).desc()).offset(skip).limit(limit).where((Tool.enabled) & (Tool.status == "installed"))
-        result = session.exec(query).all()
+        result = (await session.exec(query)).all()
         count_query = select(func.count()).select_from(Tool)
-        count = session.exec(count_query).one()
+        count = (await session.exec(count_query)).one()
         return ToolsPublic(data=result, count=count)
     # Build the query
     query = (
@@ -89,7 +97,7 @@ def read_tools(
             )
         )
     # Execute the query
-    result = session.exec(query).all()
+    result = (await session.exec(query)).all()
 
     # Process results
     tools_with_favourite_status = []
@@ -103,13 +111,13 @@ def read_tools(
     count_query = select(func.count()).select_from(Tool)
     if not current_user.is_superuser:
         count_query = count_query.where(Tool.enabled)
-    count = session.exec(count_query).one()
+    count = (await session.exec(count_query)).one()
 
     return ToolsPublic(data=tools_with_favourite_status, count=count)
 
 
-def read_tool_with_favourite(
-    session: SessionDep, current_user: CurrentUserOrAnonymous, *, tool_id: uuid.UUID | None = None, name: str | None = None
+async def read_tool_with_favourite(
+    session: AsyncSessionDep, current_user: AsyncCurrentUserOrAnonymous, *, tool_id: uuid.UUID | None = None, name: str | None = None
 ) -> select:
 
     """
@@ -124,7 +132,7 @@ def read_tool_with_favourite(
             query = query.where(Tool.id == tool_id)
         elif name:
             query = query.where(func.lower(Tool.name) == name.lower())
-        return session.exec(query).first()
+        return (await session.exec(query)).first()
     query = (
         select(
             Tool,
@@ -145,7 +153,7 @@ def read_tool_with_favourite(
     # Apply enabled filter for non-superusers
     if not current_user.is_superuser:
         query = query.where((Tool.enabled) & (Tool.status == "installed"))
-    result = session.exec(query).first()
+    result = (await session.exec(query)).first()
     if not result:
         raise HTTPException(status_code=404, detail="Tool not found")
     tool, favourited_tool_id = result
@@ -156,27 +164,61 @@ def read_tool_with_favourite(
     return tool_public
 
 
+@router.get("/environments", dependencies=[Depends(get_current_active_superuser)], response_model=CondaEnvironmentsPublic)
+def read_environments(session: SessionDep) -> Any:
+    """
+    Conda environments of installed tools with their disk usage and health.
+    """
+    tools = session.exec(
+        select(Tool.id, Tool.name, Tool.conda_env_hash, Tool.conda_env)
+        .where(Tool.status == "installed")
+        .order_by(Tool.name)
+    ).all()
+    environments: dict[str, CondaEnvironmentPublic] = {}
+    for tool_id, name, env_hash, conda_env in tools:
+        if not conda_env:
+            continue
+        env_key = conda_env_key(tool_id, env_hash)
+        if env_key not in environments:
+            environments[env_key] = CondaEnvironmentPublic(
+                env_key=env_key,
+                path=str(conda_env_path(Path(settings.CONDA_PATH), tool_id, env_hash)),
+                tool_ids=[],
+                tool_names=[],
+            )
+        environments[env_key].tool_ids.append(tool_id)
+        environments[env_key].tool_names.append(name)
+    health_records = session.exec(
+        select(CondaEnvHealth).where(CondaEnvHealth.env_key.in_(list(environments)))
+    ).all()
+    for health in health_records:
+        environments[health.env_key].sqlmodel_update(
+            health.model_dump(include={"size", "healthy", "error", "verified_at"})
+        )
+    return CondaEnvironmentsPublic(data=list(environments.values()), count=len(environments))
+
+
 @router.get("/name/{tool_name}", response_model=ToolPublic)
-def read_tool_by_name(
-    *, session: SessionDep, current_user: CurrentUserOrAnonymous, tool_name: str
+async def read_tool_by_name(
+    *, session: AsyncSessionDep, current_user: AsyncCurrentUserOrAnonymous, tool_name: str
 ) -> Any:
     """
     Retrieve tool by name.
     """
     # Query the tool by name
-    tool_public = read_tool_with_favourite(session, current_user, name=tool_name)
+    tool_public = await read_tool_with_favourite(session, current_user, name=tool_name)
     return tool_public
 
 
 @router.get("/{tool_id}", response_model=ToolPublic)
-def read_tool(
-    *, session: SessionDep, current_user: CurrentUserOrAnonymous, tool_id: uuid.UUID
+async def read_tool(
+    *, session: AsyncSessionDep, current_user: AsyncCurrentUserOrAnonymous, tool_id: uuid.UUID
 ) -> Any:
     """
     Retrieve tool by ID with favourited status.
     """
     # Query to retrieve the tool along with the favourited status
-    tool_public = read_tool_with_favourite(session, current_user, tool_id=tool_id)
+    tool_public = await read_tool_with_favourite(session, current_user, tool_id=tool_id)
     return tool_public
 
 
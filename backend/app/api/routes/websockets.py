@@ -1,16 +1,15 @@
 import uuid
-from typing import Annotated
 
 from fastapi import (
     APIRouter,
-    Depends,
     WebSocket,
     WebSocketDisconnect,
     WebSocketException,
+    status,
 )
 
-from app.api.deps import SessionDep, get_current_user_from_query
-from app.models import Run, User
+from app.api.deps import AsyncSessionDep, QueryUser
+from app.models import Run, Tool
 from app.wsmanager import manager
 
 router = APIRouter()
@@ -30,12 +29,14 @@ async def stream(websocket: WebSocket):
 
 
 @router.websocket("/logs/{run_id}")
-async def logs(websocket: WebSocket, run_id: uuid.UUID, session: SessionDep, current_user: Annotated[User, Depends(get_current_user_from_query)]):
-    run: Run = session.get(Run, run_id)
+async def logs(websocket: WebSocket, run_id: uuid.UUID, session: AsyncSessionDep, current_user: QueryUser):
+    run: Run = await session.get(Run, run_id)
     if run is None:
         raise WebSocketException("Run not found")
     if run.owner_id != current_user.id:
         raise WebSocketException("Unauthorized access")
+    # Return the connection to the pool for the lifetime of the socket
+    await session.close()
 
     # Accept the websocket connection
     await manager.connect(websocket, str(run_id))
@@ -45,3 +46,22 @@ async def logs(websocket: WebSocket, run_id: uuid.UUID, session: SessionDep, cur
             await websocket.receive_text()
     except WebSocketDisconnect:
         manager.disconnect(websocket, str(run_id))
+
+
+@router.websocket("/install-logs/{tool_id}")
+async def install_logs(websocket: WebSocket, tool_id: uuid.UUID, session: AsyncSessionDep, current_user: QueryUser):
+    """
+    Output of a tool install as it happens
+    """
+    if not current_user.is_superuser:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Unauthorized access")
+    if await session.get(Tool, tool_id) is None:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Tool not found")
+    await session.close()
+
+    await manager.connect(websocket, f"install-{tool_id}")
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        manager.disconnect(websocket, f"install-{tool_id}")
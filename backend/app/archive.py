@@ -0,0 +1,159 @@
+import io
+import os
+import tarfile
+import zipfile
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from datetime import datetime
+from enum import StrEnum
+from pathlib import Path, PurePath
+from urllib.parse import quote
+
+from app.compaction import open_stored
+
+# Read files in 1MB chunks so memory use is independent of archive size
+CHUNK_SIZE = 1024 * 1024
+
+
+class ArchiveFormat(StrEnum):
+    zip = "zip"
+    tar = "tar"
+
+
+ARCHIVE_MEDIA_TYPES = {
+    ArchiveFormat.zip: "application/zip",
+    ArchiveFormat.tar: "application/x-tar",
+}
+
+
+@dataclass
+class ArchiveEntry:
+    name: str
+    path: str | Path
+    modified_at: datetime
+    compressed: bool = False  # already compressed content is stored, not deflated
+    compression: str | None = None  # transparent storage compression, see app.compaction
+    size: int | None = None  # logical size of compressed or remote entries, measured if unset
+
+
+class _ChunkWriter(io.RawIOBase):
+    """Unseekable sink that collects written bytes until they are drained."""
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def unique_archive_names(names: Iterable[str]) -> list[str]:
+    """
+    Make archive member names unique by appending a counter to duplicates,
+    e.g. reads.fastq.gz, reads (1).fastq.gz
+    """
+    seen: set[str] = set()
+    unique = []
+    for name in names:
+        candidate = name
+        counter = 1
+        while candidate in seen:
+            path = PurePath(name)
+            suffixes = "".join(path.suffixes)
+            stem = path.name.removesuffix(suffixes) if suffixes else path.name
+            candidate = f"{stem} ({counter}){suffixes}"
+            counter += 1
+        seen.add(candidate)
+        unique.append(candidate)
+    return unique
+
+
+def _read_chunks(f) -> Iterator[bytes]:
+    while chunk := f.read(CHUNK_SIZE):
+        yield chunk
+
+
+def _entry_size(entry: ArchiveEntry, src) -> int:
+    if entry.compression is None:
+        try:
+            return os.fstat(src.fileno()).st_size
+        except io.UnsupportedOperation:
+            # Not a local file, e.g. streamed from object storage
+            pass
+    if entry.size is not None:
+        return entry.size
+    # Rows without a recorded size are measured with an extra pass, tar
+    # headers and the zip64 decision need the size before the content
+    with open_stored(entry.path, entry.compression) as f:
+        return sum(len(chunk) for chunk in _read_chunks(f))
+
+
+def stream_zip(entries: list[ArchiveEntry]) -> Iterator[bytes]:
+    """
+    Stream a zip archive of the entries without buffering it on disk or in memory.
+    Sizes and CRCs are written in data descriptors after each member.
+    """
+    sink = _ChunkWriter()
+    with zipfile.ZipFile(sink, mode="w", allowZip64=True) as archive:
+        for entry in entries:
+            with open_stored(entry.path, entry.compression) as src:
+                info = zipfile.ZipInfo(entry.name, date_time=entry.modified_at.timetuple()[:6])
+                info.compress_type = zipfile.ZIP_STORED if entry.compressed else zipfile.ZIP_DEFLATED
+                info.file_size = _entry_size(entry, src)
+                info.external_attr = 0o644 << 16
+                with archive.open(info, mode="w") as dst:
+                    for chunk in _read_chunks(src):
+                        dst.write(chunk)
+                        if data := sink.drain():
+                            yield data
+            if data := sink.drain():
+                yield data
+    yield sink.drain()
+
+
+def stream_tar(entries: list[ArchiveEntry]) -> Iterator[bytes]:
+    """
+    Stream an uncompressed tar archive of the entries.
+    Headers, content and padding are emitted block by block.
+    """
+    for entry in entries:
+        with open_stored(entry.path, entry.compression) as src:
+            info = tarfile.TarInfo(entry.name)
+            info.size = _entry_size(entry, src)
+            info.mtime = int(entry.modified_at.timestamp())
+            info.mode = 0o644
+            yield info.tobuf(format=tarfile.PAX_FORMAT)
+            written = 0
+            for chunk in _read_chunks(src):
+                chunk = chunk[: info.size - written]
+                written += len(chunk)
+                yield chunk
+                if written >= info.size:
+                    break
+            if written < info.size:
+                raise OSError(f"{entry.path} was truncated while archiving")
+            yield b"\0" * (-info.size % tarfile.BLOCKSIZE)
+    # End of archive marker
+    yield b"\0" * (2 * tarfile.BLOCKSIZE)
+
+
+def stream_archive(entries: list[ArchiveEntry], archive_format: ArchiveFormat) -> Iterator[bytes]:
+    if archive_format == ArchiveFormat.tar:
+        return stream_tar(entries)
+    return stream_zip(entries)
+
+
+def content_disposition(filename: str) -> str:
+    """Build an attachment Content-Disposition header, matching Starlette's FileResponse."""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
@@ -0,0 +1,52 @@
+import shutil
+import uuid
+from collections.abc import Iterator
+from compression import zstd
+from pathlib import Path
+from typing import BinaryIO
+
+from app.storage import storage_for
+
+ZSTD = "zstd"
+
+# Decompress in 1MB chunks so memory use is independent of file size
+CHUNK_SIZE = 1024 * 1024
+
+
+def open_stored(location: str | Path, compression: str | None) -> BinaryIO:
+    """Open stored content for reading, decompressing it transparently."""
+    if compression == ZSTD:
+        return zstd.open(location, "rb")
+    return storage_for(str(location)).open(str(location))
+
+
+def iter_stored(location: str | Path, compression: str | None) -> Iterator[bytes]:
+    with open_stored(location, compression) as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+def compress_file(path: Path, level: int) -> Path:
+    """
+    Write a zstd compressed copy of `path` next to it, under its own storage
+    key, and return the copy. The original is left in place. The key keeps
+    the name after the `{id}_` prefix, as run inputs are staged by that name.
+    """
+    name = path.name.partition("_")[2] or path.name
+    compressed = path.with_name(f"{uuid.uuid4()}_{name}")
+    with open(path, "rb") as src, zstd.open(compressed, "wb", level=level) as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    return compressed
+
+
+def stage_file(location: str | Path, compression: str | None, destination: Path) -> None:
+    """
+    Make stored content available in a run directory. Compressed content is
+    decompressed into a private copy, anything else is staged by its storage
+    backend (symlinked from the shared volume or downloaded from object storage).
+    """
+    if compression is None:
+        storage_for(str(location)).stage(str(location), destination)
+        return
+    with open_stored(location, compression) as src, open(destination, "wb") as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
@@ -1,4 +1,10 @@
 import asyncio
+import hashlib
+import json
+import os
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
 from pathlib import Path
 from tempfile import NamedTemporaryFile
 
@@ -14,6 +20,89 @@ class CondaEnvMangerInstallError(CondaEnvMangerError):
 class CondaEnvMangerRemoveError(CondaEnvMangerError):
     pass
 
+# Called with each line of output as a command produces it
+OutputCallback = Callable[[str], Awaitable[None]]
+
+# Written into an environment once it is fully created, so a half built
+# environment is never shared
+READY_MARKER = ".hive-env-ready"
+
+
+# Environment variables activating the environment sets, captured once so runs
+# can start without sourcing conda's shell hooks
+ACTIVATION_FILE = ".hive-activation.json"
+# Shell bookkeeping that differs between any two shells
+SHELL_VARIABLES = {"_", "SHLVL", "PWD", "OLDPWD"}
+
+
+def _parse_env(output: bytes) -> dict[str, str]:
+    """Parse the NUL separated output of `env -0`."""
+    variables = {}
+    for entry in output.split(b"\0"):
+        name, sep, value = entry.decode().partition("=")
+        if sep:
+            variables[name] = value
+    return variables
+
+
+def shared_env_path(conda_path: Path, env_hash: str) -> Path:
+    """Where the environment shared by every tool with `env_hash` lives."""
+    return conda_path / "envs" / env_hash
+
+
+def conda_env_key(tool_id: uuid.UUID, env_hash: str | None) -> str:
+    """Identifies an environment: its hash, or the tool id for unshared ones."""
+    return env_hash or str(tool_id)
+
+
+def conda_env_path(conda_path: Path, tool_id: uuid.UUID, env_hash: str | None) -> Path:
+    """The shared environment with `env_hash`, or the tool's own without a hash."""
+    return shared_env_path(conda_path, env_hash) if env_hash else conda_path / str(tool_id)
+
+
+@dataclass
+class EnvInspection:
+    size: int = 0
+    checksum: str | None = None
+    error: str | None = None
+
+
+def inspect_env(path: Path) -> EnvInspection:
+    """
+    Disk usage and fingerprint of an environment. The fingerprint covers the
+    package records in conda-meta and the names and sizes of the executables
+    in bin, which are also checked for broken links.
+    """
+    if not (path / "conda-meta").is_dir():
+        return EnvInspection(error=f"{path} is missing or not a conda environment")
+    fingerprint = hashlib.sha256()
+    for record in sorted((path / "conda-meta").glob("*.json")):
+        fingerprint.update(record.name.encode())
+        fingerprint.update(record.read_bytes())
+    broken = []
+    if (path / "bin").is_dir():
+        for entry in sorted(os.scandir(path / "bin"), key=lambda e: e.name):
+            try:
+                stat = os.stat(entry.path)
+            except FileNotFoundError:
+                broken.append(entry.name)
+                continue
+            fingerprint.update(f"{entry.name}\0{stat.st_size}\0".encode())
+    # Packages are often hardlinked from the package cache, count each inode once
+    size, inodes = 0, set()
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            if (stat.st_dev, stat.st_ino) not in inodes:
+                inodes.add((stat.st_dev, stat.st_ino))
+                size += stat.st_size
+    error = f"Broken executables in bin: {', '.join(broken[:10])}" if broken else None
+    return EnvInspection(size=size, checksum=fingerprint.hexdigest(), error=error)
+
+
 class CondaEnvManger:
     """Conda environment"""
 
@@ -28,6 +117,35 @@ class CondaEnvManger:
     def is_created(self):
         return self.path.exists()
 
+    @property
+    def is_ready(self):
+        return (self.path / READY_MARKER).exists()
+
+    @property
+    def env_hash(self) -> str:
+        """
+        Hash identifying the environment this spec builds. Dependency order
+        does not matter to the solver so dependencies are sorted, channel order
+        sets channel priority so it is kept.
+        """
+        env = yaml.safe_load(self.env_yaml_str) or {}
+        dependencies, pip = [], []
+        for dependency in env.get("dependencies") or []:
+            if isinstance(dependency, dict):
+                pip.extend(" ".join(str(p).split()) for p in dependency.get("pip") or [])
+            else:
+                dependencies.append(" ".join(str(dependency).split()))
+        post_install = None
+        if self.post_install_command and self.post_install_command.strip():
+            post_install = self.format_with_version(self.post_install_command).strip()
+        normalised = {
+            "channels": [str(c).strip() for c in env.get("channels") or []],
+            "dependencies": sorted(set(dependencies)),
+            "pip": sorted(set(pip)),
+            "post_install": post_install,
+        }
+        return hashlib.sha256(json.dumps(normalised, sort_keys=True).encode()).hexdigest()
+
     @property
     def env_yaml_str(self) -> str:
         yaml_str = yaml.dump(self.env_dict, default_flow_style=False)
@@ -40,7 +158,7 @@ class CondaEnvManger:
             return s
         return s.replace("{{version}}", self.version).replace("{{ version }}", self.version)
 
-    async def _run_command(self, cmd, cwd=None):
+    async def _run_command(self, cmd, cwd=None, on_output: OutputCallback | None = None):
         proc = await asyncio.create_subprocess_shell(
             cmd,
             cwd=cwd,
@@ -48,30 +166,41 @@ class CondaEnvManger:
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.STDOUT,
             executable="/bin/bash",
+            limit=1024 * 1024,  # Solver progress lines can be long
         )
-        stdout, _ = await proc.communicate()
-        return proc.returncode, stdout.decode().strip()
+        if on_output is None:
+            stdout, _ = await proc.communicate()
+            return proc.returncode, stdout.decode().strip()
+        lines = []
+        while line := await proc.stdout.readline():
+            decoded_line = line.decode().rstrip()
+            lines.append(decoded_line)
+            await on_output(decoded_line)
+        await proc.wait()
+        return proc.returncode, "\n".join(lines).strip()
 
-    async def _run_post_install(self):
+    async def _run_post_install(self, on_output: OutputCallback | None = None):
         command = f"{self.activate_command}; {self.format_with_version(self.post_install_command)}"
-        returncode, stdout = await self._run_command(command, cwd=self.path)
+        returncode, stdout = await self._run_command(command, cwd=self.path, on_output=on_output)
         if returncode != 0:
             raise CondaEnvMangerInstallError(stdout)
         return stdout
 
-    async def create(self):
+    async def create(self, on_output: OutputCallback | None = None):
         with NamedTemporaryFile(suffix=".yaml") as tmp:
             tmp.write(self.env_yaml_str.encode())
             tmp.flush()  # Ensure all data is written before the file is used.
             print(f"Environment file path: {tmp.name}")
             print(f"Environment file content:\n{self.env_yaml_str}")
             command = f"mamba env create --yes --quiet -f {tmp.name} -p {self.path}"
-            returncode, stdout = await self._run_command(command)
+            returncode, stdout = await self._run_command(command, on_output=on_output)
             if returncode != 0:
                 raise CondaEnvMangerInstallError(stdout)
             if self.post_install_command:
+                if on_output is not None:
+                    await on_output("--- POST INSTALL ---")
                 try:
-                    post_instal_stdout = await self._run_post_install()
+                    post_instal_stdout = await self._run_post_install(on_output)
                     post_instal_stdout = f"\n--- POST INSTALL ---\n{post_instal_stdout}"
                     if stdout is not None:
                         stdout += post_instal_stdout
@@ -81,6 +210,7 @@ class CondaEnvManger:
                     print(f"Failed to run post install command: {e}")
                     await self.remove()
                     raise e
+        (self.path / READY_MARKER).touch()
         return stdout
 
     async def remove(self) -> None:
@@ -91,6 +221,55 @@ class CondaEnvManger:
         if returncode != 0:
             raise CondaEnvMangerRemoveError(stdout)
 
+    async def _capture_env(self, cmd: str) -> dict[str, str]:
+        proc = await asyncio.create_subprocess_exec(
+            "/bin/bash", "-c", cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await proc.communicate()
+        if proc.returncode != 0:
+            raise CondaEnvMangerError(stderr.decode().strip())
+        return _parse_env(stdout)
+
+    async def capture_activation(self) -> dict[str, str | None]:
+        """
+        Record the variables activation sets (None for those it unsets) in the
+        environment, relative to the environment of this worker.
+        """
+        before = await self._capture_env("env -0")
+        after = await self._capture_env(f"{self.activate_command} && env -0")
+        activation = {name: value for name, value in after.items() if before.get(name) != value}
+        activation.update({name: None for name in before if name not in after})
+        for name in SHELL_VARIABLES:
+            activation.pop(name, None)
+        tmp = self.path / f"{ACTIVATION_FILE}.{os.getpid()}.tmp"
+        tmp.write_text(json.dumps(activation))
+        tmp.replace(self.path / ACTIVATION_FILE)
+        return activation
+
+    def activation_env(self) -> dict[str, str] | None:
+        """The environment to launch commands in, if activation was captured."""
+        try:
+            activation = json.loads((self.path / ACTIVATION_FILE).read_text())
+        except (OSError, ValueError):
+            return None
+        env = dict(os.environ)
+        for name, value in activation.items():
+            if value is None:
+                env.pop(name, None)
+            else:
+                env[name] = value
+        return env
+
+    async def pack(self, output: Path) -> str:
+        """Archive the environment with conda-pack so it can be unpacked on other nodes."""
+        if not self.is_ready:
+            raise CondaEnvMangerError(f"Conda environment '{self.path}' is not ready")
+        command = f"conda-pack --prefix '{self.path}' --output '{output}' --ignore-editable-packages --force --quiet"
+        returncode, stdout = await self._run_command(command)
+        if returncode != 0:
+            raise CondaEnvMangerError(stdout)
+        return stdout
+
     async def pin(self) -> str:
         if not self.path.exists():
             raise CondaEnvMangerError(f"Conda environment '{self.path}' does not exist")
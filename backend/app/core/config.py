@@ -37,9 +37,63 @@ class Settings(BaseSettings):
     ENVIRONMENT: Literal["local", "staging", "production"] = "local"
 
     STORAGE_PATH: str = "/storage"
+    # Where new file content is written: the local STORAGE_PATH volume or an
+    # S3-compatible object store. Existing content is read from wherever its
+    # location points, so switching backends does not require a migration
+    STORAGE_BACKEND: Literal["local", "s3"] = "local"
+    S3_ENDPOINT_URL: str = "http://localhost:9000"
+    # Endpoint used in presigned download URLs, if clients reach the store
+    # under a different address than the API and workers
+    S3_PUBLIC_ENDPOINT_URL: str | None = None
+    S3_BUCKET: str = "cpg-portal"
+    S3_REGION: str = "us-east-1"
+    S3_ACCESS_KEY_ID: str = ""
+    S3_SECRET_ACCESS_KEY: str = ""
     CONDA_PATH: str = "/conda"
+    # Pack installed environments (conda-pack) into storage so workers that do
+    # not share CONDA_PATH unpack them on first use into CONDA_UNPACK_PATH,
+    # keeping at most CONDA_UNPACK_MAX_BYTES of least recently used ones
+    CONDA_PACK_ENVS: bool = False
+    CONDA_UNPACK_PATH: str | None = None
+    CONDA_UNPACK_MAX_BYTES: int = 100 * 1024 * 1024 * 1024  # 100 GB
     TMP_PATH: str = "/tmp/cpg-portal"
     MAX_FILE_UPLOAD_SIZE: int = 1024 * 1024 * 1024  # 1 GB
+    TARGET_HARVEST_THREADS: int = 8
+    # Threads of each worker for the blocking database calls of its runs
+    WORKER_DB_THREADS: int = 8
+    # Node-local cache of run inputs, keyed by content hash. Useful when
+    # workers read inputs over the network (object storage, remote mounts)
+    INPUT_CACHE_PATH: str | None = None
+    INPUT_CACHE_MAX_BYTES: int = 50 * 1024 * 1024 * 1024  # 50 GB
+    # Let the reverse proxy serve file downloads straight from STORAGE_PATH:
+    # nginx uses X-Accel-Redirect (to an internal location mapped to
+    # DOWNLOAD_OFFLOAD_PREFIX), Apache/lighttpd use X-Sendfile
+    DOWNLOAD_OFFLOAD: Literal["none", "x-accel-redirect", "x-sendfile"] = "none"
+    DOWNLOAD_OFFLOAD_PREFIX: str = "/protected-storage"
+    # Keep a short-lived revocation list in Redis so download tokens stop
+    # working as soon as their file is deleted or renamed
+    DOWNLOAD_TOKEN_REVOCATION: bool = False
+    # Deleted files are unlinked by a background reclaimer in batches;
+    # entries that keep failing are left for inspection after MAX_ATTEMPTS
+    STORAGE_RECLAIM_BATCH_SIZE: int = 500
+    STORAGE_RECLAIM_MAX_ATTEMPTS: int = 5
+    # Daily reconciliation of STORAGE_PATH against the database. Orphaned
+    # content is only reported unless RECLAIM is set; content and run
+    # directories younger than the grace period are never touched
+    STORAGE_RECONCILE_RECLAIM: bool = False
+    STORAGE_RECONCILE_GRACE_HOURS: int = 24
+    STORAGE_RECONCILE_BATCH_SIZE: int = 1000
+    # Unsaved run outputs are deleted this many days after the run finished,
+    # unless the tool sets its own output_retention_days. None keeps them
+    # until the run is deleted
+    UNSAVED_OUTPUT_RETENTION_DAYS: int | None = None
+    # Text files older than this are recompressed with zstd and decompressed
+    # on read. None disables the compactor. Compressed copies are only kept
+    # when they are at most MAX_RATIO of the original size
+    COMPACTION_MIN_AGE_DAYS: int | None = None
+    COMPACTION_MIN_SIZE: int = 1024 * 1024  # 1 MB
+    COMPACTION_MAX_RATIO: float = 0.9
+    COMPACTION_LEVEL: int = 3
 
     @computed_field  # type: ignore[prop-decorator]
     @property
@@ -67,6 +121,19 @@ class Settings(BaseSettings):
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str = ""
     POSTGRES_DB: str = ""
+    # Connection pool of every engine in each process (API and workers):
+    # POOL_SIZE kept open plus up to MAX_OVERFLOW under load. PRE_PING checks
+    # connections on checkout, RECYCLE replaces them after that many seconds
+    # (-1 never), e.g. below the idle timeout of a proxy like PgBouncer
+    POSTGRES_POOL_SIZE: int = 5
+    POSTGRES_MAX_OVERFLOW: int = 10
+    POSTGRES_POOL_PRE_PING: bool = False
+    POSTGRES_POOL_RECYCLE: int = -1
+    # Hot standby serving read-only endpoints (listings, stats, the tool
+    # catalogue) with the same credentials and database. Its data lags the
+    # primary by the replication delay
+    POSTGRES_REPLICA_SERVER: str | None = None
+    POSTGRES_REPLICA_PORT: int = 5432
 
     @computed_field  # type: ignore[prop-decorator]
     @property
@@ -80,6 +147,20 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def SQLALCHEMY_REPLICA_DATABASE_URI(self) -> PostgresDsn | None:
+        if not self.POSTGRES_REPLICA_SERVER:
+            return None
+        return MultiHostUrl.build(
+            scheme="postgresql+psycopg",
+            username=self.POSTGRES_USER,
+            password=self.POSTGRES_PASSWORD,
+            host=self.POSTGRES_REPLICA_SERVER,
+            port=self.POSTGRES_REPLICA_PORT,
+            path=self.POSTGRES_DB,
+        )
+
     NATS_URIS: str = "nats://nats:4222/"
     REDIS_URI: str = "redis://redis/"
 
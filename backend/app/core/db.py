@@ -1,10 +1,38 @@
+from sqlalchemy import Engine
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import Session, create_engine, select
 
 from app import crud
 from app.core.config import settings
 from app.models import Tool, User, UserCreate
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+POOL_OPTIONS = {
+    "pool_size": settings.POSTGRES_POOL_SIZE,
+    "max_overflow": settings.POSTGRES_MAX_OVERFLOW,
+    "pool_pre_ping": settings.POSTGRES_POOL_PRE_PING,
+    "pool_recycle": settings.POSTGRES_POOL_RECYCLE,
+}
+
+engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), **POOL_OPTIONS)
+# psycopg serves both: async routes query without blocking the event loop
+async_engine = create_async_engine(str(settings.SQLALCHEMY_DATABASE_URI), **POOL_OPTIONS)
+
+# Read-only endpoints go to the replica if there is one
+if settings.SQLALCHEMY_REPLICA_DATABASE_URI:
+    replica_engine = create_engine(str(settings.SQLALCHEMY_REPLICA_DATABASE_URI), **POOL_OPTIONS)
+    replica_async_engine = create_async_engine(str(settings.SQLALCHEMY_REPLICA_DATABASE_URI), **POOL_OPTIONS)
+else:
+    replica_engine = engine
+    replica_async_engine = async_engine
+
+
+def pool_engines() -> dict[str, Engine]:
+    """The engines of this process by name, for pool metrics."""
+    engines = {"primary": engine, "primary-async": async_engine.sync_engine}
+    if replica_engine is not engine:
+        engines["replica"] = replica_engine
+        engines["replica-async"] = replica_async_engine.sync_engine
+    return engines
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -1,7 +1,9 @@
 from datetime import UTC, datetime, timedelta
+from functools import cache
 from typing import Any
 
 import jwt
+import redis
 from pwdlib import PasswordHash
 from pwdlib.hashers.argon2 import Argon2Hasher
 from pwdlib.hashers.bcrypt import BcryptHasher
@@ -17,6 +19,10 @@ password_hash = PasswordHash(
 
 
 ALGORITHM = "HS256"
+DOWNLOAD_TOKEN_TYPE = "download"
+RUN_DOWNLOAD_TOKEN_TYPE = "run-download"
+# Longest lifetime of a download token, revocations are kept for as long
+MAX_DOWNLOAD_TOKEN_MINUTES = 60 * 24
 
 
 def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
@@ -26,6 +32,71 @@ def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
     return encoded_jwt
 
 
+def create_run_download_token(run_id: Any, expires_delta: timedelta) -> str:
+    """Create a signed token for downloading the outputs of a run."""
+    expire = datetime.now(UTC) + expires_delta
+    to_encode = {"exp": expire, "sub": str(run_id), "typ": RUN_DOWNLOAD_TOKEN_TYPE}
+    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
+
+
+def create_download_token(
+    file_id: Any,
+    *,
+    key: str | None,
+    size: int | None,
+    name: str,
+    checksum: str | None,
+    expires_delta: timedelta,
+) -> str:
+    """
+    Create a signed download token that carries everything needed to serve the
+    file (storage key relative to STORAGE_PATH, size, name and checksum), so it
+    can be verified and served without a database lookup.
+    """
+    now = datetime.now(UTC)
+    to_encode = {
+        "exp": now + expires_delta,
+        "iat": now.timestamp(),  # sub-second precision for revocation checks
+        "sub": str(file_id),
+        "typ": DOWNLOAD_TOKEN_TYPE,
+        "key": key,
+        "size": size,
+        "name": name,
+        "checksum": checksum,
+    }
+    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
+
+
+@cache
+def _revocation_client() -> redis.Redis:
+    return redis.Redis.from_url(settings.REDIS_URI)
+
+
+def _revocation_key(file_id: Any) -> str:
+    return f"download-token-revoked:{file_id}"
+
+
+def revoke_download_tokens(file_ids: list[Any]) -> None:
+    """
+    Revoke every download token issued so far for the given files.
+    Entries expire once no token issued before the revocation can be valid.
+    """
+    if not settings.DOWNLOAD_TOKEN_REVOCATION or not file_ids:
+        return
+    revoked_at = datetime.now(UTC).timestamp()
+    pipeline = _revocation_client().pipeline(transaction=False)
+    for file_id in file_ids:
+        pipeline.set(_revocation_key(file_id), revoked_at, ex=MAX_DOWNLOAD_TOKEN_MINUTES * 60)
+    pipeline.execute()
+
+
+def is_download_token_revoked(file_id: Any, issued_at: float) -> bool:
+    if not settings.DOWNLOAD_TOKEN_REVOCATION:
+        return False
+    revoked_at = _revocation_client().get(_revocation_key(file_id))
+    return revoked_at is not None and issued_at <= float(revoked_at)
+
+
 def verify_password(
     plain_password: str, hashed_password: str
 ) -> tuple[bool, str | None]:
@@ -1,13 +1,11 @@
-import shutil
 import uuid
-from pathlib import Path
 from typing import Any, BinaryIO
 
 from sqlmodel import Session, func, select
 
-from app.core.config import settings
 from app.core.security import get_password_hash, verify_password
 from app.models import File, FilesStatistics, FileType, User, UserCreate, UserUpdate
+from app.storage import StoredFile, default_storage, layout_key, storage_for
 from app.utils import sanitise_shell_input
 
 
@@ -68,31 +66,20 @@ def get_file_stats(session: Session, current_user: User) -> FilesStatistics:
     total_size = session.exec(size_query).one() or 0
     return FilesStatistics(count=count, total_size=total_size)
 
+def write_file_to_storage(*, name: str, file: BinaryIO) -> StoredFile:
+    """Copy file content into the storage layout, hashing it on the way."""
+    key = layout_key(sanitise_shell_input(name), str(uuid.uuid4()))
+    return default_storage().save(key, file)
+
 def save_file(*, session: Session, name: str, file: BinaryIO, file_type: FileType, owner_id: uuid.UUID, saved: bool = False, tags: list[str] = None) -> File:
     """Save a single file and commit the session."""
-    file_id = str(uuid.uuid4())
-    file_name = sanitise_shell_input(name)
-
-    # create a directory structure to save the file
-    # e.g. /storage/ab/cd/ab_cd_filename
-    # this is to avoid having too many files in a single directory
-    # which can slow down the filesystem
-    first_2_chars = file_id[:2]
-    second_2_chars = file_id[2:4]
-    file_storage_location = Path(settings.STORAGE_PATH) / first_2_chars / second_2_chars
-    file_storage_location.mkdir(parents=True, exist_ok=True)
-    file_storage_location = file_storage_location / f"{file_id}_{file_name}"
-
-    with open(file_storage_location, "wb") as fdst:
-        print(f"Copying file content to {file_storage_location}")
-        shutil.copyfileobj(file, fdst, length=16 * 1024 * 1024) # 16MB buffer
-        print(f"File saved to {file_storage_location}")
-
+    stored = write_file_to_storage(name=name, file=file)
     file_metadata = File(
         name=name,
         owner_id=owner_id,
-        location=str(file_storage_location),
-        size=file_storage_location.stat().st_size,
+        location=stored.location,
+        size=stored.size,
+        checksum=stored.checksum,
         file_type=file_type,
         saved=saved,
         tags=tags,
@@ -107,9 +94,7 @@ def rename_file(*, session: Session, file: File, new_name: str) -> File:
     new_name_sanitised = sanitise_shell_input(new_name)
     if not file.children:
         # Group files do not have a location
-        new_location_sanitised = Path(file.location).parent / f"{file.id}_{new_name_sanitised}"
-        Path(file.location).rename(new_location_sanitised)
-        file.location = str(new_location_sanitised)
+        file.location = storage_for(file.location).rename(file.location, f"{file.id}_{new_name_sanitised}")
     file.name = new_name
     session.add(file)
     session.commit()
@@ -0,0 +1,138 @@
+import fcntl
+import hashlib
+import os
+import shutil
+import subprocess
+import tarfile
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from app.conda import ACTIVATION_FILE
+from app.core.config import settings
+from app.models import CondaEnvPack
+from app.storage import CHUNK_SIZE, storage_for
+
+# Written into an unpacked environment once it is relocated, holds its size
+UNPACKED_MARKER = ".hive-env-unpacked"
+
+
+class EnvCache:
+    """
+    Node-local, size-bounded LRU of conda environments unpacked from packs in
+    storage. Runs hold a shared flock on their environment while they use it;
+    unpacking and eviction take it exclusively, so an environment is never
+    removed from under a run.
+    """
+
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.envs = root / "envs"
+        self.locks = root / "locks"
+        self.incoming = root / "incoming"
+        for path in (self.envs, self.locks, self.incoming):
+            path.mkdir(parents=True, exist_ok=True)
+
+    def _marker(self, env_hash: str) -> Path:
+        return self.envs / env_hash / UNPACKED_MARKER
+
+    def _download(self, pack: CondaEnvPack, archive: Path) -> None:
+        checksum = hashlib.sha256()
+        with storage_for(pack.location).open(pack.location) as src, open(archive, "wb") as dst:
+            while chunk := src.read(CHUNK_SIZE):
+                checksum.update(chunk)
+                dst.write(chunk)
+        if checksum.hexdigest() != pack.checksum:
+            raise OSError(f"Pack of conda environment {pack.env_hash} does not match its checksum")
+
+    def _unpack(self, pack: CondaEnvPack) -> None:
+        """Unpack in place: conda-unpack rewrites prefixes to the final path."""
+        path = self.envs / pack.env_hash
+        # Left over from an interrupted unpack
+        shutil.rmtree(path, ignore_errors=True)
+        archive = self.incoming / f"{uuid.uuid4()}.tar.gz"
+        try:
+            print(f"Unpacking conda environment {pack.env_hash} to {path}")
+            self._download(pack, archive)
+            with tarfile.open(archive) as tar:
+                size = sum(member.size for member in tar.getmembers())
+                # Our own checksummed archive; keep its symlinks and modes as packed
+                tar.extractall(path, filter="tar")
+            conda_unpack = path / "bin" / "conda-unpack"
+            if conda_unpack.exists():
+                subprocess.run([str(conda_unpack)], check=True, capture_output=True)
+            # Captured for the packed prefix, runs capture it again for this one
+            (path / ACTIVATION_FILE).unlink(missing_ok=True)
+            self._marker(pack.env_hash).write_text(str(size))
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        finally:
+            archive.unlink(missing_ok=True)
+
+    @contextmanager
+    def use(self, pack: CondaEnvPack) -> Iterator[Path]:
+        """Unpack the environment if needed and keep it on the node while in use."""
+        marker = self._marker(pack.env_hash)
+        unpacked = False
+        with open(self.locks / f"{pack.env_hash}.lock", "a") as lock_file:
+            while True:
+                fcntl.flock(lock_file, fcntl.LOCK_SH)
+                if marker.exists():
+                    break
+                # flock cannot upgrade atomically: unpack under an exclusive
+                # lock, then take the shared lock again and re-check
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if not marker.exists():
+                    self._unpack(pack)
+                    unpacked = True
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            # The marker modification time orders environments for eviction
+            os.utime(marker)
+            if unpacked:
+                self.evict()
+            yield marker.parent
+
+    def evict(self) -> int:
+        """
+        Remove least recently used environments until the cache fits in
+        max_bytes, skipping those in use. Returns the bytes freed.
+        """
+        with open(self.locks / "evict.lock", "a") as evict_lock:
+            try:
+                fcntl.flock(evict_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker is already evicting
+                return 0
+            entries = []
+            for entry in os.scandir(self.envs):
+                marker = Path(entry.path) / UNPACKED_MARKER
+                try:
+                    entries.append((entry.name, marker.stat().st_mtime, int(marker.read_text())))
+                except (OSError, ValueError):
+                    continue
+            total = sum(size for _, _, size in entries)
+            freed = 0
+            for env_hash, _, size in sorted(entries, key=lambda e: e[1]):
+                if total - freed <= self.max_bytes:
+                    break
+                with open(self.locks / f"{env_hash}.lock", "a") as lock_file:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue
+                    print(f"Evicting unpacked conda environment {env_hash}")
+                    self._marker(env_hash).unlink(missing_ok=True)
+                    shutil.rmtree(self.envs / env_hash, ignore_errors=True)
+                freed += size
+            return freed
+
+
+def env_cache() -> EnvCache | None:
+    """The unpacked environments of this node, if CONDA_UNPACK_PATH is configured."""
+    if not settings.CONDA_UNPACK_PATH:
+        return None
+    return EnvCache(Path(settings.CONDA_UNPACK_PATH), settings.CONDA_UNPACK_MAX_BYTES)
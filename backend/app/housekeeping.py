@@ -0,0 +1,573 @@
+import os
+import shutil
+import time
+import uuid
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import (
+    ColumnElement,
+    Integer,
+    Row,
+    Uuid,
+    and_,
+    cast,
+    delete,
+    insert,
+    literal,
+    null,
+    or_,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, func, select
+
+from app.compaction import ZSTD, compress_file
+from app.conda import conda_env_key, conda_env_path, inspect_env
+from app.core.config import settings
+from app.core.file_types import file_types
+from app.core.security import revoke_download_tokens
+from app.models import (
+    CondaEnvHealth,
+    CondaEnvPack,
+    File,
+    PendingDeletion,
+    ReclaimedStorage,
+    Run,
+    RunStatus,
+    Tool,
+    ToolStatus,
+)
+from app.storage import S3_SCHEME, storage_for
+
+
+def delete_files_deferred(session: Session, where: ColumnElement[bool]) -> list[uuid.UUID]:
+    """
+    Delete the File rows matching `where` with bulk statements and queue their
+    stored content for the background reclaimer instead of unlinking it inline.
+    Children of deleted groups that are not deleted themselves become top level
+    files again. The caller is responsible for committing.
+    Returns the ids of the deleted files.
+    """
+    file_ids = session.exec(select(File.id).where(where)).all()
+    if not file_ids:
+        return []
+    deleted = File.id.in_(file_ids)
+    session.execute(
+        update(File)
+        .where(File.parent_id.in_(file_ids), File.id.not_in(file_ids))
+        .values(parent_id=None)
+    )
+    session.execute(
+        insert(PendingDeletion).from_select(
+            ["location", "size", "attempts", "created_at"],
+            select(File.location, func.coalesce(File.stored_size, File.size), literal(0), literal(datetime.utcnow()))
+            .where(deleted, File.location.is_not(None)),
+        )
+    )
+    session.execute(delete(File).where(deleted))
+    return list(file_ids)
+
+
+def record_reclaimed_storage(session: Session, **counts: int) -> None:
+    """Add to today's reclaimed storage counters, e.g. reclaimed_files=10, reclaimed_bytes=1024."""
+    statement = pg_insert(ReclaimedStorage).values(day=datetime.utcnow().date(), **counts)
+    statement = statement.on_conflict_do_update(
+        index_elements=[ReclaimedStorage.day],
+        set_={name: getattr(ReclaimedStorage, name) + value for name, value in counts.items()},
+    )
+    session.execute(statement)
+
+
+@dataclass
+class ReclaimProgress:
+    reclaimed: int = 0
+    reclaimed_bytes: int = 0
+    failed: int = 0
+
+
+def reclaim_storage(session: Session, batch_size: int | None = None) -> ReclaimProgress:
+    """
+    Delete the stored content of deleted files in batches.
+    Each pending deletion is tried once per pass; failures are kept with their
+    error and retried on the next pass until STORAGE_RECLAIM_MAX_ATTEMPTS.
+    Rows are locked with SKIP LOCKED so several reclaimers can run at once.
+    """
+    batch_size = batch_size or settings.STORAGE_RECLAIM_BATCH_SIZE
+    progress = ReclaimProgress()
+    last_id = 0
+    while True:
+        batch = session.exec(
+            select(PendingDeletion)
+            .where(PendingDeletion.id > last_id)
+            .where(PendingDeletion.attempts < settings.STORAGE_RECLAIM_MAX_ATTEMPTS)
+            .order_by(PendingDeletion.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        reclaimed_ids = []
+        reclaimed_bytes = 0
+        for pending in batch:
+            try:
+                storage_for(pending.location).delete(pending.location)
+            except OSError as e:
+                pending.attempts += 1
+                pending.last_error = str(e)
+                session.add(pending)
+                progress.failed += 1
+                continue
+            reclaimed_ids.append(pending.id)
+            reclaimed_bytes += pending.size or 0
+        if reclaimed_ids:
+            session.execute(delete(PendingDeletion).where(PendingDeletion.id.in_(reclaimed_ids)))
+            record_reclaimed_storage(
+                session, reclaimed_files=len(reclaimed_ids), reclaimed_bytes=reclaimed_bytes
+            )
+            progress.reclaimed += len(reclaimed_ids)
+            progress.reclaimed_bytes += reclaimed_bytes
+        session.commit()
+        print(
+            f"Storage reclaimer: {progress.reclaimed} files ({progress.reclaimed_bytes} bytes) "
+            f"reclaimed, {progress.failed} failed"
+        )
+    return progress
+
+
+@dataclass
+class ExpiryProgress:
+    runs: int = 0
+    files: int = 0
+    bytes: int = 0
+
+
+def expire_unsaved_outputs(session: Session, batch_size: int | None = None) -> ExpiryProgress:
+    """
+    Delete unsaved outputs of runs that finished longer ago than their retention
+    period (the tool's output_retention_days, else UNSAVED_OUTPUT_RETENTION_DAYS)
+    and mark the runs with outputs_expired_at. Saved outputs are never expired.
+    Runs are processed oldest first in batches, one transaction per batch.
+    """
+    batch_size = batch_size or settings.STORAGE_RECLAIM_BATCH_SIZE
+    retention_days = func.coalesce(
+        Tool.output_retention_days,
+        cast(literal(settings.UNSAVED_OUTPUT_RETENTION_DAYS), Integer),
+    )
+    progress = ExpiryProgress()
+    while True:
+        now = datetime.utcnow()
+        run_ids = session.exec(
+            select(Run.id)
+            .join(Tool, Run.tool_id == Tool.id)
+            .where(Run.outputs_expired_at.is_(None))
+            .where(Run.status.not_in([RunStatus.pending, RunStatus.running]))
+            .where(Run.finished_at + func.make_interval(0, 0, 0, retention_days) < now)
+            .order_by(Run.finished_at)
+            .limit(batch_size)
+            .with_for_update(of=Run, skip_locked=True)
+        ).all()
+        if not run_ids:
+            break
+        expired = File.run_id.in_(run_ids) & ~File.saved
+        files, size = session.exec(
+            select(func.count(), func.coalesce(func.sum(func.coalesce(File.stored_size, File.size)), 0))
+            .where(expired)
+        ).one()
+        deleted_ids = delete_files_deferred(session, expired)
+        session.execute(update(Run).where(Run.id.in_(run_ids)).values(outputs_expired_at=now))
+        record_reclaimed_storage(session, expired_files=files, expired_bytes=size)
+        session.commit()
+        revoke_download_tokens(deleted_ids)
+        progress.runs += len(run_ids)
+        progress.files += files
+        progress.bytes += size
+        print(
+            f"Output expiry: {progress.runs} runs expired, "
+            f"{progress.files} files ({progress.bytes} bytes) queued for deletion"
+        )
+    return progress
+
+
+@dataclass
+class ReconcileReport:
+    scanned_files: int = 0
+    orphans: int = 0
+    orphan_bytes: int = 0
+    reclaimed_orphans: int = 0
+    dangling_rows: int = 0
+    deleted_rows: int = 0
+    stale_tmp_dirs: int = 0
+    dangling_file_ids: list[uuid.UUID] = field(default_factory=list)
+
+
+def _shard_dirs(path: str) -> list[os.DirEntry]:
+    """Two character directories of the storage layout, in name order."""
+    with os.scandir(path) as entries:
+        shards = [e for e in entries if len(e.name) == 2 and e.is_dir(follow_symlinks=False)]
+    return sorted(shards, key=lambda e: e.name)
+
+
+def iter_storage_files(root: Path) -> Iterator[os.DirEntry]:
+    """
+    Yield the files of the `ab/cd` storage layout ordered by path, listing one
+    leaf directory at a time so memory use is independent of the number of files.
+    """
+    if not root.is_dir():
+        return
+    for first in _shard_dirs(str(root)):
+        for second in _shard_dirs(first.path):
+            with os.scandir(second.path) as entries:
+                files = [e for e in entries if e.is_file(follow_symlinks=False)]
+            yield from sorted(files, key=lambda e: e.name)
+
+
+def _known_locations(root: Path):
+    """
+    Locations inside the storage root referenced by files, pending deletions
+    or conda environment packs.
+    """
+    prefix = f"{root}{os.sep}"
+    return union_all(
+        select(File.id, File.location.label("location"))
+        .where(File.location.startswith(prefix, autoescape=True)),
+        select(cast(null(), Uuid), PendingDeletion.location)
+        .where(PendingDeletion.location.startswith(prefix, autoescape=True)),
+        select(cast(null(), Uuid), CondaEnvPack.location)
+        .where(CondaEnvPack.location.startswith(prefix, autoescape=True)),
+    ).subquery()
+
+
+def iter_known_locations(session: Session, root: Path, batch_size: int) -> Iterator[Row]:
+    """
+    Yield the known locations ordered bytewise to match iter_storage_files.
+    Pages of `batch_size` are fetched by keyset on (location, id), each in
+    its own transaction, so no snapshot is held open for the whole walk.
+    """
+    known = _known_locations(root)
+    location = known.c.location.collate("C")
+    # Pending deletions have no id, they sort first within a location
+    key = func.coalesce(known.c.id, literal(uuid.UUID(int=0), Uuid))
+    last = None
+    while True:
+        statement = select(known.c.id, known.c.location).order_by(location, key).limit(batch_size)
+        if last is not None:
+            last_location, last_key = last
+            statement = statement.where(
+                or_(location > last_location, and_(known.c.location == last_location, key > last_key))
+            )
+        rows = session.execute(statement).all()
+        session.commit()
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last = rows[-1].location, rows[-1].id or uuid.UUID(int=0)
+
+
+def _handle_orphans(session: Session, orphans: list[os.DirEntry], report: ReconcileReport, reclaim: bool) -> None:
+    # Re-check against the database: a file may have been committed or
+    # renamed into place while the storage walk was running
+    paths = [orphan.path for orphan in orphans]
+    referenced = set(session.exec(select(File.location).where(File.location.in_(paths))).all())
+    referenced.update(
+        session.exec(select(PendingDeletion.location).where(PendingDeletion.location.in_(paths))).all()
+    )
+    referenced.update(session.exec(select(CondaEnvPack.location).where(CondaEnvPack.location.in_(paths))).all())
+    orphans = [orphan for orphan in orphans if orphan.path not in referenced]
+    for orphan in orphans:
+        print(f"Storage reconciliation: orphaned file {orphan.path}")
+    report.orphans += len(orphans)
+    report.orphan_bytes += sum(orphan.stat(follow_symlinks=False).st_size for orphan in orphans)
+    if reclaim and orphans:
+        # Hand orphans to the reclaimer rather than unlinking them here
+        session.add_all(
+            PendingDeletion(location=orphan.path, size=orphan.stat(follow_symlinks=False).st_size)
+            for orphan in orphans
+        )
+        report.reclaimed_orphans += len(orphans)
+
+
+def _handle_dangling(session: Session, file_ids: list[uuid.UUID], report: ReconcileReport, reclaim: bool) -> None:
+    # Re-check that the rows still point at missing content
+    rows = session.exec(select(File.id, File.location).where(File.id.in_(file_ids))).all()
+    dangling = [file_id for file_id, location in rows if location and not Path(location).exists()]
+    for file_id in dangling:
+        print(f"Storage reconciliation: File(id={file_id}) points at missing content")
+    report.dangling_rows += len(dangling)
+    report.dangling_file_ids.extend(dangling)
+    if reclaim and dangling:
+        report.deleted_rows += len(delete_files_deferred(session, File.id.in_(dangling)))
+
+
+def clean_stale_tmp_dirs(session: Session, older_than: float, report: ReconcileReport) -> None:
+    """Remove run directories under TMP_PATH left behind by workers that died mid-run."""
+    tmp_path = Path(settings.TMP_PATH)
+    if not tmp_path.is_dir():
+        return
+    run_dirs: dict[uuid.UUID, os.DirEntry] = {}
+    with os.scandir(tmp_path) as entries:
+        for entry in entries:
+            try:
+                run_id = uuid.UUID(entry.name)
+            except ValueError:
+                continue
+            if entry.is_dir(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_ctime < older_than:
+                run_dirs[run_id] = entry
+    if not run_dirs:
+        return
+    active = set(
+        session.exec(
+            select(Run.id).where(
+                Run.id.in_(run_dirs), Run.status.in_([RunStatus.pending, RunStatus.running])
+            )
+        ).all()
+    )
+    for run_id, entry in run_dirs.items():
+        if run_id in active:
+            continue
+        print(f"Storage reconciliation: removing stale run directory {entry.path}")
+        shutil.rmtree(entry.path, ignore_errors=True)
+        report.stale_tmp_dirs += 1
+
+
+def reconcile_storage(
+    session: Session,
+    *,
+    reclaim: bool | None = None,
+    grace_hours: int | None = None,
+    batch_size: int | None = None,
+) -> ReconcileReport:
+    """
+    Compare the local storage layout (STORAGE_PATH) with the database.
+    The storage walk and the known locations, read in keyset pages, are
+    merged like sorted lists, so neither side is held in memory. Work is
+    committed every `batch_size` files.
+    Orphaned content older than the grace period and rows whose content is
+    missing are reported, and reclaimed when `reclaim` is set. Stale run
+    directories under TMP_PATH are always removed.
+    """
+    reclaim = settings.STORAGE_RECONCILE_RECLAIM if reclaim is None else reclaim
+    grace_hours = settings.STORAGE_RECONCILE_GRACE_HOURS if grace_hours is None else grace_hours
+    batch_size = batch_size or settings.STORAGE_RECONCILE_BATCH_SIZE
+    older_than = time.time() - grace_hours * 3600
+    report = ReconcileReport()
+
+    root = Path(settings.STORAGE_PATH)
+    disk = iter_storage_files(root)
+    known = iter_known_locations(session, root, batch_size)
+    entry = next(disk, None)
+    row = next(known, None)
+    orphans: list[os.DirEntry] = []
+    dangling: list[uuid.UUID] = []
+    while entry is not None or row is not None:
+        if row is None or (entry is not None and entry.path.encode() < row.location.encode()):
+            # On disk but unknown to the database
+            report.scanned_files += 1
+            if entry.stat(follow_symlinks=False).st_ctime < older_than:
+                orphans.append(entry)
+            entry = next(disk, None)
+        elif entry is None or row.location.encode() < entry.path.encode():
+            # Known to the database but missing on disk
+            if row.id is not None:
+                dangling.append(row.id)
+            row = next(known, None)
+        else:
+            report.scanned_files += 1
+            location = row.location
+            while row is not None and row.location == location:
+                row = next(known, None)
+            entry = next(disk, None)
+        if len(orphans) >= batch_size:
+            _handle_orphans(session, orphans, report, reclaim)
+            session.commit()
+            orphans = []
+        if len(dangling) >= batch_size:
+            _handle_dangling(session, dangling, report, reclaim)
+            session.commit()
+            dangling = []
+    if orphans:
+        _handle_orphans(session, orphans, report, reclaim)
+    if dangling:
+        _handle_dangling(session, dangling, report, reclaim)
+    session.commit()
+
+    clean_stale_tmp_dirs(session, older_than, report)
+    print(
+        f"Storage reconciliation: {report.scanned_files} files scanned, "
+        f"{report.orphans} orphans ({report.orphan_bytes} bytes, {report.reclaimed_orphans} reclaimed), "
+        f"{report.dangling_rows} dangling rows ({report.deleted_rows} deleted), "
+        f"{report.stale_tmp_dirs} stale run directories removed"
+    )
+    return report
+
+
+@dataclass
+class CompactionProgress:
+    compacted: int = 0
+    skipped: int = 0
+    saved_bytes: int = 0
+
+
+def _active_input_ids(session: Session) -> set[uuid.UUID]:
+    """Files used as inputs by pending or running runs, which may have them symlinked."""
+    input_lists = session.exec(
+        select(Run.input_file_ids).where(Run.status.in_([RunStatus.pending, RunStatus.running]))
+    ).all()
+    return {uuid.UUID(str(file_id)) for input_ids in input_lists for file_id in input_ids or []}
+
+
+def compact_file(session: Session, file_id: uuid.UUID, progress: CompactionProgress) -> None:
+    file = session.get(File, file_id)
+    path = Path(file.location)
+    try:
+        compressed = compress_file(path, settings.COMPACTION_LEVEL)
+    except OSError as e:
+        print(f"Compaction of File(id={file.id}) failed: {e}")
+        progress.skipped += 1
+        return
+    stored_size = compressed.stat().st_size
+    if stored_size > file.size * settings.COMPACTION_MAX_RATIO:
+        # Not worth it; remember so the file is not considered again
+        compressed.unlink()
+        file.stored_size = file.size
+        session.add(file)
+        session.commit()
+        progress.skipped += 1
+        return
+    # Re-check under a row lock: the file may have been renamed, deleted or
+    # picked as a run input while it was being compressed
+    file = session.exec(
+        select(File).where(File.id == file_id).with_for_update().execution_options(populate_existing=True)
+    ).first()
+    if file is None or file.location != str(path) or file_id in _active_input_ids(session):
+        session.rollback()
+        compressed.unlink()
+        progress.skipped += 1
+        return
+    # Point the row at the compressed copy and queue the original for the
+    # reclaimer in one transaction; until it commits readers see the original
+    file.location = str(compressed)
+    file.compression = ZSTD
+    file.stored_size = stored_size
+    session.add(file)
+    session.add(PendingDeletion(location=str(path), size=file.size))
+    try:
+        session.commit()
+    except Exception:
+        session.rollback()
+        compressed.unlink(missing_ok=True)
+        raise
+    # Tokens issued before point at the original, which is about to go
+    revoke_download_tokens([file.id])
+    progress.compacted += 1
+    progress.saved_bytes += file.size - stored_size
+
+
+def compact_cold_files(session: Session, batch_size: int | None = None) -> CompactionProgress:
+    """
+    Compress cold text files with zstd. Files are cold once they are
+    older than COMPACTION_MIN_AGE_DAYS; inputs of active runs and content in
+    object storage are skipped.
+    Reads through app.compaction decompress them transparently.
+    """
+    progress = CompactionProgress()
+    if settings.COMPACTION_MIN_AGE_DAYS is None:
+        return progress
+    batch_size = batch_size or settings.STORAGE_RECLAIM_BATCH_SIZE
+    text_types = [name for name, metadata in file_types.allowed.items() if metadata.file_format == "text"]
+    cold_before = datetime.utcnow() - timedelta(days=settings.COMPACTION_MIN_AGE_DAYS)
+    last_id = None
+    while True:
+        statement = (
+            select(File.id)
+            .where(File.location.is_not(None), ~File.location.startswith(S3_SCHEME))
+            .where(File.compression.is_(None), File.stored_size.is_(None))
+            .where(File.file_type.in_(text_types))
+            .where(File.size >= settings.COMPACTION_MIN_SIZE)
+            .where(File.created_at < cold_before)
+            .order_by(File.id)
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            statement = statement.where(File.id > last_id)
+        file_ids = session.exec(statement).all()
+        if not file_ids:
+            break
+        last_id = file_ids[-1]
+        active_inputs = _active_input_ids(session)
+        for file_id in file_ids:
+            if file_id in active_inputs:
+                progress.skipped += 1
+                continue
+            compact_file(session, file_id, progress)
+        print(
+            f"Compaction: {progress.compacted} files compacted ({progress.saved_bytes} bytes saved), "
+            f"{progress.skipped} skipped"
+        )
+    return progress
+
+
+@dataclass
+class EnvHealthReport:
+    verified: int = 0
+    skipped: int = 0
+    unhealthy: list[str] = field(default_factory=list)
+
+
+def check_conda_env(session: Session, env_key: str, path: Path, reset_baseline: bool = False) -> CondaEnvHealth:
+    """
+    Inspect an environment and record its health. The fingerprint taken when
+    the environment is installed (`reset_baseline`) is the one later checks
+    must match.
+    """
+    inspection = inspect_env(path)
+    health = session.get(CondaEnvHealth, env_key) or CondaEnvHealth(env_key=env_key, path=str(path))
+    if reset_baseline or health.checksum is None:
+        health.checksum = inspection.checksum
+    health.path = str(path)
+    health.size = inspection.size
+    health.error = inspection.error
+    if health.error is None and inspection.checksum != health.checksum:
+        health.error = "Environment changed since it was installed"
+    health.healthy = health.error is None
+    health.verified_at = datetime.utcnow()
+    session.add(health)
+    session.commit()
+    return health
+
+
+def verify_conda_envs(session: Session) -> EnvHealthReport:
+    """Verify the environment of every installed tool, forgetting unused ones."""
+    report = EnvHealthReport()
+    conda_path = Path(settings.CONDA_PATH)
+    tools = session.exec(
+        select(Tool.id, Tool.conda_env_hash, Tool.conda_env).where(Tool.status == ToolStatus.installed)
+    ).all()
+    envs = {
+        conda_env_key(tool_id, env_hash): (env_hash, conda_env_path(conda_path, tool_id, env_hash))
+        for tool_id, env_hash, conda_env in tools
+        if conda_env
+    }
+    packed = set(session.exec(select(CondaEnvPack.env_hash)).all())
+    for env_key, (env_hash, path) in envs.items():
+        if env_hash in packed and not path.exists():
+            # Run workers with CONDA_PACK_ENVS unpack environments on demand
+            # and need not share CONDA_PATH; leave the last result in place
+            report.skipped += 1
+            continue
+        health = check_conda_env(session, env_key, path)
+        report.verified += 1
+        if not health.healthy:
+            print(f"Conda environment {env_key} is unhealthy: {health.error}")
+            report.unhealthy.append(env_key)
+    session.exec(delete(CondaEnvHealth).where(CondaEnvHealth.env_key.not_in(list(envs))))
+    session.commit()
+    print(
+        f"Verified {report.verified} conda environments, {len(report.unhealthy)} unhealthy, "
+        f"{report.skipped} packed and not on this node"
+    )
+    return report
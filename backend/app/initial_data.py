@@ -2,7 +2,9 @@ import logging
 
 from sqlmodel import Session
 
+from app.core.config import settings
 from app.core.db import engine, init_db
+from app.storage import S3Storage
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,6 +13,8 @@ logger = logging.getLogger(__name__)
 def init() -> None:
     with Session(engine) as session:
         init_db(session)
+    if settings.STORAGE_BACKEND == "s3":
+        S3Storage().create_bucket()
 
 
 def main() -> None:
@@ -0,0 +1,173 @@
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import socket
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import cache
+from pathlib import Path
+
+import redis
+
+from app.compaction import open_stored
+from app.core.config import settings
+from app.models import File
+
+# Copy in 16MB chunks so memory use is independent of input size
+CHUNK_SIZE = 16 * 1024 * 1024
+STATS_KEY_PREFIX = "input-cache-stats:"
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    fetched_bytes: int = 0
+    evicted_bytes: int = 0
+
+
+@cache
+def _stats_client() -> redis.Redis:
+    return redis.Redis.from_url(settings.REDIS_URI)
+
+
+def record_cache_stats(stats: CacheStats) -> None:
+    """Add to this node's counters in Redis. Metrics never fail a run."""
+    try:
+        pipeline = _stats_client().pipeline()
+        key = f"{STATS_KEY_PREFIX}{socket.gethostname()}"
+        for name, value in vars(stats).items():
+            if value:
+                pipeline.hincrby(key, name, value)
+        pipeline.execute()
+    except redis.RedisError as e:
+        print(f"Failed to record input cache stats: {e}")
+
+
+def read_cache_stats() -> dict[str, CacheStats]:
+    """Counters of every worker node, by host name."""
+    client = _stats_client()
+    stats = {}
+    for key in client.scan_iter(f"{STATS_KEY_PREFIX}*"):
+        values = {k.decode(): int(v) for k, v in client.hgetall(key).items()}
+        stats[key.decode().removeprefix(STATS_KEY_PREFIX)] = CacheStats(**values)
+    return stats
+
+
+class InputCache:
+    """
+    Node-local, size-bounded LRU cache of run input content keyed by its sha256.
+    Cached blobs are read-only and hardlinked into run directories, so a blob
+    evicted while a run is using it stays readable until the run finishes.
+    Concurrent workers on the node coordinate through flock: one lock per blob
+    while it is fetched or evicted, and one for eviction passes.
+    """
+
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.blobs = root / "blobs"
+        self.locks = root / "locks"
+        self.incoming = root / "incoming"
+        for path in (self.blobs, self.locks, self.incoming):
+            path.mkdir(parents=True, exist_ok=True)
+
+    def _blob(self, checksum: str) -> Path:
+        return self.blobs / checksum[:2] / checksum
+
+    @contextmanager
+    def _lock(self, name: str, blocking: bool = True) -> Iterator[bool]:
+        with open(self.locks / f"{name}.lock", "a") as lock_file:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock_file, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _fetch(self, file: File, blob: Path) -> int:
+        """Copy the content of `file` into the cache, verifying its checksum."""
+        incoming = self.incoming / f"{uuid.uuid4()}.part"
+        checksum = hashlib.sha256()
+        size = 0
+        try:
+            with open_stored(file.location, file.compression) as src, open(incoming, "wb") as dst:
+                while chunk := src.read(CHUNK_SIZE):
+                    checksum.update(chunk)
+                    dst.write(chunk)
+                    size += len(chunk)
+            if checksum.hexdigest() != file.checksum:
+                raise OSError(f"Content of File(id={file.id}) does not match its checksum")
+            incoming.chmod(0o444)
+            blob.parent.mkdir(exist_ok=True)
+            os.replace(incoming, blob)
+        finally:
+            incoming.unlink(missing_ok=True)
+        return size
+
+    def stage(self, file: File, destination: Path, stats: CacheStats) -> None:
+        """Link the content of `file` into a run directory, fetching it on a miss."""
+        blob = self._blob(file.checksum)
+        with self._lock(file.checksum):
+            hit = blob.exists()
+            if hit:
+                stats.hits += 1
+                # The modification time orders blobs for eviction
+                os.utime(blob)
+            else:
+                stats.misses += 1
+                stats.fetched_bytes += self._fetch(file, blob)
+            try:
+                os.link(blob, destination)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # Run directories on another filesystem get a private copy
+                shutil.copyfile(blob, destination)
+        if not hit:
+            stats.evicted_bytes += self.evict()
+
+    def evict(self) -> int:
+        """
+        Remove least recently used blobs until the cache fits in max_bytes.
+        Blobs linked into a run directory (more than one link) or locked by
+        another worker are skipped. Returns the bytes freed.
+        """
+        with self._lock("evict", blocking=False) as locked:
+            if not locked:
+                # Another worker is already evicting
+                return 0
+            entries = []
+            for shard in os.scandir(self.blobs):
+                for entry in os.scandir(shard.path):
+                    entries.append((entry.name, entry.stat(follow_symlinks=False)))
+            total = sum(stat.st_size for _, stat in entries)
+            freed = 0
+            for checksum, stat in sorted(entries, key=lambda e: e[1].st_mtime):
+                if total - freed <= self.max_bytes:
+                    break
+                if stat.st_nlink > 1:
+                    continue
+                with self._lock(checksum, blocking=False) as locked_blob:
+                    if not locked_blob:
+                        continue
+                    self._blob(checksum).unlink(missing_ok=True)
+                freed += stat.st_size
+            if freed:
+                print(f"Input cache: evicted {freed} bytes")
+            return freed
+
+
+def input_cache() -> InputCache | None:
+    """The input cache of this node, if INPUT_CACHE_PATH is configured."""
+    if not settings.INPUT_CACHE_PATH:
+        return None
+    return InputCache(Path(settings.INPUT_CACHE_PATH), settings.INPUT_CACHE_MAX_BYTES)
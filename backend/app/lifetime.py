@@ -4,14 +4,16 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from sqlmodel import Session, select
 
-from app.core.db import engine
+from app.core.db import async_engine, engine
 from app.models import Run
 from app.tasks import run_tool
-from app.tkq import broker
+from app.tkq import broker, install_broker
 from app.wsmanager import manager
 
 
 async def startup_taskiq() -> None:
+    if not install_broker.is_worker_process:
+        await install_broker.startup()
     if not broker.is_worker_process:
         await broker.startup()
 
@@ -35,6 +37,8 @@ async def startup_taskiq() -> None:
 
 
 async def shutdown_taskiq() -> None:
+    if not install_broker.is_worker_process:
+        await install_broker.shutdown()
     if not broker.is_worker_process:
         await broker.shutdown()
 
@@ -52,6 +56,12 @@ async def shutdown_broadcast() -> None:
     await manager.shutdown()
     print("Broadcaster disconnected.")
 
+async def shutdown_db() -> None:
+    """
+    Close the pooled connections of the async engine on this event loop.
+    """
+    await async_engine.dispose()
+
 @asynccontextmanager
 async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
     await startup_taskiq()
@@ -61,3 +71,4 @@ async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
     finally:
         await shutdown_taskiq()
         await shutdown_broadcast()
+        await shutdown_db()
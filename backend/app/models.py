@@ -1,9 +1,10 @@
 import uuid
-from datetime import datetime
+from datetime import date, datetime
 from enum import StrEnum
 from typing import Optional
 
 from pydantic import EmailStr
+from sqlalchemy import Index, text
 from sqlalchemy.dialects.postgresql import JSONB as JSON
 from sqlalchemy.orm import RelationshipProperty
 from sqlmodel import (
@@ -97,6 +98,18 @@ class Token(SQLModel):
 # Contents of JWT token
 class TokenPayload(SQLModel):
     sub: str | None = None
+    typ: str | None = None
+
+
+# Contents of a signed file download token
+class DownloadTokenPayload(SQLModel):
+    sub: str
+    iat: float
+    typ: str | None = None
+    key: str | None = None  # storage key relative to STORAGE_PATH
+    size: int | None = None
+    name: str | None = None
+    checksum: str | None = None
 
 
 class NewPassword(SQLModel):
@@ -176,6 +189,9 @@ class ToolBase(SQLModel):
     params: list[Param] | None = None
     targets: list[Target] | None = None
     llm_summary_enabled: bool = False
+    # Days unsaved run outputs are kept after the run finishes,
+    # overrides UNSAVED_OUTPUT_RETENTION_DAYS
+    output_retention_days: int | None = Field(default=None, ge=0)
 
 # Properties to receive on Tool creation
 class ToolCreate(ToolBase):
@@ -204,6 +220,9 @@ class Tool(ToolBase, table=True):
     installation_log: str | None = None
     conda_env: CondaEnv | None = Field(default=None, sa_column=Column(JSON))
     conda_env_pinned: str | None = None
+    # Environments are shared by every tool with the same hash,
+    # tools installed before have theirs at CONDA_PATH/{id}
+    conda_env_hash: str | None = Field(default=None, index=True)
     setup_files: list[SetupFile] | None = Field(default_factory=list, sa_column=Column(JSON))
     params: list[Param] | None = Field(default_factory=list, sa_column=Column(JSON))
     targets: list[Target] | None = Field(default_factory=list, sa_column=Column(JSON))
@@ -219,6 +238,45 @@ class Tool(ToolBase, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
 
 
+# Relocatable archive of a shared conda environment, unpacked by workers
+class CondaEnvPack(SQLModel, table=True):
+    env_hash: str = Field(primary_key=True)
+    location: str
+    size: int = Field(sa_column=Column(BigInteger(), nullable=False))
+    checksum: str
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+# Last verification of a conda environment, keyed by its hash (the tool id
+# for environments installed before they were shared)
+class CondaEnvHealth(SQLModel, table=True):
+    env_key: str = Field(primary_key=True)
+    path: str
+    healthy: bool = True
+    # Fingerprint taken at install, later verifications are compared with it
+    checksum: str | None = None
+    size: int = Field(default=0, sa_column=Column(BigInteger(), nullable=False))
+    error: str | None = None
+    verified_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+class CondaEnvironmentPublic(SQLModel):
+    env_key: str
+    path: str
+    tool_ids: list[uuid.UUID]
+    tool_names: list[str]
+    size: int | None = None
+    # None until the environment is first verified
+    healthy: bool | None = None
+    error: str | None = None
+    verified_at: datetime | None = None
+
+
+class CondaEnvironmentsPublic(SQLModel):
+    data: list[CondaEnvironmentPublic]
+    count: int
+
+
 # Properties to return via API, id is always required
 class ToolPublic(ToolBase):
     favourited: bool = False
@@ -269,6 +327,13 @@ class RunBase(SQLModel):
 
 
 class Run(RunBase, table=True):
+    __table_args__ = (
+        # Run listings of a user, newest first; id breaks ties for cursors
+        Index("ix_run_owner_id_created_at", "owner_id", text("created_at DESC"), text("id DESC")),
+        # Active runs of a user: quota checks, active listing and cancelling
+        Index("ix_run_owner_id_active", "owner_id", postgresql_where=text("status IN ('pending', 'running')")),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     taskiq_id: str | None = None
     status: RunStatus = Field(sa_column=Column(Enum(RunStatus)))
@@ -291,6 +356,8 @@ class Run(RunBase, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
     started_at: datetime | None = Field(default=None, nullable=True)
     finished_at: datetime | None = Field(default=None, nullable=True)
+    # Set when unsaved outputs were removed by the retention policy
+    outputs_expired_at: datetime | None = Field(default=None, nullable=True)
 
 
 class RunPublicMinimal(SQLModel):
@@ -307,6 +374,38 @@ class RunPublicMinimal(SQLModel):
     owner_name: str | None = None  # Full name of the run owner, only shown for shared runs
 
 
+# Lean run listing: only these columns are selected, tools are sent once
+class ToolListItem(SQLModel):
+    id: uuid.UUID
+    name: str
+    image: str | None = None
+    description: str | None = None
+    tags: list[str] | None = None
+    enabled: bool = False
+    llm_summary_enabled: bool = False
+
+
+class RunListItem(SQLModel):
+    id: uuid.UUID
+    name: str | None = None
+    tool_id: uuid.UUID
+    params: dict
+    status: RunStatus
+    shared: bool = False
+    tags: list[str] | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+
+class RunsListPublic(SQLModel):
+    data: list[RunListItem]
+    # Tools of the runs in data, keyed by RunListItem.tool_id
+    tools: dict[uuid.UUID, ToolListItem]
+    count: int | None
+    next_cursor: str | None = None
+
+
 class FileBase(SQLModel):
     name: str
     file_type: FileType | None = None
@@ -317,10 +416,30 @@ class FileBase(SQLModel):
 
 
 class File(FileBase, table=True):
+    __table_args__ = (
+        # "My Files": saved top level files of a user, newest first
+        Index(
+            "ix_file_owner_id_created_at_top_level",
+            "owner_id",
+            text("created_at DESC"),
+            text("id DESC"),
+            postgresql_where=text("saved AND parent_id IS NULL"),
+        ),
+        # Saved file count and size of a user without visiting the table
+        Index("ix_file_owner_id_saved", "owner_id", postgresql_include=["size"], postgresql_where=text("saved")),
+        Index("ix_file_parent_id", "parent_id"),
+        Index("ix_file_run_id", "run_id"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     file_type: FileType = Field(sa_column=Column(String, nullable=False))
     size: int | None = Field(default=None, sa_column=Column(BigInteger(), nullable=True))
     location: str | None = None
+    checksum: str | None = None  # sha256 of the content, used as the download ETag
+    # Cold text files are compressed in place by the compactor; size stays the
+    # logical (uncompressed) size used for quotas, stored_size is what is on disk
+    compression: str | None = None
+    stored_size: int | None = Field(default=None, sa_column=Column(BigInteger(), nullable=True))
     tags: list[str] | None = Field(default_factory=list, sa_column=Column(JSON))
     is_group: bool = False
 
@@ -351,6 +470,25 @@ class File(FileBase, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
 
 
+# Stored content of deleted files, unlinked in the background by the reclaimer
+class PendingDeletion(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    location: str
+    size: int | None = Field(default=None, sa_column=Column(BigInteger(), nullable=True))
+    attempts: int = 0
+    last_error: str | None = None
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+# Storage freed per day, by the reclaimer and by output expiry
+class ReclaimedStorage(SQLModel, table=True):
+    day: date = Field(primary_key=True)
+    reclaimed_files: int = 0
+    reclaimed_bytes: int = Field(default=0, sa_column=Column(BigInteger(), nullable=False))
+    expired_files: int = 0
+    expired_bytes: int = Field(default=0, sa_column=Column(BigInteger(), nullable=False))
+
+
 class FilePublicChild(FileBase):
     id: uuid.UUID
     run_id: uuid.UUID | None = None
@@ -366,7 +504,10 @@ class FilePublic(FileBase):
 
 class FilesPublic(SQLModel):
     data: list[FilePublic]
-    count: int
+    # None when the count was not requested
+    count: int | None
+    # Pass as `cursor` for the next page, None on the last page
+    next_cursor: str | None = None
 
 class FilesStatistics(SQLModel):
     count: int
@@ -379,8 +520,12 @@ class RunPublic(RunPublicMinimal):
     llm_summary: str | None = None
     params: dict
     files: list[FilePublic]
+    outputs_expired_at: datetime | None = None
 
 
 class RunsPublicMinimal(SQLModel):
     data: list[RunPublicMinimal]
-    count: int
+    # None when the count was not requested
+    count: int | None
+    # Pass as `cursor` for the next page, None on the last page
+    next_cursor: str | None = None
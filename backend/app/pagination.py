@@ -0,0 +1,96 @@
+import base64
+import binascii
+import json
+import uuid
+from collections.abc import Sequence
+from datetime import datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any
+
+from fastapi import HTTPException
+from sqlalchemy import ColumnElement, Row, Select, and_, desc, or_, tuple_
+
+
+def encode_cursor(order_by: str, value: Any, last_id: uuid.UUID) -> str:
+    """
+    Opaque token for the page after the row with sort `value` and `last_id`,
+    only valid for the same `order_by`.
+    """
+    if isinstance(value, datetime):
+        value = {"dt": value.isoformat()}
+    elif isinstance(value, Decimal):
+        # Kept exact, ties are compared for equality
+        value = {"dec": str(value)}
+    elif isinstance(value, Enum):
+        value = value.value
+    payload = json.dumps({"o": order_by, "v": value, "id": str(last_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order_by: str) -> tuple[Any, uuid.UUID]:
+    """The sort value and id a cursor continues after."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if payload["o"] != order_by:
+            raise ValueError(payload["o"])
+        value = payload["v"]
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value["dt"]) if "dt" in value else Decimal(value["dec"])
+        return value, uuid.UUID(payload["id"])
+    except (binascii.Error, UnicodeDecodeError, TypeError, KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_after(
+    column: ColumnElement[Any], id_column: ColumnElement[Any], descending: bool, value: Any, last_id: uuid.UUID
+) -> ColumnElement[bool]:
+    """
+    Rows after (value, last_id) in ORDER BY column, id in the given direction.
+    Postgres sorts NULLs last ascending and first descending. Row comparisons
+    let an index on (column, id) start the scan right at the cursor.
+    """
+    if descending:
+        if value is None:
+            return or_(and_(column.is_(None), id_column < last_id), column.is_not(None))
+        return tuple_(column, id_column) < tuple_(value, last_id)
+    if value is None:
+        return and_(column.is_(None), id_column > last_id)
+    return or_(tuple_(column, id_column) > tuple_(value, last_id), column.is_(None))
+
+
+def page_query(
+    statement: Select[Any],
+    column: ColumnElement[Any],
+    id_column: ColumnElement[Any],
+    order_by: str,
+    skip: int,
+    limit: int,
+    cursor: str | None,
+) -> Select[Any]:
+    """
+    Order a statement selecting (entity, sort column) by the sort column and
+    id, and select the page after `cursor`, or at offset `skip` without one.
+    """
+    descending = order_by.startswith("-")
+    if cursor:
+        value, last_id = decode_cursor(cursor, order_by)
+        statement = statement.where(keyset_after(column, id_column, descending, value, last_id))
+    else:
+        statement = statement.offset(skip)
+    if descending:
+        statement = statement.order_by(desc(column), desc(id_column))
+    else:
+        statement = statement.order_by(column, id_column)
+    return statement.limit(limit)
+
+
+def next_cursor(rows: Sequence[Row[Any] | tuple[Any, Any]], order_by: str, limit: int) -> str | None:
+    """
+    Cursor of the page after rows of (entity, sort value), None after the last
+    page. The entity can be anything with an `id`.
+    """
+    if not rows or len(rows) < limit:
+        return None
+    entity, value = rows[-1]
+    return encode_cursor(order_by, value, entity.id)
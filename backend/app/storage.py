@@ -0,0 +1,325 @@
+import hashlib
+import io
+import os
+import shutil
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from functools import cache
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO
+
+import boto3
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from botocore.client import BaseClient, Config
+from botocore.exceptions import BotoCoreError, ClientError
+from botocore.response import StreamingBody
+
+from app.core.config import settings
+
+S3_SCHEME = "s3://"
+
+# Stream content in 16MB chunks; also the S3 multipart part size (minimum 5MB)
+CHUNK_SIZE = 16 * 1024 * 1024
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=CHUNK_SIZE, multipart_chunksize=CHUNK_SIZE)
+
+
+class StorageError(OSError):
+    pass
+
+
+@dataclass
+class StoredFile:
+    location: str
+    size: int
+    checksum: str  # sha256 hex digest of the content
+
+
+class StorageBackend(ABC):
+    """
+    Where file content lives. File.location is an absolute path for local
+    storage and s3://bucket/key for object storage.
+    """
+
+    @abstractmethod
+    def save(self, key: str, file: BinaryIO) -> StoredFile:
+        """Store the content of `file` under `key`, hashing it on the way."""
+
+    @abstractmethod
+    def open(self, location: str) -> BinaryIO:
+        """Open stored content for reading."""
+
+    @abstractmethod
+    def exists(self, location: str) -> bool: ...
+
+    @abstractmethod
+    def size(self, location: str) -> int: ...
+
+    @abstractmethod
+    def delete(self, location: str) -> None:
+        """Delete stored content. Deleting missing content is not an error."""
+
+    @abstractmethod
+    def rename(self, location: str, name: str) -> str:
+        """Give stored content a new file name, returning its new location."""
+
+    @abstractmethod
+    def stage(self, location: str, destination: Path) -> None:
+        """Make stored content available to a run at `destination` on the worker."""
+
+    def download_url(self, location: str, disposition: str, expires_in: int) -> str | None:
+        """A URL clients can download the content from directly, if supported."""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    """Files on a volume shared by the API and the workers (STORAGE_PATH)."""
+
+    def __init__(self, root: str | None = None) -> None:
+        self.root = Path(root or settings.STORAGE_PATH)
+
+    def save(self, key: str, file: BinaryIO) -> StoredFile:
+        location = self.root / key
+        location.parent.mkdir(parents=True, exist_ok=True)
+        checksum = hashlib.sha256()
+        size = 0
+        with open(location, "wb") as fdst:
+            print(f"Copying file content to {location}")
+            while chunk := file.read(CHUNK_SIZE):
+                checksum.update(chunk)
+                fdst.write(chunk)
+                size += len(chunk)
+            print(f"File saved to {location}")
+        return StoredFile(location=str(location), size=size, checksum=checksum.hexdigest())
+
+    def open(self, location: str) -> BinaryIO:
+        return open(location, "rb")
+
+    def exists(self, location: str) -> bool:
+        return Path(location).exists()
+
+    def size(self, location: str) -> int:
+        return Path(location).stat().st_size
+
+    def delete(self, location: str) -> None:
+        Path(location).unlink(missing_ok=True)
+
+    def rename(self, location: str, name: str) -> str:
+        new_location = Path(location).parent / name
+        Path(location).rename(new_location)
+        return str(new_location)
+
+    def stage(self, location: str, destination: Path) -> None:
+        os.symlink(Path(location), destination)
+
+
+@cache
+def _s3_client(endpoint: str) -> BaseClient:
+    """
+    S3 client for an endpoint. Empty S3_ACCESS_KEY_ID falls back to boto3's
+    credential chain (environment, instance profile, ...).
+    """
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint,
+        region_name=settings.S3_REGION,
+        aws_access_key_id=settings.S3_ACCESS_KEY_ID or None,
+        aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY or None,
+        config=Config(
+            signature_version="s3v4",
+            s3={"addressing_style": "path"},
+            retries={"mode": "standard"},
+            connect_timeout=10,
+            read_timeout=60,
+        ),
+    )
+
+
+def _is_not_found(error: ClientError) -> bool:
+    return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NoSuchBucket")
+
+
+class _HashingReader:
+    """
+    Reads a file while hashing and counting its content. It is deliberately
+    not seekable, so uploads read it once, in order.
+    """
+
+    def __init__(self, file: BinaryIO) -> None:
+        self._file = file
+        self.checksum = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._file.read(size)
+        self.checksum.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+
+class _S3Reader(io.RawIOBase):
+    """Seekable reader over an object, streaming one GET from the current position."""
+
+    def __init__(self, storage: S3Storage, key: str) -> None:
+        self._storage = storage
+        self._key = key
+        self._position = 0
+        self._size: int | None = None
+        self._body: StreamingBody | None = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            if self._size is None:
+                self._size = self._storage._head(self._key)
+            offset += self._size
+        if offset != self._position:
+            self._close_body()
+            self._position = max(offset, 0)
+        return self._position
+
+    def readinto(self, b) -> int:
+        if self._body is None:
+            if self._size is not None and self._position >= self._size:
+                return 0
+            try:
+                response = self._storage.client.get_object(
+                    Bucket=self._storage.bucket, Key=self._key, Range=f"bytes={self._position}-"
+                )
+            except ClientError as e:
+                if _is_not_found(e):
+                    raise FileNotFoundError(f"{S3_SCHEME}{self._storage.bucket}/{self._key}") from e
+                if e.response.get("Error", {}).get("Code") == "InvalidRange":
+                    return 0
+                raise StorageError(f"S3 GET {self._key} failed: {e}") from e
+            self._body = response["Body"]
+        data = self._body.read(len(b))
+        n = len(data)
+        b[:n] = data
+        self._position += n
+        return n
+
+    def _close_body(self) -> None:
+        if self._body is not None:
+            self._body.close()
+        self._body = None
+
+    def close(self) -> None:
+        self._close_body()
+        super().close()
+
+
+class S3Storage(StorageBackend):
+    """
+    Objects in an S3-compatible store (AWS S3, MinIO, ...), addressed path-style.
+    Uploads larger than one chunk use multipart uploads and downloads are
+    redirected to presigned URLs, so workers and the API only need network
+    access to the store.
+    """
+
+    def __init__(self) -> None:
+        self.bucket = settings.S3_BUCKET
+        self.client = _s3_client(settings.S3_ENDPOINT_URL)
+
+    def _key(self, location: str) -> str:
+        bucket, _, key = location.removeprefix(S3_SCHEME).partition("/")
+        if bucket != self.bucket:
+            raise StorageError(f"{location} is not in bucket {self.bucket}")
+        return key
+
+    def _head(self, key: str) -> int:
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if _is_not_found(e):
+                raise FileNotFoundError(f"{S3_SCHEME}{self.bucket}/{key}") from e
+            raise StorageError(f"S3 HEAD {key} failed: {e}") from e
+        return response["ContentLength"]
+
+    def create_bucket(self) -> None:
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except ClientError as e:
+            if not _is_not_found(e):
+                raise StorageError(f"S3 HEAD bucket {self.bucket} failed: {e}") from e
+            self.client.create_bucket(Bucket=self.bucket)
+
+    def save(self, key: str, file: BinaryIO) -> StoredFile:
+        location = f"{S3_SCHEME}{self.bucket}/{key}"
+        print(f"Uploading file content to {location}")
+        reader = _HashingReader(file)
+        try:
+            self.client.upload_fileobj(reader, self.bucket, key, Config=TRANSFER_CONFIG)
+        except (BotoCoreError, ClientError, S3UploadFailedError) as e:
+            raise StorageError(f"S3 upload of {key} failed: {e}") from e
+        print(f"File saved to {location}")
+        return StoredFile(location=location, size=reader.size, checksum=reader.checksum.hexdigest())
+
+    def open(self, location: str) -> BinaryIO:
+        return io.BufferedReader(_S3Reader(self, self._key(location)), buffer_size=CHUNK_SIZE)
+
+    def exists(self, location: str) -> bool:
+        try:
+            self._head(self._key(location))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def size(self, location: str) -> int:
+        return self._head(self._key(location))
+
+    def delete(self, location: str) -> None:
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=self._key(location))
+        except ClientError as e:
+            if not _is_not_found(e):
+                raise StorageError(f"S3 DELETE {location} failed: {e}") from e
+
+    def rename(self, location: str, name: str) -> str:
+        # Object keys are immutable; the display name lives in the database
+        return location
+
+    def stage(self, location: str, destination: Path) -> None:
+        with self.open(location) as src, open(destination, "wb") as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+    def download_url(self, location: str, disposition: str, expires_in: int) -> str | None:
+        client = _s3_client(settings.S3_PUBLIC_ENDPOINT_URL or settings.S3_ENDPOINT_URL)
+        return client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(location), "ResponseContentDisposition": disposition},
+            ExpiresIn=expires_in,
+        )
+
+
+def storage_for(location: str) -> StorageBackend:
+    """The backend holding the content at `location`."""
+    if location.startswith(S3_SCHEME):
+        return S3Storage()
+    return LocalStorage()
+
+
+def default_storage() -> StorageBackend:
+    """The backend new content is written to."""
+    if settings.STORAGE_BACKEND == "s3":
+        return S3Storage()
+    return LocalStorage()
+
+
+def layout_key(name: str, file_id: str) -> str:
+    """
+    Key of new content in the storage layout, e.g. ab/cd/abcd..._filename.
+    The two levels of directories avoid having too many files in a single
+    directory, which can slow down the filesystem.
+    """
+    return str(PurePosixPath(file_id[:2], file_id[2:4], f"{file_id}_{name}"))
@@ -3,40 +3,99 @@ import json
 import os
 import shutil
 import signal
+import tempfile
+import time
 import uuid
-from contextlib import contextmanager
+from collections.abc import Callable, Generator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, asynccontextmanager, contextmanager
 from datetime import datetime
-from pathlib import Path
-from typing import Annotated
+from functools import partial
+from pathlib import Path, PurePath
+from typing import Annotated, Any
 
 from jinja2 import Environment as JinjaEnvironment
-from sqlmodel import Session, select
+from redis.asyncio import Redis
+from redis.exceptions import LockError
+from sqlalchemy import update
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, func, select
 from taskiq import TaskiqDepends
 
+from app import housekeeping
 from app.api.deps import get_db
-from app.conda import CondaEnvManger, CondaEnvMangerError
+from app.compaction import stage_file
+from app.conda import CondaEnvManger, CondaEnvMangerError, conda_env_key, conda_env_path
 from app.core.config import settings
-from app.crud import save_file
-from app.models import File, Run, RunStatus, SetupFile, Target, Tool
-from app.tkq import broker
+from app.core.db import engine
+from app.crud import write_file_to_storage
+from app.env_cache import env_cache
+from app.input_cache import CacheStats, input_cache, record_cache_stats
+from app.models import (
+    CondaEnvHealth,
+    CondaEnvPack,
+    File,
+    Run,
+    RunStatus,
+    SetupFile,
+    Target,
+    Tool,
+)
+from app.storage import StoredFile, default_storage, layout_key, storage_for
+from app.tkq import broker, install_broker
 from app.utils import generate_run_finished_email, send_email
 from app.wsmanager import manager
 
 SessionDep = Annotated[Session, TaskiqDepends(get_db)]
 
+# Runs share the worker's event loop, so their blocking database calls go to
+# these threads: one run's commit never stalls reading the logs of the others
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=settings.WORKER_DB_THREADS, thread_name_prefix="run-db")
+# Log lines of a run are written in one statement per interval; the
+# websocket still gets every line as it arrives
+RUN_LOG_FLUSH_INTERVAL = 1.0
+
+
+async def run_db(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Call a blocking database function in the worker's database threads."""
+    return await asyncio.get_running_loop().run_in_executor(DB_EXECUTOR, partial(fn, *args, **kwargs))
+
+
+def get_run_db() -> Generator[Session]:
+    # Committed objects stay loaded, reloading them on access would query
+    # from the event loop
+    with Session(engine, expire_on_commit=False) as session:
+        yield session
+
+
+def sync_run_log(session: Session, run_id: uuid.UUID, lines: list[str]) -> str:
+    """Append log lines to the run in one statement and return its current status."""
+    if lines:
+        session.execute(
+            update(Run)
+            .where(Run.id == run_id)
+            .values(stdout=func.coalesce(Run.stdout, "") + "".join(f"{line}\n" for line in lines))
+            # The run in the session keeps its stdout, run_tool sets it in full
+            .execution_options(synchronize_session=False)
+        )
+    status = session.exec(select(Run.status).where(Run.id == run_id)).one()
+    session.commit()
+    return status
+
 
 async def run_command_in_subprocess(
-    session: Session, run_id: uuid.UUID, command: str, tmp_dir: Path
+    session: Session, run_id: uuid.UUID, command: str, tmp_dir: Path, env: dict[str, str] | None = None
 ) -> tuple[int, str]:
     """
-    Run a command in an asynchronous subprocess, capture its stdout in real time,
-    and update logs to the DB as output is generated.
+    Run a command in an asynchronous subprocess, broadcast its stdout in real
+    time, and append it to the run in the DB every RUN_LOG_FLUSH_INTERVAL.
 
     Args:
         session (Session): Database session.
         run_id (uuid.UUID): Unique ID of the run.
         command (str): The shell command to execute.
         tmp_dir (Path): Working directory for the subprocess.
+        env (dict[str, str] | None): Environment variables, the worker's by default.
 
     Returns:
         Tuple[int, str]: (Exit code, full concatenated stdout output)
@@ -52,6 +111,7 @@ async def run_command_in_subprocess(
         shell=True,
         executable="/bin/bash",
         cwd=tmp_dir,
+        env=env,
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.STDOUT,
         start_new_session=True,  # Prevents orphaned subprocesses
@@ -59,9 +119,9 @@ async def run_command_in_subprocess(
 
     print(f"Run(id={run_id}) started with PID: {process.pid}")
     log_lines = []  # Buffer to store logs in memory
+    pending_lines = []  # Not yet written to the DB
 
     async def read_stdout():
-        run = session.execute(select(Run).where(Run.id == run_id)).scalar_one()
         # Read output line by line as it becomes available.
         while True:
             line = await process.stdout.readline()
@@ -70,14 +130,8 @@ async def run_command_in_subprocess(
             decoded_line = line.decode().rstrip()
             print(decoded_line)
             log_lines.append(decoded_line)
-
-            # Update the DB immediately
+            pending_lines.append(decoded_line)
             try:
-                # For immediate update
-                session.refresh(run)
-                run.stdout += decoded_line + "\n"
-                session.add(run)
-                session.commit()
                 await manager.broadcast(
                     json.dumps(
                         {
@@ -87,26 +141,37 @@ async def run_command_in_subprocess(
                     str(run_id),
                 )
             except Exception as e:
-                print(f"DB update error for Run(id={run_id}): {e}")
-
-    async def monitor_cancellation():
-        # Periodically check if the run status has been changed to 'cancelled'
-        while process.returncode is None:
-            run = session.execute(select(Run).where(Run.id == run_id)).scalar_one()
-            session.refresh(run)
-            if run.status == "cancelled":
-                print(f"Run(id={run_id}) was cancelled. Terminating process group.")
-                os.killpg(process.pid, signal.SIGTERM)
-                # Give the process a moment to clean up
-                await asyncio.sleep(3)
-                if process.returncode is None:
-                    print(f"Run(id={run_id}) did not terminate; sending SIGKILL.")
-                    os.killpg(process.pid, signal.SIGKILL)
-                break
-            await asyncio.sleep(1)
-
-    # Run both the log reading and cancellation monitor concurrently.
-    await asyncio.gather(read_stdout(), monitor_cancellation())
+                print(f"Log broadcast error for Run(id={run_id}): {e}")
+
+    reader = asyncio.create_task(read_stdout())
+    cancelled = False
+    # Write the logs and check whether the run has been cancelled together,
+    # once more after the output ended
+    while True:
+        output_ended = reader.done()
+        lines = pending_lines.copy()
+        pending_lines.clear()
+        try:
+            status = await run_db(sync_run_log, session, run_id, lines)
+        except Exception as e:
+            print(f"DB update error for Run(id={run_id}): {e}")
+            # Keep the lines for the next attempt
+            pending_lines[:0] = lines
+            await run_db(session.rollback)
+            status = None
+        if status == "cancelled" and not cancelled and process.returncode is None:
+            cancelled = True
+            print(f"Run(id={run_id}) was cancelled. Terminating process group.")
+            os.killpg(process.pid, signal.SIGTERM)
+            # Give the process a moment to clean up
+            await asyncio.sleep(3)
+            if process.returncode is None:
+                print(f"Run(id={run_id}) did not terminate; sending SIGKILL.")
+                os.killpg(process.pid, signal.SIGKILL)
+        if output_ended:
+            break
+        await asyncio.wait({reader}, timeout=RUN_LOG_FLUSH_INTERVAL)
+    await reader
 
     # Wait for the process to finish
     await process.wait()
@@ -118,7 +183,7 @@ async def run_command_in_subprocess(
     return return_code, full_log_output
 
 
-def update_run(session: Session, run: Run, status: RunStatus, message=None):
+async def update_run(session: Session, run: Run, status: RunStatus, message=None):
     """Update the run status and optionally add a message, then commit."""
     print(f"Setting RunStatus Run(id={run.id}): {status}")
     run.status = str(status.value)
@@ -131,14 +196,12 @@ def update_run(session: Session, run: Run, status: RunStatus, message=None):
         if run.name:
             name = f"{name} ({run.name})"
         email_data = generate_run_finished_email(run.tool.name, str(run.id), status)
-        send_email(email_to=run.owner.email, subject=email_data.subject, html_content=email_data.html_content)
+        await asyncio.to_thread(
+            send_email, email_to=run.owner.email, subject=email_data.subject, html_content=email_data.html_content
+        )
     session.add(run)
-    session.commit()
-    try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        return
-    loop.create_task(
+    await run_db(session.commit)
+    asyncio.get_running_loop().create_task(
         manager.broadcast(
             json.dumps({"stdout": run.stdout, "status": run.status}),
             str(run.id),
@@ -156,23 +219,58 @@ def create_tmp_dir(run_id: uuid.UUID) -> Path:
         if tmp_dir.exists():
             shutil.rmtree(tmp_dir)
 
-def symlink_input_files(session, run, tmp_dir):
-    """Symlink input files to the temporary directory."""
+async def symlink_input_files(session, run, tmp_dir):
+    """
+    Symlink input files to the temporary directory, decompressing compacted ones.
+    With an input cache configured, inputs are linked from the node-local cache.
+    All input files are loaded in one query. Each file is staged once under its
+    stored name, which is how the command refers to it; if different files share
+    a name, the first in input order is staged.
+    """
     if not run.input_file_ids:
         return True
-    try:
-        for file_id in run.input_file_ids:
-            file = session.get(File, file_id)
+    file_ids = list(dict.fromkeys(uuid.UUID(str(file_id)) for file_id in run.input_file_ids))
+    rows = await run_db(lambda: session.exec(select(File).where(File.id.in_(file_ids))).all())
+    files = {file.id: file for file in rows}
+    missing = [str(file_id) for file_id in file_ids if file_id not in files]
+    if missing:
+        print(f"Input files not found: {', '.join(missing)}")
+        await update_run(session, run, RunStatus.failed, "Input files not found!")
+        return False
+
+    cache = input_cache()
+    cache_stats = CacheStats()
+
+    def stage_inputs():
+        staged = {}
+        for file_id in file_ids:
+            file = files[file_id]
             file_name = Path(file.location).name
-            print(f"Symlinking {file.location} to {tmp_dir / file_name}")
-            os.symlink(Path(file.location), tmp_dir / file_name)
+            if file_name in staged:
+                print(f"Skipping {file.location}, {staged[file_name].location} is already staged as {file_name}")
+                continue
+            staged[file_name] = file
+        for file_name, file in staged.items():
+            print(f"Staging {file.location} to {tmp_dir / file_name}")
+            if cache is not None and file.checksum:
+                cache.stage(file, tmp_dir / file_name, cache_stats)
+            else:
+                stage_file(file.location, file.compression, tmp_dir / file_name)
+
+    try:
+        # Copies and decompression can take a while, keep them off the event loop
+        await asyncio.to_thread(stage_inputs)
         return True
     except Exception as e:
         print(f"Error symlinking files: {e}")
-        update_run(session, run, RunStatus.failed, "Error symlinking files!")
+        await update_run(session, run, RunStatus.failed, "Error symlinking files!")
         return False
+    finally:
+        if cache is not None:
+            print(f"Input cache: {cache_stats.hits} hits, {cache_stats.misses} misses")
+            await asyncio.to_thread(record_cache_stats, cache_stats)
 
-def write_setup_files(session, run, tmp_dir):
+async def write_setup_files(session, run, tmp_dir):
     """Render and write setup files to the temporary directory."""
     env = JinjaEnvironment()
     if run.tool.setup_files:
@@ -181,7 +279,7 @@ def write_setup_files(session, run, tmp_dir):
             file_path = tmp_dir / setup_file.name
             if file_path.exists():
                 print(f"File '{file_path}' already exists")
-                update_run(session, run, RunStatus.failed, "Tool setup failed. Please contact an administrator.")
+                await update_run(session, run, RunStatus.failed, "Tool setup failed. Please contact an administrator.")
                 return False
             with open(file_path, "w") as f:
                 template = env.from_string(setup_file.content)
@@ -190,39 +288,156 @@ def write_setup_files(session, run, tmp_dir):
                 f.write(content)
     return True
 
-def setup_conda_env(session, run, run_command):
-    """Prepare the conda environment if required, and update the command accordingly."""
+def conda_env_for(tool: Tool, env_hash: str | None) -> CondaEnvManger:
+    """The environment shared by `env_hash`, or the tool's own environment without a hash."""
+    return CondaEnvManger(
+        path=conda_env_path(Path(settings.CONDA_PATH), tool.id, env_hash),
+        env_dict=tool.conda_env or {},
+        post_install_command=tool.post_install,
+        version=tool.version,
+    )
+
+def conda_env_users(session: Session, env_hash: str, tool_id: uuid.UUID) -> int:
+    """Number of other tools using the shared environment."""
+    return session.exec(
+        select(func.count()).select_from(Tool).where(Tool.conda_env_hash == env_hash, Tool.id != tool_id)
+    ).one()
+
+async def release_conda_env(session: Session, tool: Tool, env_hash: str | None) -> None:
+    """Remove an environment the tool no longer uses, unless another tool shares it."""
+    if env_hash and await run_db(conda_env_users, session, env_hash, tool.id):
+        print(f"Conda environment {env_hash} is still in use")
+        return
+    conda_env = conda_env_for(tool, env_hash)
+    if not conda_env.is_created:
+        return
+    print(f"Removing unused conda environment {conda_env.path}")
+    try:
+        await conda_env.remove()
+    except CondaEnvMangerError as e:
+        print(f"Removing conda environment failed: {e}")
+        return
+    await run_db(drop_conda_env_pack, session, env_hash)
+
+async def pack_conda_env(session: Session, conda_env: CondaEnvManger, env_hash: str) -> None:
+    """Upload a relocatable archive of the environment for workers to unpack."""
+    if await run_db(session.get, CondaEnvPack, env_hash):
+        return
+    print(f"Packing conda environment {env_hash}")
+    Path(settings.TMP_PATH).mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=settings.TMP_PATH) as tmp:
+        archive = Path(tmp) / f"{env_hash}.tar.gz"
+        await conda_env.pack(archive)
+        with open(archive, "rb") as f:
+            stored = await asyncio.to_thread(default_storage().save, layout_key("env.tar.gz", env_hash), f)
+    session.add(CondaEnvPack(env_hash=env_hash, location=stored.location, size=stored.size, checksum=stored.checksum))
+    await run_db(session.commit)
+
+def drop_conda_env_pack(session: Session, env_hash: str | None) -> None:
+    """Delete the pack of a removed environment; unpacked copies age out of worker caches."""
+    pack = session.get(CondaEnvPack, env_hash) if env_hash else None
+    if pack is None:
+        return
+    try:
+        storage_for(pack.location).delete(pack.location)
+    except OSError as e:
+        print(f"Deleting pack of conda environment {env_hash} failed: {e}")
+        return
+    session.delete(pack)
+    session.commit()
+
+async def unpacked_conda_env(session, run, stack):
+    """
+    The tool environment unpacked on this node from its pack, if there is one.
+    The environment is kept on the node until the run's exit stack closes.
+    """
+    cache = env_cache()
+    if cache is None or not run.tool.conda_env_hash:
+        return None
+    pack = await run_db(session.get, CondaEnvPack, run.tool.conda_env_hash)
+    if pack is None:
+        return None
+    # Unpacking can take a while, keep it off the event loop
+    path = await asyncio.to_thread(stack.enter_context, cache.use(pack))
+    return CondaEnvManger(path=path, env_dict=run.tool.conda_env, post_install_command=run.tool.post_install)
+
+async def setup_conda_env(session, run, run_command, stack):
+    """
+    Prepare the conda environment if required. Returns the command and the
+    environment variables to run it with, or None if the run failed.
+    """
     if run.tool.conda_env:
-        conda_env = CondaEnvManger(
-            path=Path(settings.CONDA_PATH) / str(run.tool_id),
-            env_dict=run.tool.conda_env,
-            post_install_command=run.tool.post_install,
-        )
+        # Verified in the background by verify_conda_envs
+        health = await run_db(session.get, CondaEnvHealth, conda_env_key(run.tool.id, run.tool.conda_env_hash))
+        if health is not None and not health.healthy:
+            await update_run(
+                session, run, RunStatus.failed,
+                f"Tool environment failed verification: {health.error}. Please contact an administrator.",
+            )
+            return None
+        conda_env = conda_env_for(run.tool, run.tool.conda_env_hash)
+        if not conda_env.is_created:
+            try:
+                conda_env = await unpacked_conda_env(session, run, stack) or conda_env
+            except Exception as e:
+                print(f"Unpacking conda environment failed: {e}")
+                await update_run(session, run, RunStatus.failed, "Tool environment could not be unpacked. Please contact an administrator.")
+                return None
         if not conda_env.is_created:
-            update_run(session, run, RunStatus.failed, "Tool environment not found. Please contact an administrator.")
+            # Committed by update_run
             run.tool.status = "uninstalled"
+            await update_run(session, run, RunStatus.failed, "Tool environment not found. Please contact an administrator.")
             return None
-        # Prepend the conda activation command.
-        run_command = f"{conda_env.activate_command} && {run_command}"
-    return run_command
-
-def handle_return_code(session, run, returncode):
+        # Launch with the captured activation variables rather than sourcing
+        # conda's shell hooks for every run
+        env = conda_env.activation_env()
+        if env is None:
+            try:
+                await conda_env.capture_activation()
+                env = conda_env.activation_env()
+            except (OSError, CondaEnvMangerError) as e:
+                print(f"Capturing activation of {conda_env.path} failed: {e}")
+        if env is None:
+            # Prepend the conda activation command.
+            return f"{conda_env.activate_command} && {run_command}", None
+        return run_command, env
+    return run_command, None
+
+async def handle_return_code(session, run, returncode):
     """Handle the subprocess return code and update the run accordingly."""
     if returncode != 0:
         if returncode == -15:
             run.status = RunStatus.cancelled
         else:
             run.status = RunStatus.failed
-        update_run(session, run, run.status)
+        await update_run(session, run, run.status)
         return False
     return True
 
-def process_targets(session, run, tmp_dir):
+def scan_run_dir(tmp_dir: Path) -> list[PurePath]:
+    """List every file in the run directory once, relative to the directory."""
+    run_files = []
+    for root, _dirs, names in tmp_dir.walk():
+        for name in names:
+            path = root / name
+            if path.is_file():
+                run_files.append(path.relative_to(tmp_dir))
+    return sorted(run_files)
+
+def harvest_target_file(target_file: Path) -> StoredFile:
+    """Copy a single target file into storage."""
+    print(f"Saving target file: {target_file}")
+    with open(target_file, "rb") as tf:
+        return write_file_to_storage(name=target_file.name, file=tf)
+
+async def process_targets(session, run, tmp_dir):
     """Process target files: check their existence and save them."""
     env = JinjaEnvironment()
     missing_targets = []
+    matches: list[tuple[Target, Path]] = []
 
     if run.tool.targets:
+        run_files = scan_run_dir(tmp_dir)
         for target_data in run.tool.targets:
             target = Target(**target_data)
             print(f"Formatting target path: {target.path}")
@@ -231,8 +446,8 @@ def process_targets(session, run, tmp_dir):
             template = env.from_string(target.path)
             rendered_path = template.render(**run.params)
 
-            # Get matching file paths
-            matched_files = list((tmp_dir).glob(rendered_path))
+            # Match against the single directory listing
+            matched_files = [tmp_dir / f for f in run_files if f.full_match(rendered_path)]
 
             if target.required and not matched_files:
                 print(f"No files matched for required target pattern: {rendered_path}")
@@ -240,34 +455,56 @@ def process_targets(session, run, tmp_dir):
                 missing_targets.append(rendered_path)
                 continue
 
-            # Save all matched files
-            for target_file in matched_files:
-                print(f"Saving target file: {target_file}")
-                with open(target_file, "rb") as tf:
-                    file_obj = save_file(
-                        session=session,
-                        name=target_file.name,
-                        file=tf,
-                        owner_id=run.owner_id,
-                        file_type=target.target_type,
-                        saved=False,  # the file is not saved to the "my files" section
-                        tags=run.tags,
-                    )
-                run.files.append(file_obj)
+            matches.extend((target, target_file) for target_file in matched_files)
 
     if missing_targets:
-        update_run(session, run, RunStatus.failed, "Missing required target(s)")
+        await update_run(session, run, RunStatus.failed, "Missing required target(s)")
         return False
 
+    if not matches:
+        return True
+
+    # Copy all matched files into storage concurrently
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=settings.TARGET_HARVEST_THREADS) as pool:
+        results = await asyncio.gather(
+            *(loop.run_in_executor(pool, harvest_target_file, target_file) for _, target_file in matches),
+            return_exceptions=True,
+        )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        # Do not leave partially harvested outputs behind in storage
+        for result in results:
+            if isinstance(result, StoredFile):
+                storage_for(result.location).delete(result.location)
+        raise errors[0]
+
+    # Insert all file rows in a single commit
+    session.add_all(
+        File(
+            name=target_file.name,
+            owner_id=run.owner_id,
+            location=stored.location,
+            size=stored.size,
+            checksum=stored.checksum,
+            file_type=target.target_type,
+            saved=False,  # the file is not saved to the "my files" section
+            tags=run.tags,
+            run_id=run.id,
+        )
+        for (target, target_file), stored in zip(matches, results, strict=True)
+    )
+    await run_db(session.commit)
     return True
 
 @broker.task
 async def run_tool(
     run_id: uuid.UUID,
     run_command: str,
-    session: Session = TaskiqDepends(get_db),
+    session: Session = TaskiqDepends(get_run_db),
 ) -> bool:
-    run: Run = session.get(Run, run_id)
+    # Everything update_run needs, lazy loads would query from the event loop
+    run: Run = await run_db(session.get, Run, run_id, options=[selectinload(Run.tool), selectinload(Run.owner)])
     if run is None:
         return False
 
@@ -276,7 +513,7 @@ async def run_tool(
     if run.status != "pending":
         return False
     if run.tool.status != "installed":
-        update_run(session, run, RunStatus.failed, "Tool must be installed first. Please contact an administrator.")
+        await update_run(session, run, RunStatus.failed, "Tool must be installed first. Please contact an administrator.")
         return False
 
     # Update run state to running.
@@ -284,62 +521,119 @@ async def run_tool(
     run.started_at = datetime.utcnow()
     run.conda_env_pinned = run.tool.conda_env_pinned
     session.add(run)
-    session.commit()
+    await run_db(session.commit)
 
     try:
-        with create_tmp_dir(run_id) as tmp_dir:
+        with create_tmp_dir(run_id) as tmp_dir, ExitStack() as stack:
             # Process input files.
-            if not symlink_input_files(session, run, tmp_dir):
+            if not await symlink_input_files(session, run, tmp_dir):
                 return False
 
             # Write any required setup files.
-            if not write_setup_files(session, run, tmp_dir):
+            if not await write_setup_files(session, run, tmp_dir):
                 return False
 
             # Set up the conda environment if necessary.
-            updated_command = setup_conda_env(session, run, run_command)
-            if updated_command is None:
+            conda_setup = await setup_conda_env(session, run, run_command, stack)
+            if conda_setup is None:
                 return False
+            updated_command, env = conda_setup
 
             # Run the command in a subprocess.
             try:
-                returncode, stdout = await run_command_in_subprocess(session, run_id, updated_command, tmp_dir)
+                returncode, stdout = await run_command_in_subprocess(session, run_id, updated_command, tmp_dir, env)
                 print(f"Run(id={run_id}) finished with return code: {returncode}")
             except Exception as e:
                 print(f"An error occurred: {e}")
-                update_run(session, run, RunStatus.failed, f"An error occurred: {e}")
+                await update_run(session, run, RunStatus.failed, f"An error occurred: {e}")
                 return False
 
             run.finished_at = datetime.utcnow()
             run.stdout = stdout
 
             # Check the result of the subprocess.
-            if not handle_return_code(session, run, returncode):
+            if not await handle_return_code(session, run, returncode):
                 return False
 
             # Process any target files.
-            if not process_targets(session, run, tmp_dir):
+            if not await process_targets(session, run, tmp_dir):
                 return False
 
             # Mark the run as completed.
-            update_run(session, run, RunStatus.completed)
+            await update_run(session, run, RunStatus.completed)
 
         print(f"Run(id={run_id}) completed")
         return True
 
     except FileExistsError:
-        update_run(session, run, RunStatus.failed, "Run directory already exists")
+        await update_run(session, run, RunStatus.failed, "Run directory already exists")
         return False
     except Exception as e:
-        update_run(session, run, RunStatus.failed, f"An unexpected error occurred: {e}")
+        await update_run(session, run, RunStatus.failed, f"An unexpected error occurred: {e}")
         return False
 
-@broker.task
+# The lock of an environment expires unless refreshed, so a worker that dies
+# mid install cannot block the environment forever
+CONDA_ENV_LOCK_TIMEOUT = 120
+# Install output is broadcast line by line but committed at most this often
+INSTALL_LOG_COMMIT_INTERVAL = 1.0
+
+@asynccontextmanager
+async def conda_env_lock(key: str):
+    """Serialise installs and removals of one environment across install workers."""
+    client = Redis.from_url(settings.REDIS_URI)
+    lock = client.lock(f"conda-env-lock:{key}", timeout=CONDA_ENV_LOCK_TIMEOUT)
+
+    async def keep_alive():
+        while True:
+            await asyncio.sleep(CONDA_ENV_LOCK_TIMEOUT / 3)
+            await lock.reacquire()
+
+    try:
+        await lock.acquire()
+        refresher = asyncio.create_task(keep_alive())
+        try:
+            yield
+        finally:
+            refresher.cancel()
+            try:
+                await lock.release()
+            except LockError as e:
+                print(f"Releasing conda environment lock {key} failed: {e}")
+    finally:
+        await client.aclose()
+
+class InstallLog:
+    """Stream install output to the tool's websocket channel and installation_log."""
+
+    def __init__(self, session: Session, tool: Tool) -> None:
+        self.session = session
+        self.tool = tool
+        self.lines = []
+        self.committed_at = time.monotonic()
+
+    async def __call__(self, line: str) -> None:
+        print(line)
+        self.lines.append(line)
+        try:
+            await manager.broadcast(json.dumps({"log": line}), f"install-{self.tool.id}")
+        except Exception as e:
+            print(f"Broadcast error for Tool(id={self.tool.id}): {e}")
+        if time.monotonic() - self.committed_at >= INSTALL_LOG_COMMIT_INTERVAL:
+            await self.commit()
+
+    async def commit(self) -> None:
+        self.tool.installation_log = "\n".join(self.lines)
+        self.session.add(self.tool)
+        await run_db(self.session.commit)
+        self.committed_at = time.monotonic()
+
+@install_broker.task
 async def install_tool(
     tool_id: uuid.UUID,
-    session: Session = TaskiqDepends(get_db),
+    session: Session = TaskiqDepends(get_run_db),
 ) -> bool:
-    tool = session.get(Tool, tool_id)
+    tool = await run_db(session.get, Tool, tool_id)
     if tool is None:
         print(f"Tool(id={tool_id}) not found")
         return False
@@ -347,61 +641,135 @@ async def install_tool(
         print(f"Tool(id={tool_id}) does not have an environment")
         tool.status = "failed"
         session.add(tool)
-        session.commit()
+        await run_db(session.commit)
         return False
-    post_install_command = tool.post_install
-    conda_env = CondaEnvManger(
-        path=Path(settings.CONDA_PATH) / str(tool_id),
-        env_dict=tool.conda_env,
-        post_install_command=post_install_command,
-        version=tool.version,
-    )
-    try:
-        if conda_env.is_created:
-            print(
-                f"Conda environment for Tool(id={tool_id}) already exists. Will force create."
-            )
-        print(f"Creating conda environment for Tool(id={tool_id})")
-        stdout = await conda_env.create()
-        conda_env_pinned = await conda_env.pin()
-    except Exception as e:
-        print(f"An error occurred will creating conda environment: {e}")
-        tool.status = "failed"
-        tool.installation_log = str(e)
+    # Tools with the same environment spec share one environment
+    old_env_hash = tool.conda_env_hash
+    env_hash = conda_env_for(tool, None).env_hash
+    conda_env = conda_env_for(tool, env_hash)
+    install_log = InstallLog(session, tool)
+    async with conda_env_lock(env_hash):
+        try:
+            if conda_env.is_ready:
+                print(f"Reusing conda environment {env_hash} for Tool(id={tool_id})")
+                stdout = f"Reusing existing environment {conda_env.path}"
+            else:
+                if conda_env.is_created:
+                    print(
+                        f"Incomplete conda environment {env_hash} for Tool(id={tool_id}) found. Will force create."
+                    )
+                print(f"Creating conda environment {env_hash} for Tool(id={tool_id})")
+                stdout = await conda_env.create(on_output=install_log)
+            conda_env_pinned = await conda_env.pin()
+            await conda_env.capture_activation()
+        except Exception as e:
+            print(f"An error occurred will creating conda environment: {e}")
+            tool.status = "failed"
+            tool.installation_log = str(e)
+            session.add(tool)
+            await run_db(session.commit)
+            raise e
+
+        print(f"Conda environment for Tool(id={tool_id}) created")
+        tool.status = "installed"
+        tool.installation_log = stdout
+        tool.conda_env_pinned = conda_env_pinned
+        tool.conda_env_hash = env_hash
         session.add(tool)
-        session.commit()
-        raise e
-
-    print(f"Conda environment for Tool(id={tool_id}) created")
-    tool.status = "installed"
-    tool.installation_log = stdout
-    tool.conda_env_pinned = conda_env_pinned
-    session.add(tool)
-    session.commit()
+        await run_db(session.commit)
+        await run_db(housekeeping.check_conda_env, session, env_hash, conda_env.path, reset_baseline=True)
+        if settings.CONDA_PACK_ENVS:
+            try:
+                await pack_conda_env(session, conda_env, env_hash)
+            except Exception as e:
+                # The environment still works on nodes sharing CONDA_PATH
+                print(f"Packing conda environment {env_hash} failed: {e}")
+    if old_env_hash != env_hash:
+        # The spec changed, or the tool had its own environment before
+        async with conda_env_lock(old_env_hash or str(tool.id)):
+            await release_conda_env(session, tool, old_env_hash)
     return True
 
-@broker.task
+@install_broker.task
 async def uninstall_tool(
     tool_id: uuid.UUID,
-    session: Session = TaskiqDepends(get_db),
+    session: Session = TaskiqDepends(get_run_db),
 ) -> bool:
-    tool = session.get(Tool, tool_id)
+    tool = await run_db(session.get, Tool, tool_id)
     if tool is None:
         print(f"Tool(id={tool_id}) not found")
         return False
-    conda_env = CondaEnvManger(
-        path=Path(settings.CONDA_PATH) / str(tool_id),
-        env_dict=tool.conda_env or {},
-        post_install_command=tool.post_install,
-    )
+    env_hash = tool.conda_env_hash
+    conda_env = conda_env_for(tool, env_hash)
     print(f"Removing conda environment for Tool(id={tool_id})")
-    tool.status = "uninstalled"
-    try:
-        await conda_env.remove()
-    except CondaEnvMangerError as e:
-        print(f"Removing conda environment failed: {e}")
-        tool.installation_log = str(e)
-        tool.status = "failed"
-    session.add(tool)
-    session.commit()
+    async with conda_env_lock(env_hash or str(tool.id)):
+        tool.status = "uninstalled"
+        tool.conda_env_hash = None
+        try:
+            if env_hash and await run_db(conda_env_users, session, env_hash, tool.id):
+                print(f"Conda environment {env_hash} is still in use, keeping it")
+            else:
+                await conda_env.remove()
+                await run_db(drop_conda_env_pack, session, env_hash)
+        except CondaEnvMangerError as e:
+            print(f"Removing conda environment failed: {e}")
+            tool.installation_log = str(e)
+            tool.status = "failed"
+            tool.conda_env_hash = env_hash
+        session.add(tool)
+        await run_db(session.commit)
     return True
+
+@broker.task(schedule=[{"cron": "*/10 * * * *"}])
+async def reclaim_storage(
+    session: Session = TaskiqDepends(get_db),
+) -> int:
+    """
+    Unlink the stored content of deleted files.
+    Kicked after deletions and periodically by the scheduler to retry failures.
+    """
+    progress = await asyncio.to_thread(housekeeping.reclaim_storage, session)
+    return progress.reclaimed
+
+
+@broker.task(schedule=[{"cron": "30 2 * * *"}])
+async def expire_unsaved_outputs(
+    session: Session = TaskiqDepends(get_db),
+) -> int:
+    """Delete unsaved run outputs that are past their retention period."""
+    progress = await asyncio.to_thread(housekeeping.expire_unsaved_outputs, session)
+    if progress.files:
+        await reclaim_storage.kiq()
+    return progress.runs
+
+
+@broker.task(schedule=[{"cron": "0 4 * * *"}])
+async def compact_cold_files(
+    session: Session = TaskiqDepends(get_db),
+) -> int:
+    """Compress cold text files in place to save storage."""
+    progress = await asyncio.to_thread(housekeeping.compact_cold_files, session)
+    return progress.saved_bytes
+
+
+@broker.task(schedule=[{"cron": "0 3 * * *"}])
+async def reconcile_storage(
+    session: Session = TaskiqDepends(get_db),
+) -> dict:
+    """Report or reclaim storage that is out of sync with the database."""
+    report = await asyncio.to_thread(housekeeping.reconcile_storage, session)
+    return {
+        "orphans": report.orphans,
+        "orphan_bytes": report.orphan_bytes,
+        "dangling_rows": report.dangling_rows,
+        "stale_tmp_dirs": report.stale_tmp_dirs,
+    }
+
+
+@broker.task(schedule=[{"cron": "15 * * * *"}])
+async def verify_conda_envs(
+    session: Session = TaskiqDepends(get_db),
+) -> list[str]:
+    """Check tool environments so broken ones fail runs up front."""
+    report = await asyncio.to_thread(housekeeping.verify_conda_envs, session)
+    return report.unhealthy
@@ -1,5 +1,6 @@
 from nats.js.api import RetentionPolicy, StorageType, StreamConfig
-from taskiq import TaskiqEvents, TaskiqState
+from taskiq import TaskiqEvents, TaskiqScheduler, TaskiqState
+from taskiq.schedule_sources import LabelScheduleSource
 from taskiq_nats import PullBasedJetStreamBroker
 from taskiq_redis import RedisAsyncResultBackend
 
@@ -17,6 +18,24 @@ broker = PullBasedJetStreamBroker(
     RedisAsyncResultBackend(settings.REDIS_URI),
 )
 
+# Tool installs run on their own queue and workers, so long conda solves
+# never hold the slots runs are waiting for
+install_broker = PullBasedJetStreamBroker(
+    settings.NATS_URIS.split(","),
+    subject="cpg_install_tasks",
+    stream_name="cpg_install_jetstream",
+    durable="cpg_install_queue",
+    stream_config=StreamConfig(
+        retention=RetentionPolicy.WORK_QUEUE,
+        storage=StorageType.FILE,
+    ),
+).with_result_backend(
+    RedisAsyncResultBackend(settings.REDIS_URI),
+)
+
+# Kicks tasks declared with a `schedule` label, e.g. storage housekeeping
+scheduler = TaskiqScheduler(broker, sources=[LabelScheduleSource(broker)])
+
 
 async def startup_worker(_state: TaskiqState) -> None:
     await manager.startup()
@@ -26,5 +45,6 @@ async def shutdown_worker(_state: TaskiqState) -> None:
     await manager.shutdown()
 
 
-broker.add_event_handler(TaskiqEvents.WORKER_STARTUP, startup_worker)
-broker.add_event_handler(TaskiqEvents.WORKER_SHUTDOWN, shutdown_worker)
+for _broker in (broker, install_broker):
+    _broker.add_event_handler(TaskiqEvents.WORKER_STARTUP, startup_worker)
+    _broker.add_event_handler(TaskiqEvents.WORKER_SHUTDOWN, shutdown_worker)
@@ -0,0 +1,85 @@
+"""
+Log latency of concurrent runs on one worker: how long after a command prints
+a line it reaches the websocket broadcast, while the other runs write their
+logs to the database. Needs the database; runs and their tool and user are
+removed afterwards.
+
+    python scripts/benchmark_log_jitter.py --runs 50 --lines 200
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy import delete
+from sqlmodel import Session
+
+from app import tasks
+from app.core.db import engine
+from app.models import Run, RunStatus, Tool, ToolStatus, User
+
+latencies: list[float] = []
+
+
+async def record_latency(message: str, _channel: str) -> None:
+    received = time.time()
+    # Lines are the time the command printed them
+    try:
+        printed = float(json.loads(message)["log"])
+    except (KeyError, ValueError):
+        return
+    latencies.append(received - printed)
+
+
+async def run_one(run_id: uuid.UUID, lines: int, interval: float, tmp_dir: Path) -> None:
+    command = f"for i in $(seq 1 {lines}); do echo $EPOCHREALTIME; sleep {interval}; done"
+    with Session(engine, expire_on_commit=False) as session:
+        await tasks.run_command_in_subprocess(session, run_id, command, tmp_dir)
+
+
+async def main(runs: int, lines: int, interval: float) -> None:
+    with Session(engine) as session:
+        user = User(email=f"benchmark-{uuid.uuid4()}@example.com", hashed_password="")
+        tool = Tool(name=f"benchmark-{uuid.uuid4()}", command="echo", status=ToolStatus.installed)
+        session.add_all([user, tool])
+        session.commit()
+        run_ids = []
+        for _ in range(runs):
+            run = Run(status=RunStatus.running, tool_id=tool.id, owner_id=user.id, stdout="")
+            session.add(run)
+            run_ids.append(run.id)
+        session.commit()
+        tool_id, user_id = tool.id, user.id
+
+    tasks.manager.broadcast = record_latency
+    start = time.perf_counter()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            await asyncio.gather(*(run_one(run_id, lines, interval, Path(tmp)) for run_id in run_ids))
+    finally:
+        with Session(engine) as session:
+            session.execute(delete(Run).where(Run.id.in_(run_ids)))
+            session.execute(delete(Tool).where(Tool.id == tool_id))
+            session.execute(delete(User).where(User.id == user_id))
+            session.commit()
+    elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{runs} runs, {len(latencies)} lines in {elapsed:.1f} s")
+    print(
+        f"log latency: p50 {quantiles[49] * 1000:.1f} ms, p99 {quantiles[98] * 1000:.1f} ms, "
+        f"max {max(latencies) * 1000:.1f} ms, stdev {statistics.stdev(latencies) * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.02, help="Seconds between lines")
+    args = parser.parse_args()
+    asyncio.run(main(args.runs, args.lines, args.interval))
@@ -0,0 +1,87 @@
+"""
+Payload size and latency of a page of runs from the full listing
+(`GET /runs/`) and the lean one (`GET /runs/list`). Creates a user with runs
+of one tool, each with a large stdout, and removes them afterwards. Needs the
+database.
+
+    python scripts/benchmark_run_listing.py --runs 1000 --limit 100 --requests 50
+"""
+import argparse
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.security import create_access_token
+from app.main import app
+from app.models import Run, RunStatus, Tool, ToolStatus, User
+
+ENDPOINTS = [f"{settings.API_V1_STR}/runs/", f"{settings.API_V1_STR}/runs/list"]
+
+
+def main(runs: int, limit: int, requests: int, stdout_kb: int) -> None:
+    with Session(engine) as session:
+        user = User(email=f"benchmark-{uuid.uuid4()}@example.com", hashed_password="")
+        tool = Tool(
+            name=f"benchmark-{uuid.uuid4()}",
+            command="echo",
+            status=ToolStatus.installed,
+            explanation_of_results_markdown="x" * 4000,
+            params=[{"name": f"param_{i}", "param_type": "str", "description": "y" * 200} for i in range(20)],
+        )
+        session.add_all([user, tool])
+        session.commit()
+        for _ in range(runs):
+            session.add(
+                Run(
+                    status=RunStatus.completed,
+                    tool_id=tool.id,
+                    owner_id=user.id,
+                    params={"param_0": "value"},
+                    command="echo " + "z" * 500,
+                    stdout="log line\n" * (stdout_kb * 1024 // 9),
+                )
+            )
+        session.commit()
+        tool_id, user_id = tool.id, user.id
+
+    token = create_access_token(user_id, timedelta(hours=1))
+    headers = {"Authorization": f"Bearer {token}"}
+    try:
+        with TestClient(app) as client:
+            for endpoint in ENDPOINTS:
+                timings = []
+                size = 0
+                for _ in range(requests):
+                    start = time.perf_counter()
+                    r = client.get(endpoint, params={"limit": limit}, headers=headers)
+                    timings.append(time.perf_counter() - start)
+                    r.raise_for_status()
+                    size = len(r.content)
+                quantiles = statistics.quantiles(timings, n=100)
+                print(
+                    f"{endpoint:<24} {size / 1024:8.1f} KiB  p50 {quantiles[49] * 1000:7.1f} ms"
+                    f"  p99 {quantiles[98] * 1000:7.1f} ms"
+                )
+    finally:
+        with Session(engine) as session:
+            session.execute(delete(Run).where(Run.owner_id == user_id))
+            session.execute(delete(Tool).where(Tool.id == tool_id))
+            session.execute(delete(User).where(User.id == user_id))
+            session.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=100, help="Runs per page")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per endpoint")
+    parser.add_argument("--stdout-kb", type=int, default=64, help="Size of each run's stdout")
+    args = parser.parse_args()
+    main(args.runs, args.limit, args.requests, args.stdout_kb)
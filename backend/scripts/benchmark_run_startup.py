@@ -0,0 +1,50 @@
+"""
+Per-run startup overhead of a tool environment: sourcing conda's activate
+script before the command versus launching it with the captured activation
+variables.
+
+    python scripts/benchmark_run_startup.py /conda/envs/<hash> --runs 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from pathlib import Path
+
+from app.conda import CondaEnvManger
+
+
+async def _time_command(command: str, env: dict[str, str] | None) -> float:
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_shell(
+        command, executable="/bin/bash", env=env, stdout=asyncio.subprocess.DEVNULL
+    )
+    await process.wait()
+    return time.perf_counter() - start
+
+
+async def main(env_path: Path, runs: int, command: str) -> None:
+    conda_env = CondaEnvManger(env_path, {})
+    env = conda_env.activation_env()
+    if env is None:
+        await conda_env.capture_activation()
+        env = conda_env.activation_env()
+    variants = {
+        "activate": (f"{conda_env.activate_command} && {command}", None),
+        "captured": (command, env),
+    }
+    for name, (cmd, cmd_env) in variants.items():
+        timings = [await _time_command(cmd, cmd_env) for _ in range(runs)]
+        print(
+            f"{name:>9}: median {statistics.median(timings) * 1000:.1f} ms, "
+            f"p95 {statistics.quantiles(timings, n=20)[-1] * 1000:.1f} ms over {runs} runs"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("env_path", type=Path)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--command", default="true")
+    args = parser.parse_args()
+    asyncio.run(main(args.env_path, args.runs, args.command))
@@ -0,0 +1,81 @@
+"""
+Latency of the hot API endpoints under concurrent clients. Each client logs
+in once and then requests the endpoints in turn; pass several base URLs to
+compare deployments, e.g. before and after a change.
+
+    python scripts/load_test_api.py http://old:8000 http://new:8000 \
+        --clients 500 --requests 20 --username admin@example.com --password ...
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.core.config import settings
+
+ENDPOINTS = [
+    f"{settings.API_V1_STR}/runs/?limit=20",
+    f"{settings.API_V1_STR}/runs/active",
+    f"{settings.API_V1_STR}/files/?limit=20",
+    f"{settings.API_V1_STR}/tools/?limit=20",
+]
+
+
+async def _client(client: httpx.AsyncClient, token: str, requests: int, timings: dict[str, list[float]], errors: list[str]) -> None:
+    headers = {"Authorization": f"Bearer {token}"}
+    for i in range(requests):
+        endpoint = ENDPOINTS[i % len(ENDPOINTS)]
+        start = time.perf_counter()
+        try:
+            r = await client.get(endpoint, headers=headers)
+            r.raise_for_status()
+        except httpx.HTTPError as e:
+            errors.append(f"{endpoint}: {e}")
+            continue
+        timings[endpoint].append(time.perf_counter() - start)
+
+
+async def run(base_url: str, clients: int, requests: int, username: str, password: str) -> None:
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        r = await client.post(
+            f"{settings.API_V1_STR}/login/access-token",
+            data={"username": username, "password": password},
+        )
+        r.raise_for_status()
+        token = r.json()["access_token"]
+        timings: dict[str, list[float]] = {endpoint: [] for endpoint in ENDPOINTS}
+        errors: list[str] = []
+        start = time.perf_counter()
+        await asyncio.gather(*(_client(client, token, requests, timings, errors) for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+
+    total = sum(len(t) for t in timings.values())
+    print(f"{base_url}: {total} requests in {elapsed:.1f} s ({total / elapsed:.0f}/s), {len(errors)} errors")
+    for endpoint, values in timings.items():
+        if len(values) < 2:
+            continue
+        quantiles = statistics.quantiles(values, n=100)
+        print(
+            f"  {endpoint:<32} p50 {quantiles[49] * 1000:7.1f} ms"
+            f"  p99 {quantiles[98] * 1000:7.1f} ms  max {max(values) * 1000:7.1f} ms"
+        )
+    for error in errors[:5]:
+        print(f"  {error}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    for base_url in args.base_urls:
+        await run(base_url, args.clients, args.requests, args.username, args.password)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base_urls", nargs="+")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=20, help="Requests per client")
+    parser.add_argument("--username", default=settings.FIRST_SUPERUSER)
+    parser.add_argument("--password", default=settings.FIRST_SUPERUSER_PASSWORD)
+    asyncio.run(main(parser.parse_args()))
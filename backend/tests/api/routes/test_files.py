@@ -1,13 +1,35 @@
+import hashlib
+import io
+import tarfile
+import uuid
+import zipfile
+from compression import zstd
 from datetime import UTC, datetime, timedelta
+from pathlib import Path
 
 import pytest
 from fastapi import HTTPException
-from sqlmodel import Session
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
 
-from app.api.routes.files import get_current_file_types, read_files
-from app.models import File, User
+from app.api.routes.files import (
+    create_group,
+    get_current_file_types,
+    read_files,
+    ungroup_file,
+)
+from app.archive import ArchiveEntry, ArchiveFormat, stream_archive
+from app.compaction import ZSTD
+from app.core.config import settings
+from app.housekeeping import CompactionProgress, compact_file
+from app.models import File, PendingDeletion, User
 from tests.utils.user import create_random_user
-from tests.utils.utils import random_lower_string
+from tests.utils.utils import (
+    call_with_async_session,
+    count_queries,
+    random_lower_string,
+    test_async_engine,
+)
 
 
 def _utc_now() -> datetime:
@@ -68,8 +90,8 @@ def test_read_files_filters_by_name_and_sorts(
         created_at=_utc_now(),
     )
 
-    result = read_files(
-        session=db,
+    result = call_with_async_session(
+        read_files,
         current_user=owner,
         name=prefix.upper(),
         order_by="name",
@@ -84,8 +106,8 @@ def test_read_files_rejects_unknown_sort_column(db: Session) -> None:
     owner = create_random_user(db)
 
     with pytest.raises(HTTPException) as exc_info:
-        read_files(
-            session=db,
+        call_with_async_session(
+            read_files,
             current_user=owner,
             order_by="owner_id",
             name=None,
@@ -96,6 +118,74 @@ def test_read_files_rejects_unknown_sort_column(db: Session) -> None:
     assert exc_info.value.detail == "Invalid column name: owner_id"
 
 
+@pytest.mark.parametrize("groups", [2, 6])
+def test_read_files_statement_count_does_not_grow_with_page(db: Session, groups: int) -> None:
+    owner = create_random_user(db)
+    for i in range(groups):
+        group = _create_saved_file(db=db, owner=owner, name=f"group-{i}", size=3, created_at=_utc_now(), file_type="unknown")
+        group.is_group = True
+        db.add(group)
+        for j in range(3):
+            _create_saved_file(
+                db=db, owner=owner, name=f"child-{i}-{j}.txt", size=1, created_at=_utc_now(), parent_id=group.id
+            )
+    db.commit()
+
+    with count_queries(test_async_engine.sync_engine) as statements:
+        result = call_with_async_session(read_files, current_user=owner, order_by="-created_at", name=None, types=[])
+
+    assert len(result.data) == groups
+    assert all(len(file.children) == 3 for file in result.data)
+    # The count, the page and one query for the children of the whole page
+    assert len(statements) == 3
+
+
+def test_create_group_and_ungroup_use_set_based_statements(db: Session) -> None:
+    owner = create_random_user(db)
+    files = [
+        _create_saved_file(db=db, owner=owner, name=f"{i}.txt", size=i, created_at=_utc_now()) for i in range(50)
+    ]
+    file_ids = [file.id for file in files]
+    db.refresh(owner)
+
+    with count_queries() as statements:
+        group = create_group(session=db, current_user=owner, name="group", file_ids=file_ids + file_ids[:5])
+    # Checking the files, inserting the group, moving the files and reading the group back
+    assert len(statements) == 4
+    assert group.size == sum(range(50))
+    assert group.file_type == "text"
+    assert {child.id for child in group.children} == set(file_ids)
+
+    group_id = group.id
+    db.expire_all()
+    db.refresh(owner)
+    with count_queries() as statements:
+        message = ungroup_file(session=db, current_user=owner, id=group_id)
+    assert len(statements) == 3
+    assert message.message == "Successfully ungrouped 50 files"
+    assert db.get(File, group_id) is None
+    assert all(db.get(File, file_id).parent_id is None for file_id in file_ids)
+
+
+def test_create_group_rejects_missing_and_foreign_files(db: Session) -> None:
+    owner = create_random_user(db)
+    other = create_random_user(db)
+    own = _create_saved_file(db=db, owner=owner, name="own.txt", size=1, created_at=_utc_now())
+    foreign = _create_saved_file(db=db, owner=other, name="foreign.txt", size=1, created_at=_utc_now())
+    missing_id = uuid.uuid4()
+
+    for file_ids, status_code, detail in [
+        ([own.id, missing_id], 404, f"File not found: {missing_id}"),
+        ([own.id, foreign.id], 400, "Not enough permissions"),
+    ]:
+        with pytest.raises(HTTPException) as exc_info:
+            create_group(session=db, current_user=owner, name="group", file_ids=file_ids)
+        assert exc_info.value.status_code == status_code
+        assert exc_info.value.detail == detail
+    db.refresh(own)
+    assert own.parent_id is None
+
+
 def test_get_current_file_types_includes_only_current_saved_top_level_types(
     db: Session,
 ) -> None:
@@ -147,3 +237,250 @@ def test_get_current_file_types_includes_only_current_saved_top_level_types(
     current_types = get_current_file_types(session=db, current_user=owner)
 
     assert set(current_types) == {"fastq", "text"}
+
+
+@pytest.fixture
+def storage_path(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "STORAGE_PATH", str(tmp_path))
+    return tmp_path
+
+
+def _upload(client: TestClient, headers: dict[str, str], name: str, content: bytes) -> dict:
+    r = client.post(
+        f"{settings.API_V1_STR}/files/",
+        headers=headers,
+        files={"file": (name, content)},
+    )
+    assert r.status_code == 200
+    return r.json()
+
+
+@pytest.mark.usefixtures("storage_path")
+def test_download_group_streams_zip_and_tar(client: TestClient, normal_user_token_headers: dict[str, str]) -> None:
+    contents = {
+        f"{random_lower_string()}_R1.fastq.gz": b"\x1f\x8b" + b"a" * 5000,
+        f"{random_lower_string()}_R2.fastq.gz": b"\x1f\x8b" + b"b" * 7000,
+    }
+    ids = [
+        _upload(client, normal_user_token_headers, name, content)["id"]
+        for name, content in contents.items()
+    ]
+    r = client.post(
+        f"{settings.API_V1_STR}/files/groups",
+        headers=normal_user_token_headers,
+        params={"name": "reads"},
+        json=ids,
+    )
+    assert r.status_code == 200
+    group_id = r.json()["id"]
+
+    r = client.get(f"{settings.API_V1_STR}/files/{group_id}/download", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/zip"
+    assert 'filename="reads.zip"' in r.headers["content-disposition"]
+    with zipfile.ZipFile(io.BytesIO(r.content)) as archive:
+        assert {name: archive.read(name) for name in archive.namelist()} == contents
+        # already compressed content is stored, not deflated again
+        assert {info.compress_type for info in archive.infolist()} == {zipfile.ZIP_STORED}
+
+    r = client.get(
+        f"{settings.API_V1_STR}/files/{group_id}/download",
+        headers=normal_user_token_headers,
+        params={"archive_format": "tar"},
+    )
+    assert r.status_code == 200
+    with tarfile.open(fileobj=io.BytesIO(r.content)) as archive:
+        assert {m.name: archive.extractfile(m).read() for m in archive.getmembers()} == contents
+
+
+@pytest.mark.parametrize("archive_format", list(ArchiveFormat))
+def test_archive_measures_compressed_member_without_size(tmp_path: Path, archive_format: ArchiveFormat) -> None:
+    content = b">seq1\n" + b"ACGT" * 5000 + b"\n"
+    location = tmp_path / "legacy.fasta"
+    location.write_bytes(zstd.compress(content))
+    entry = ArchiveEntry(
+        name="legacy.fasta", path=location, modified_at=_utc_now(), compression=ZSTD, size=None
+    )
+
+    body = b"".join(stream_archive([entry], archive_format))
+
+    if archive_format == ArchiveFormat.zip:
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            assert archive.getinfo("legacy.fasta").file_size == len(content)
+            assert archive.read("legacy.fasta") == content
+    else:
+        with tarfile.open(fileobj=io.BytesIO(body)) as archive:
+            assert archive.getmember("legacy.fasta").size == len(content)
+            assert archive.extractfile("legacy.fasta").read() == content
+
+
+def _multipart_byteranges(body: bytes, content_type: str) -> list[tuple[str, bytes]]:
+    boundary = content_type.split("boundary=")[1].encode()
+    parts = []
+    for part in body.split(b"--" + boundary):
+        part = part.removeprefix(b"\r\n").removeprefix(b"\n")
+        if not part or part.startswith(b"--"):
+            continue
+        header, _, data = part.partition(b"\r\n\r\n") if b"\r\n\r\n" in part else part.partition(b"\n\n")
+        content_range = next(
+            line.split(b":", 1)[1].strip().decode()
+            for line in header.splitlines()
+            if line.lower().startswith(b"content-range")
+        )
+        start, end = content_range.removeprefix("bytes ").split("/")[0].split("-")
+        parts.append((content_range, data[: int(end) - int(start) + 1]))
+    return parts
+
+
+@pytest.mark.usefixtures("storage_path")
+def test_download_file_supports_ranges_and_etags(client: TestClient, normal_user_token_headers: dict[str, str]) -> None:
+    content = bytes(range(256)) * 64
+    file = _upload(client, normal_user_token_headers, f"{random_lower_string()}.bin", content)
+    url = f"{settings.API_V1_STR}/files/{file['id']}/download"
+
+    r = client.get(url, headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert r.content == content
+    assert r.headers["accept-ranges"] == "bytes"
+    etag = r.headers["etag"]
+    assert etag == f'"{hashlib.sha256(content).hexdigest()}"'
+
+    r = client.get(url, headers={**normal_user_token_headers, "Range": "bytes=100-1123"})
+    assert r.status_code == 206
+    assert r.content == content[100:1124]
+    assert r.headers["content-range"] == f"bytes 100-1123/{len(content)}"
+
+    r = client.get(url, headers={**normal_user_token_headers, "Range": "bytes=-10"})
+    assert r.status_code == 206
+    assert r.content == content[-10:]
+
+    r = client.get(url, headers={**normal_user_token_headers, "Range": "bytes=0-9,5000-5009"})
+    assert r.status_code == 206
+    assert r.headers["content-type"].startswith("multipart/byteranges")
+    assert _multipart_byteranges(r.content, r.headers["content-type"]) == [
+        (f"bytes 0-9/{len(content)}", content[0:10]),
+        (f"bytes 5000-5009/{len(content)}", content[5000:5010]),
+    ]
+
+    r = client.get(url, headers={**normal_user_token_headers, "Range": f"bytes={len(content)}-"})
+    assert r.status_code == 416
+
+    r = client.get(url, headers={**normal_user_token_headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["etag"] == etag
+
+    r = client.get(url, headers={**normal_user_token_headers, "If-Range": '"stale"', "Range": "bytes=0-9"})
+    assert r.status_code == 200
+    assert r.content == content
+
+    token = client.get(f"{settings.API_V1_STR}/files/{file['id']}/token", headers=normal_user_token_headers).json()
+    r = client.get(f"{settings.API_V1_STR}/files/download/{token}", headers={"Range": "bytes=10-19"})
+    assert r.status_code == 206
+    assert r.content == content[10:20]
+    assert r.headers["etag"] == etag
+
+
+def test_download_file_offloads_to_proxy(
+    db: Session,
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    storage_path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    content = b">seq\nACGT\n"
+    file = _upload(client, normal_user_token_headers, f"{random_lower_string()}.fasta", content)
+    location = Path(db.get(File, uuid.UUID(file["id"])).location)
+    url = f"{settings.API_V1_STR}/files/{file['id']}/download"
+
+    monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD", "x-accel-redirect")
+    r = client.get(url, headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert r.content == b""
+    assert r.headers["x-accel-redirect"] == f"/protected-storage/{location.relative_to(storage_path).as_posix()}"
+    assert r.headers["etag"] == f'"{hashlib.sha256(content).hexdigest()}"'
+    assert file["name"] in r.headers["content-disposition"]
+
+    monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD", "x-sendfile")
+    r = client.get(url, headers=normal_user_token_headers)
+    assert r.headers["x-sendfile"] == str(location)
+
+
+@pytest.mark.usefixtures("storage_path")
+def test_download_with_token_does_not_query_database(
+    db: Session, client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    content = b"chr1\t100\t200\n" * 100
+    file = _upload(client, normal_user_token_headers, f"{random_lower_string()}.bed", content)
+    token = client.get(
+        f"{settings.API_V1_STR}/files/{file['id']}/token",
+        headers=normal_user_token_headers,
+        params={"minutes": 5},
+    ).json()
+
+    with count_queries() as statements:
+        for start in range(0, len(content), 500):
+            r = client.get(
+                f"{settings.API_V1_STR}/files/download/{token}",
+                headers={"Range": f"bytes={start}-{start + 499}"},
+            )
+            assert r.status_code == 206
+            assert r.content == content[start : start + 500]
+    assert statements == []
+
+    # Tampered tokens are rejected
+    r = client.get(f"{settings.API_V1_STR}/files/download/{token[:-2]}xx")
+    assert r.status_code == 403
+
+    # Login tokens cannot be used as download tokens
+    login_token = normal_user_token_headers["Authorization"].removeprefix("Bearer ")
+    r = client.get(f"{settings.API_V1_STR}/files/download/{login_token}")
+    assert r.status_code == 403
+
+    # Content replaced on disk no longer matches the signed size
+    location = Path(db.get(File, uuid.UUID(file["id"])).location)
+    location.write_bytes(b"changed")
+    r = client.get(f"{settings.API_V1_STR}/files/download/{token}")
+    assert r.status_code == 404
+
+
+@pytest.mark.usefixtures("storage_path")
+def test_download_compacted_file(
+    db: Session,
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "COMPACTION_MIN_SIZE", 0)
+    content = b">seq1\n" + b"ACGT" * 5000 + b"\n"
+    file = _upload(client, normal_user_token_headers, f"{random_lower_string()}.fasta", content)
+    token = client.get(
+        f"{settings.API_V1_STR}/files/{file['id']}/token",
+        headers=normal_user_token_headers,
+        params={"minutes": 5},
+    ).json()
+
+    original = Path(db.get(File, uuid.UUID(file["id"])).location)
+
+    progress = CompactionProgress()
+    compact_file(db, uuid.UUID(file["id"]), progress)
+    assert progress.compacted == 1
+    db_file = db.get(File, uuid.UUID(file["id"]))
+    db.refresh(db_file)
+    assert db_file.compression == "zstd"
+    assert db_file.size == len(content)
+    assert db_file.stored_size == Path(db_file.location).stat().st_size < len(content)
+
+    r = client.get(f"{settings.API_V1_STR}/files/{file['id']}/download", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert r.content == content
+    assert r.headers["etag"] == f'"{hashlib.sha256(content).hexdigest()}"'
+
+    # The original stays in place until the reclaimer removes it, so tokens
+    # issued before compaction keep working until then
+    assert db_file.location != str(original)
+    assert Path(db_file.location).name.partition("_")[2] == original.name.partition("_")[2]
+    assert original.read_bytes() == content
+    assert db.exec(select(PendingDeletion).where(PendingDeletion.location == str(original))).one()
+    r = client.get(f"{settings.API_V1_STR}/files/download/{token}")
+    assert r.status_code == 200
+    assert r.content == content
@@ -1,14 +1,25 @@
-import asyncio
 from datetime import UTC, datetime, timedelta
 
 import pytest
-from fastapi import HTTPException
+from fastapi import BackgroundTasks, HTTPException
 from sqlmodel import Session
 
-from app.api.routes.runs import create_run, delete_runs, read_run_tool_names, read_runs
+from app.api.deps import get_run
+from app.api.routes.runs import (
+    create_run,
+    delete_runs,
+    read_run_tool_names,
+    read_runs,
+    read_runs_list,
+)
+from app.core.security import (
+    create_access_token,
+    create_download_token,
+    create_run_download_token,
+)
 from app.models import Run, RunStatus, Tool, ToolStatus, User
 from tests.utils.user import create_random_user
-from tests.utils.utils import random_lower_string
+from tests.utils.utils import call_with_async_session, random_lower_string
 
 
 def _utc_now() -> datetime:
@@ -85,8 +96,8 @@ def test_read_runs_filters_by_name_and_sorts(db: Session) -> None:
         created_at=_utc_now(),
     )
 
-    result = read_runs(
-        session=db,
+    result = call_with_async_session(
+        read_runs,
         current_user=owner,
         name=prefix.upper(),
         order_by="name",
@@ -102,8 +113,8 @@ def test_read_runs_rejects_unknown_sort_column(db: Session) -> None:
     owner = create_random_user(db)
 
     with pytest.raises(HTTPException) as exc_info:
-        read_runs(
-            session=db,
+        call_with_async_session(
+            read_runs,
             current_user=owner,
             order_by="owner_id",
             name=None,
@@ -138,8 +149,8 @@ def test_read_runs_sorts_by_runtime(db: Session) -> None:
         finished_at=started_at + timedelta(minutes=30),
     )
 
-    result = read_runs(
-        session=db,
+    result = call_with_async_session(
+        read_runs,
         current_user=owner,
         order_by="-runtime",
         name=None,
@@ -150,6 +161,80 @@ def test_read_runs_sorts_by_runtime(db: Session) -> None:
     assert [item.id for item in result.data[:2]] == [longer.id, shorter.id]
 
 
+@pytest.mark.parametrize("order_by", ["-created_at", "created_at", "finished_at", "-finished_at", "-runtime", "status"])
+def test_read_runs_cursor_pages_match_offset_order(db: Session, order_by: str) -> None:
+    owner = create_random_user(db)
+    tool = _create_tool(db=db, owner=owner)
+    now = _utc_now()
+    for i in range(7):
+        # Ties on created_at and some runs without finished_at
+        _create_run(
+            db=db,
+            owner=owner,
+            tool=tool,
+            name=f"run-{i}",
+            status=[RunStatus.completed, RunStatus.failed][i % 2],
+            created_at=now - timedelta(minutes=i // 2),
+            finished_at=now + timedelta(minutes=i) if i % 3 else None,
+        )
+    common = {"current_user": owner, "order_by": order_by, "name": None, "tool_name": None, "statuses": None}
+    expected = [run.id for run in call_with_async_session(read_runs, **common).data]
+
+    paged = []
+    cursor = None
+    while True:
+        page = call_with_async_session(read_runs, **common, limit=3, cursor=cursor, include_count=False)
+        assert page.count is None
+        paged.extend(run.id for run in page.data)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    assert paged == expected
+    assert len(paged) == 7
+
+
+def test_read_runs_rejects_cursor_of_other_order(db: Session) -> None:
+    owner = create_random_user(db)
+    tool = _create_tool(db=db, owner=owner)
+    for i in range(2):
+        _create_run(db=db, owner=owner, tool=tool, name=f"run-{i}", status=RunStatus.completed, created_at=_utc_now())
+    common = {"current_user": owner, "name": None, "tool_name": None, "statuses": None, "limit": 1}
+    cursor = call_with_async_session(read_runs, order_by="name", **common).next_cursor
+
+    for bad_cursor, order_by in [(cursor, "-name"), ("not-a-cursor", "name")]:
+        with pytest.raises(HTTPException) as exc_info:
+            call_with_async_session(read_runs, order_by=order_by, cursor=bad_cursor, **common)
+        assert exc_info.value.status_code == 400
+        assert exc_info.value.detail == "Invalid cursor"
+
+
+def test_read_runs_list_matches_read_runs_with_tools_once(db: Session) -> None:
+    owner = create_random_user(db)
+    tools = [_create_tool(db=db, owner=owner) for _ in range(2)]
+    for i in range(5):
+        _create_run(
+            db=db,
+            owner=owner,
+            tool=tools[i % 2],
+            name=f"run-{i}",
+            status=RunStatus.completed,
+            created_at=_utc_now() - timedelta(minutes=i),
+        )
+    common = {"current_user": owner, "order_by": "-created_at", "name": None, "tool_name": None, "statuses": None}
+    full = call_with_async_session(read_runs, **common)
+
+    lean = call_with_async_session(read_runs_list, **common, limit=3)
+
+    assert [run.id for run in lean.data] == [run.id for run in full.data[:3]]
+    assert lean.count == 5
+    assert set(lean.tools) == {tool.id for tool in tools}
+    assert all(lean.tools[run.tool_id].name == full_run.tool.name for run, full_run in zip(lean.data, full.data[:3], strict=True))
+    next_page = call_with_async_session(read_runs_list, **common, limit=3, cursor=lean.next_cursor)
+    assert [run.id for run in next_page.data] == [run.id for run in full.data[3:]]
+    assert next_page.next_cursor is None
+
+
 def test_read_runs_filters_by_tool_name(db: Session) -> None:
     owner = create_random_user(db)
     selected_tool = _create_tool(db=db, owner=owner)
@@ -172,8 +257,8 @@ def test_read_runs_filters_by_tool_name(db: Session) -> None:
         created_at=_utc_now(),
     )
 
-    result = read_runs(
-        session=db,
+    result = call_with_async_session(
+        read_runs,
         current_user=owner,
         order_by="-created_at",
         name=None,
@@ -205,8 +290,8 @@ def test_read_runs_filters_by_statuses(db: Session) -> None:
         created_at=_utc_now(),
     )
 
-    result = read_runs(
-        session=db,
+    result = call_with_async_session(
+        read_runs,
         current_user=owner,
         order_by="-created_at",
         name=None,
@@ -259,6 +344,7 @@ def test_delete_runs_filters_by_name_and_tool(db: Session) -> None:
     delete_runs(
         session=db,
         current_user=owner,
+        background_tasks=BackgroundTasks(),
         name=prefix,
         tool_name=selected_tool.name,
     )
@@ -310,15 +396,31 @@ def test_create_run_rejects_required_empty_values(db: Session) -> None:
 
     for empty_value in ["", "   ", []]:
         with pytest.raises(HTTPException) as exc_info:
-            asyncio.run(
-                create_run(
-                    session=db,
-                    current_user=owner,
-                    tool_id=tool.id,
-                    params={"sample": empty_value},
-                    tags=[],
-                )
+            call_with_async_session(
+                create_run,
+                current_user=owner,
+                tool_id=tool.id,
+                params={"sample": empty_value},
+                tags=[],
             )
 
         assert exc_info.value.status_code == 400
         assert exc_info.value.detail == "Missing required parameter: sample"
+
+
+def test_run_download_requires_run_download_token(db: Session) -> None:
+    owner = create_random_user(db)
+    tool = _create_tool(db=db, owner=owner)
+    run = _create_run(db=db, owner=owner, tool=tool, name="run", status=RunStatus.completed, created_at=_utc_now())
+
+    token = create_run_download_token(run.id, expires_delta=timedelta(minutes=1))
+    assert get_run(session=db, token=token).id == run.id
+
+    # Login tokens and file download tokens are signed with the same key
+    for other_token in [
+        create_access_token(run.id, expires_delta=timedelta(minutes=1)),
+        create_download_token(run.id, key=None, size=None, name="run", checksum=None, expires_delta=timedelta(minutes=1)),
+    ]:
+        with pytest.raises(HTTPException) as exc_info:
+            get_run(session=db, token=other_token)
+        assert exc_info.value.status_code == 403
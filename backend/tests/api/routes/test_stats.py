@@ -0,0 +1,19 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+
+def test_read_db_pool_stats(client: TestClient, superuser_token_headers: dict[str, str]) -> None:
+    r = client.get(f"{settings.API_V1_STR}/stats/stats/db-pool", headers=superuser_token_headers)
+
+    assert r.status_code == 200
+    pools = {pool["engine"]: pool for pool in r.json()}
+    assert pools["primary"]["size"] == settings.POSTGRES_POOL_SIZE
+    # The request itself holds a connection of the primary pool
+    assert pools["primary"]["checked_out"] >= 1
+    assert 0 < pools["primary"]["utilisation_percent"] <= 100
+
+
+def test_read_db_pool_stats_requires_superuser(client: TestClient, normal_user_token_headers: dict[str, str]) -> None:
+    r = client.get(f"{settings.API_V1_STR}/stats/stats/db-pool", headers=normal_user_token_headers)
+    assert r.status_code == 403
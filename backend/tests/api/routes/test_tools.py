@@ -0,0 +1,45 @@
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.models import Tool, ToolStatus
+from tests.utils.conda import create_conda_env
+from tests.utils.utils import random_lower_string
+
+
+@pytest.fixture
+def conda_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setattr(settings, "CONDA_PATH", str(tmp_path / "conda"))
+    return tmp_path / "conda"
+
+
+def test_read_environments(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session, conda_path: Path
+) -> None:
+    tool, path = create_conda_env(db, conda_path)
+    sharing = Tool(
+        name=f"tool-{random_lower_string()}",
+        command="samtools view",
+        status=ToolStatus.installed,
+        conda_env=tool.conda_env,
+        conda_env_hash=tool.conda_env_hash,
+    )
+    db.add(sharing)
+    db.commit()
+
+    r = client.get(f"{settings.API_V1_STR}/tools/environments", headers=superuser_token_headers)
+
+    assert r.status_code == 200
+    environment = next(e for e in r.json()["data"] if e["env_key"] == tool.conda_env_hash)
+    assert environment["path"] == str(path)
+    assert sorted(environment["tool_names"]) == sorted([tool.name, sharing.name])
+    assert environment["healthy"] is True
+    assert environment["size"] > 0
+
+
+def test_read_environments_requires_superuser(client: TestClient, normal_user_token_headers: dict[str, str]) -> None:
+    r = client.get(f"{settings.API_V1_STR}/tools/environments", headers=normal_user_token_headers)
+    assert r.status_code == 403
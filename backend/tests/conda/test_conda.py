@@ -0,0 +1,49 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from app.conda import CondaEnvManger
+
+
+def _env_hash(env_dict: dict, post_install_command: str | None = None, version: str | None = None) -> str:
+    return CondaEnvManger(Path("/conda/env"), env_dict, post_install_command, version).env_hash
+
+
+def test_env_hash_ignores_dependency_order_and_whitespace() -> None:
+    env = {"channels": ["conda-forge", "bioconda"], "dependencies": ["samtools=1.21", "python=3.12", {"pip": ["snk", "pyyaml"]}]}
+    reordered = {"channels": ["conda-forge", "bioconda"], "dependencies": [{"pip": ["pyyaml", " snk"]}, "python=3.12", "samtools=1.21 "]}
+
+    assert _env_hash(env) == _env_hash(reordered)
+    assert _env_hash(env, " snk install x ") == _env_hash(reordered, "snk install x")
+
+
+def test_env_hash_changes_with_the_environment() -> None:
+    env = {"channels": ["conda-forge", "bioconda"], "dependencies": ["samtools={{version}}"]}
+
+    assert _env_hash(env, version="1.21") != _env_hash(env, version="1.20")
+    # Channel order sets channel priority
+    assert _env_hash(env, version="1.21") != _env_hash({**env, "channels": ["bioconda", "conda-forge"]}, version="1.21")
+    assert _env_hash(env, version="1.21") != _env_hash(env, "snk install x", version="1.21")
+
+
+def test_capture_activation_records_changed_variables(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("HIVE_UNSET_ME", "1")
+    monkeypatch.setenv("HIVE_KEEP_ME", "1")
+    conda_env = CondaEnvManger(tmp_path, {})
+    # Stands in for conda's activate script
+    conda_env.activate_command = f"export PATH='{tmp_path}/bin':\"$PATH\" HIVE_PREFIX='{tmp_path}'; unset HIVE_UNSET_ME"
+
+    activation = asyncio.run(conda_env.capture_activation())
+
+    assert activation["HIVE_PREFIX"] == str(tmp_path)
+    assert activation["HIVE_UNSET_ME"] is None
+    assert "HIVE_KEEP_ME" not in activation
+    env = conda_env.activation_env()
+    assert env["PATH"].startswith(f"{tmp_path}/bin:")
+    assert "HIVE_UNSET_ME" not in env
+    assert env["HIVE_KEEP_ME"] == "1"
+
+
+def test_activation_env_without_capture(tmp_path: Path) -> None:
+    assert CondaEnvManger(tmp_path, {}).activation_env() is None
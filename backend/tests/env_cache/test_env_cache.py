@@ -0,0 +1,62 @@
+import hashlib
+import io
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from app.env_cache import UNPACKED_MARKER, EnvCache
+from app.models import CondaEnvPack
+
+
+def _pack(tmp_path: Path, env_hash: str, size: int = 100) -> CondaEnvPack:
+    location = tmp_path / "storage" / f"{env_hash}.tar.gz"
+    location.parent.mkdir(exist_ok=True)
+    with tarfile.open(location, "w:gz") as tar:
+        content = b"x" * size
+        info = tarfile.TarInfo("bin/tool")
+        info.size = len(content)
+        info.mode = 0o755
+        tar.addfile(info, io.BytesIO(content))
+    data = location.read_bytes()
+    return CondaEnvPack(env_hash=env_hash, location=str(location), size=len(data), checksum=hashlib.sha256(data).hexdigest())
+
+
+def test_use_unpacks_once(tmp_path: Path) -> None:
+    cache = EnvCache(tmp_path / "cache", max_bytes=1024)
+    pack = _pack(tmp_path, "a" * 64)
+
+    with cache.use(pack) as path:
+        assert (path / "bin" / "tool").stat().st_mode & 0o111
+        assert (path / UNPACKED_MARKER).read_text() == "100"
+    (path / "bin" / "extra").write_text("kept")
+    with cache.use(pack) as again:
+        assert again == path
+        assert (again / "bin" / "extra").exists()
+
+
+def test_use_rejects_checksum_mismatch(tmp_path: Path) -> None:
+    cache = EnvCache(tmp_path / "cache", max_bytes=1024)
+    pack = _pack(tmp_path, "b" * 64)
+    pack.checksum = "0" * 64
+
+    with pytest.raises(OSError, match="does not match its checksum"):
+        with cache.use(pack):
+            pass
+    assert not (tmp_path / "cache" / "envs" / pack.env_hash).exists()
+    assert not any((tmp_path / "cache" / "incoming").iterdir())
+
+
+def test_evict_skips_environments_in_use(tmp_path: Path) -> None:
+    cache = EnvCache(tmp_path / "cache", max_bytes=1024)
+    packs = [_pack(tmp_path, str(i) * 64) for i in range(3)]
+    with cache.use(packs[0]):
+        for pack in packs[1:]:
+            with cache.use(pack):
+                pass
+        cache.max_bytes = 150
+
+        assert cache.evict() == 200
+
+    unpacked = {path.name for path in (tmp_path / "cache" / "envs").iterdir()}
+    assert unpacked == {packs[0].env_hash}
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session, select
+
+from app.compaction import open_stored, stage_file
+from app.core.config import settings
+from app.housekeeping import compact_cold_files
+from app.models import File, PendingDeletion, Run, RunStatus, Tool, ToolStatus, User
+from tests.utils.user import create_random_user
+from tests.utils.utils import random_lower_string
+
+
+def _create_file(db: Session, owner: User, location: Path, content: bytes, days_old: int) -> File:
+    location.write_bytes(content)
+    file = File(
+        name=location.name,
+        file_type="fasta",
+        size=len(content),
+        location=str(location),
+        owner_id=owner.id,
+        created_at=datetime.utcnow() - timedelta(days=days_old),
+    )
+    db.add(file)
+    db.commit()
+    return file
+
+
+def test_compact_cold_files(db: Session, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "COMPACTION_MIN_SIZE", 0)
+    monkeypatch.setattr(settings, "COMPACTION_MIN_AGE_DAYS", 30)
+    owner = create_random_user(db)
+    content = b">seq1\n" + b"ACGT" * 10000 + b"\n"
+    cold = _create_file(db, owner, tmp_path / "cold.fasta", content, days_old=31)
+    hot = _create_file(db, owner, tmp_path / "hot.fasta", content, days_old=1)
+    in_use = _create_file(db, owner, tmp_path / "in_use.fasta", content, days_old=31)
+    tool = Tool(name=f"tool-{random_lower_string()}", command="true", status=ToolStatus.installed)
+    db.add(tool)
+    db.commit()
+    db.add(
+        Run(
+            status=RunStatus.running,
+            tool_id=tool.id,
+            owner_id=owner.id,
+            input_file_ids=[str(in_use.id)],
+        )
+    )
+    db.commit()
+
+    compact_cold_files(db)
+
+    db.expire_all()
+    cold, hot, in_use = db.get(File, cold.id), db.get(File, hot.id), db.get(File, in_use.id)
+    assert cold.compression == "zstd"
+    assert cold.size == len(content)
+    assert cold.stored_size == Path(cold.location).stat().st_size < len(content)
+    with open_stored(cold.location, cold.compression) as f:
+        assert f.read() == content
+    # The original is handed to the reclaimer rather than overwritten
+    assert Path(cold.location).parent == tmp_path
+    assert Path(cold.location).name.endswith("_cold.fasta")
+    assert (tmp_path / "cold.fasta").read_bytes() == content
+    assert db.exec(select(PendingDeletion).where(PendingDeletion.location == str(tmp_path / "cold.fasta"))).one()
+    assert hot.compression is None
+    assert in_use.compression is None
+    assert Path(in_use.location).read_bytes() == content
+
+    # Run inputs get a decompressed copy instead of a symlink
+    staged = tmp_path / "run" / "cold.fasta"
+    staged.parent.mkdir()
+    stage_file(cold.location, cold.compression, staged)
+    assert not staged.is_symlink()
+    assert staged.read_bytes() == content
@@ -0,0 +1,63 @@
+import shutil
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.housekeeping import verify_conda_envs
+from app.models import CondaEnvHealth, CondaEnvPack, ToolStatus
+from tests.utils.conda import create_conda_env
+
+
+@pytest.fixture
+def conda_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setattr(settings, "CONDA_PATH", str(tmp_path / "conda"))
+    return tmp_path / "conda"
+
+
+def test_verify_conda_envs_detects_changes(db: Session, conda_path: Path) -> None:
+    healthy, _ = create_conda_env(db, conda_path)
+    changed, changed_path = create_conda_env(db, conda_path)
+    broken, broken_path = create_conda_env(db, conda_path)
+    (changed_path / "conda-meta" / "samtools-1.21-0.json").write_text('{"name": "samtools", "files": []}')
+    (broken_path / "bin" / "bcftools").symlink_to(broken_path / "missing")
+
+    report = verify_conda_envs(db)
+
+    assert changed.conda_env_hash in report.unhealthy
+    assert broken.conda_env_hash in report.unhealthy
+    assert healthy.conda_env_hash not in report.unhealthy
+    assert db.get(CondaEnvHealth, healthy.conda_env_hash).size == 64 + len('{"name": "samtools"}')
+    assert db.get(CondaEnvHealth, changed.conda_env_hash).error == "Environment changed since it was installed"
+    assert "bcftools" in db.get(CondaEnvHealth, broken.conda_env_hash).error
+
+
+def test_verify_conda_envs_forgets_unused_envs(db: Session, conda_path: Path) -> None:
+    tool, path = create_conda_env(db, conda_path)
+    tool.status = ToolStatus.uninstalled
+    db.add(tool)
+    db.commit()
+
+    verify_conda_envs(db)
+
+    db.expire_all()
+    assert db.get(CondaEnvHealth, tool.conda_env_hash) is None
+
+
+def test_verify_conda_envs_skips_packed_envs_missing_on_node(db: Session, conda_path: Path) -> None:
+    tool, path = create_conda_env(db, conda_path)
+    unpacked, unpacked_path = create_conda_env(db, conda_path)
+    db.add(CondaEnvPack(env_hash=tool.conda_env_hash, location="s3://packs/env.tar.gz", size=1, checksum="x"))
+    db.commit()
+    # A run worker that only unpacks environments from their packs
+    shutil.rmtree(path)
+    shutil.rmtree(unpacked_path)
+
+    report = verify_conda_envs(db)
+
+    assert report.skipped == 1
+    assert tool.conda_env_hash not in report.unhealthy
+    assert unpacked.conda_env_hash in report.unhealthy
+    db.expire_all()
+    assert db.get(CondaEnvHealth, tool.conda_env_hash).healthy
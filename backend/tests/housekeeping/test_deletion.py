@@ -0,0 +1,79 @@
+from pathlib import Path
+
+from sqlmodel import Session, select
+
+from app.housekeeping import delete_files_deferred, reclaim_storage
+from app.models import File, PendingDeletion, User
+from tests.utils.user import create_random_user
+
+
+def _create_file(db: Session, owner: User, location: Path, parent: File | None = None) -> File:
+    location.write_bytes(b"content")
+    file = File(
+        name=location.name,
+        file_type="text",
+        size=7,
+        location=str(location),
+        saved=True,
+        owner_id=owner.id,
+        parent_id=parent.id if parent else None,
+    )
+    db.add(file)
+    db.commit()
+    db.refresh(file)
+    return file
+
+
+def test_delete_files_deferred_queues_content(db: Session, tmp_path: Path) -> None:
+    owner = create_random_user(db)
+    group = File(name="group", file_type="text", is_group=True, saved=True, owner_id=owner.id)
+    db.add(group)
+    db.commit()
+    child = _create_file(db, owner, tmp_path / "child.txt", parent=group)
+    other = _create_file(db, owner, tmp_path / "other.txt")
+    group_id, child_id, other_id = group.id, child.id, other.id
+
+    deleted_ids = delete_files_deferred(db, File.id.in_([group_id, other_id]))
+    db.commit()
+
+    assert set(deleted_ids) == {group_id, other_id}
+    assert db.get(File, group_id) is None
+    assert db.get(File, other_id) is None
+    # Children of a deleted group are kept as top level files
+    db.expire_all()
+    assert db.get(File, child_id).parent_id is None
+    # Content is left in place for the reclaimer
+    assert (tmp_path / "other.txt").exists()
+    pending = db.exec(
+        select(PendingDeletion).where(PendingDeletion.location == str(tmp_path / "other.txt"))
+    ).one()
+    assert pending.size == 7
+    assert pending.attempts == 0
+
+
+def test_reclaim_storage_unlinks_and_retries_failures(db: Session, tmp_path: Path) -> None:
+    owner = create_random_user(db)
+    reclaimable = _create_file(db, owner, tmp_path / "reclaimable.txt")
+    # A directory cannot be unlinked, so its entry is kept and retried
+    stuck = tmp_path / "stuck"
+    stuck.mkdir()
+    stuck_file = File(name="stuck", file_type="text", location=str(stuck), owner_id=owner.id)
+    db.add(stuck_file)
+    db.commit()
+
+    delete_files_deferred(db, File.id.in_([reclaimable.id, stuck_file.id]))
+    db.commit()
+
+    progress = reclaim_storage(db, batch_size=1)
+
+    assert not (tmp_path / "reclaimable.txt").exists()
+    assert progress.reclaimed >= 1
+    assert progress.failed >= 1
+    remaining = db.exec(
+        select(PendingDeletion).where(
+            PendingDeletion.location.in_([str(tmp_path / "reclaimable.txt"), str(stuck)])
+        )
+    ).all()
+    assert [p.location for p in remaining] == [str(stuck)]
+    assert remaining[0].attempts == 1
+    assert remaining[0].last_error
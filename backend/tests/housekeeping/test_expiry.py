@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.housekeeping import expire_unsaved_outputs
+from app.models import (
+    File,
+    PendingDeletion,
+    ReclaimedStorage,
+    Run,
+    RunStatus,
+    Tool,
+    ToolStatus,
+    User,
+)
+from tests.utils.user import create_random_user
+from tests.utils.utils import random_lower_string
+
+
+def _create_run(db: Session, owner: User, tool: Tool, finished_days_ago: int) -> Run:
+    finished_at = datetime.utcnow() - timedelta(days=finished_days_ago)
+    run = Run(
+        status=RunStatus.completed,
+        tool_id=tool.id,
+        owner_id=owner.id,
+        created_at=finished_at,
+        finished_at=finished_at,
+    )
+    db.add(run)
+    db.commit()
+    return run
+
+
+def _create_output(db: Session, run: Run, location: Path, saved: bool = False) -> File:
+    location.write_bytes(b"output")
+    file = File(
+        name=location.name,
+        file_type="text",
+        size=6,
+        location=str(location),
+        saved=saved,
+        owner_id=run.owner_id,
+        run_id=run.id,
+    )
+    db.add(file)
+    db.commit()
+    return file
+
+
+def test_expire_unsaved_outputs_honours_tool_retention(
+    db: Session, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "UNSAVED_OUTPUT_RETENTION_DAYS", 30)
+    owner = create_random_user(db)
+    default_tool = Tool(name=f"tool-{random_lower_string()}", command="true", status=ToolStatus.installed)
+    short_tool = Tool(
+        name=f"tool-{random_lower_string()}",
+        command="true",
+        status=ToolStatus.installed,
+        output_retention_days=1,
+    )
+    db.add_all([default_tool, short_tool])
+    db.commit()
+    recent = _create_run(db, owner, default_tool, finished_days_ago=2)
+    old = _create_run(db, owner, default_tool, finished_days_ago=31)
+    short = _create_run(db, owner, short_tool, finished_days_ago=2)
+    recent_output = _create_output(db, recent, tmp_path / "recent.txt")
+    old_output = _create_output(db, old, tmp_path / "old.txt")
+    saved_output = _create_output(db, old, tmp_path / "saved.txt", saved=True)
+    short_output = _create_output(db, short, tmp_path / "short.txt")
+    today = db.get(ReclaimedStorage, datetime.utcnow().date())
+    expired_before = today.expired_bytes if today else 0
+
+    progress = expire_unsaved_outputs(db)
+
+    assert progress.files >= 2
+    db.expire_all()
+    assert db.get(File, recent_output.id) is not None
+    assert db.get(File, old_output.id) is None
+    assert db.get(File, short_output.id) is None
+    assert db.get(File, saved_output.id) is not None
+    assert db.get(Run, recent.id).outputs_expired_at is None
+    assert db.get(Run, old.id).outputs_expired_at is not None
+    assert db.get(Run, short.id).outputs_expired_at is not None
+    queued = db.exec(
+        select(PendingDeletion.location).where(PendingDeletion.location.startswith(str(tmp_path)))
+    ).all()
+    assert sorted(queued) == [str(tmp_path / "old.txt"), str(tmp_path / "short.txt")]
+    assert db.get(ReclaimedStorage, datetime.utcnow().date()).expired_bytes >= expired_before + 12
+
+
+def test_expire_unsaved_outputs_disabled_by_default(db: Session, tmp_path: Path) -> None:
+    owner = create_random_user(db)
+    tool = Tool(name=f"tool-{random_lower_string()}", command="true", status=ToolStatus.installed)
+    db.add(tool)
+    db.commit()
+    run = _create_run(db, owner, tool, finished_days_ago=365)
+    output = _create_output(db, run, tmp_path / "kept.txt")
+
+    expire_unsaved_outputs(db)
+
+    db.expire_all()
+    assert db.get(File, output.id) is not None
+    assert db.get(Run, run.id).outputs_expired_at is None
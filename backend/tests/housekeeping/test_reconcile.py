@@ -0,0 +1,138 @@
+import uuid
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.housekeeping import iter_known_locations, iter_storage_files, reconcile_storage
+from app.models import (
+    CondaEnvPack,
+    File,
+    PendingDeletion,
+    Run,
+    RunStatus,
+    Tool,
+    ToolStatus,
+)
+from tests.utils.user import create_random_user
+from tests.utils.utils import random_lower_string
+
+
+@pytest.fixture
+def storage_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    storage = tmp_path / "storage"
+    storage.mkdir()
+    monkeypatch.setattr(settings, "STORAGE_PATH", str(storage))
+    monkeypatch.setattr(settings, "TMP_PATH", str(tmp_path / "runs"))
+    return storage
+
+
+def _write(storage: Path, name: str) -> Path:
+    path = storage / name[:2] / name[2:4] / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"content")
+    return path
+
+
+def _create_run(db: Session, status: RunStatus) -> Run:
+    owner = create_random_user(db)
+    tool = Tool(name=f"tool-{random_lower_string()}", command="true", status=ToolStatus.installed)
+    db.add(tool)
+    db.commit()
+    run = Run(status=status, tool_id=tool.id, owner_id=owner.id)
+    db.add(run)
+    db.commit()
+    return run
+
+
+def test_iter_storage_files_is_ordered_by_path(storage_path: Path) -> None:
+    for name in ["ffee_c", "00aa_b", "00aa_a", "0a11_d"]:
+        _write(storage_path, name)
+    (storage_path / "not-a-shard").mkdir()
+    (storage_path / "not-a-shard" / "x").write_bytes(b"")
+
+    paths = [entry.path for entry in iter_storage_files(storage_path)]
+
+    assert paths == sorted(paths)
+    assert [Path(p).name for p in paths] == ["00aa_a", "00aa_b", "0a11_d", "ffee_c"]
+
+
+def test_iter_known_locations_pages_over_shared_locations(db: Session, storage_path: Path) -> None:
+    owner = create_random_user(db)
+    # Copies share a location; "_" sorts after upper and before lower case bytewise
+    names = ["aaaa_b", "aaaa_B", "aaaa__", "aaaa_b", "aaaa_b", "aaaa_a"]
+    files = [
+        File(name=name, file_type="text", location=str(storage_path / "aa" / "aa" / name), owner_id=owner.id)
+        for name in names
+    ]
+    db.add_all([*files, PendingDeletion(location=str(storage_path / "aa" / "aa" / "aaaa_b"))])
+    db.commit()
+
+    rows = list(iter_known_locations(db, storage_path, batch_size=2))
+
+    locations = [row.location for row in rows]
+    assert locations == sorted(locations, key=str.encode)
+    assert len(rows) == len(names) + 1
+    assert {row.id for row in rows if row.id} == {file.id for file in files}
+
+
+def test_reconcile_storage_reports_orphans_and_dangling_rows(db: Session, storage_path: Path) -> None:
+    owner = create_random_user(db)
+    known = _write(storage_path, "aabb_known")
+    orphan = _write(storage_path, "aacc_orphan")
+    pending = _write(storage_path, "bbcc_pending")
+    missing = storage_path / "ccdd" / "eeff" / "ccdd_missing"
+    known_file = File(name="known", file_type="text", location=str(known), owner_id=owner.id)
+    dangling_file = File(name="missing", file_type="text", location=str(missing), owner_id=owner.id)
+    db.add_all([known_file, dangling_file, PendingDeletion(location=str(pending))])
+    db.commit()
+
+    # Nothing is old enough to be considered orphaned yet
+    report = reconcile_storage(db, reclaim=False, grace_hours=1)
+    assert report.scanned_files == 3
+    assert report.orphans == 0
+    assert report.dangling_file_ids == [dangling_file.id]
+
+    report = reconcile_storage(db, reclaim=False, grace_hours=0)
+    assert report.orphans == 1
+    assert report.orphan_bytes == len(b"content")
+    assert report.dangling_rows == 1
+    assert orphan.exists()
+    assert db.get(File, dangling_file.id) is not None
+
+    report = reconcile_storage(db, reclaim=True, grace_hours=0, batch_size=1)
+    assert report.reclaimed_orphans == 1
+    assert report.deleted_rows == 1
+    db.expire_all()
+    assert db.get(File, dangling_file.id) is None
+    assert db.get(File, known_file.id) is not None
+    assert db.exec(select(PendingDeletion).where(PendingDeletion.location == str(orphan))).one()
+
+
+def test_reconcile_storage_keeps_conda_env_packs(db: Session, storage_path: Path) -> None:
+    env_hash = uuid.uuid4().hex
+    pack = _write(storage_path, f"{env_hash}_env.tar.gz")
+    db.add(CondaEnvPack(env_hash=env_hash, location=str(pack), size=len(b"content"), checksum="checksum"))
+    db.commit()
+
+    report = reconcile_storage(db, reclaim=True, grace_hours=0)
+
+    assert report.orphans == 0
+    assert not db.exec(select(PendingDeletion).where(PendingDeletion.location == str(pack))).first()
+    assert pack.exists()
+
+
+@pytest.mark.usefixtures("storage_path")
+def test_reconcile_storage_removes_stale_run_dirs(db: Session) -> None:
+    finished = _create_run(db, RunStatus.completed)
+    running = _create_run(db, RunStatus.running)
+    tmp_path = Path(settings.TMP_PATH)
+    for run_id in [finished.id, running.id, uuid.uuid4()]:
+        (tmp_path / str(run_id)).mkdir(parents=True)
+
+    report = reconcile_storage(db, reclaim=False, grace_hours=0)
+
+    assert report.stale_tmp_dirs == 2
+    assert not (tmp_path / str(finished.id)).exists()
+    assert (tmp_path / str(running.id)).exists()
@@ -0,0 +1,73 @@
+import hashlib
+import os
+import uuid
+from pathlib import Path
+
+import pytest
+
+from app.input_cache import CacheStats, InputCache
+from app.models import File
+
+
+def _stored_file(tmp_path: Path, content: bytes) -> File:
+    location = tmp_path / "storage" / f"{uuid.uuid4()}.fasta"
+    location.parent.mkdir(exist_ok=True)
+    location.write_bytes(content)
+    return File(
+        id=uuid.uuid4(),
+        name=location.name,
+        file_type="fasta",
+        size=len(content),
+        location=str(location),
+        checksum=hashlib.sha256(content).hexdigest(),
+        owner_id=uuid.uuid4(),
+    )
+
+
+def test_stage_links_cached_content(tmp_path: Path) -> None:
+    cache = InputCache(tmp_path / "cache", max_bytes=1024)
+    file = _stored_file(tmp_path, b">ref\nACGT\n")
+    stats = CacheStats()
+    run_dirs = [tmp_path / "run1", tmp_path / "run2"]
+    for run_dir in run_dirs:
+        run_dir.mkdir()
+        cache.stage(file, run_dir / "ref.fasta", stats)
+
+    assert (stats.hits, stats.misses, stats.fetched_bytes) == (1, 1, len(b">ref\nACGT\n"))
+    for run_dir in run_dirs:
+        staged = run_dir / "ref.fasta"
+        assert staged.read_bytes() == b">ref\nACGT\n"
+        assert staged.stat().st_mode & 0o222 == 0
+    # Both runs share the cached blob
+    assert (run_dirs[0] / "ref.fasta").stat().st_nlink == 3
+
+
+def test_stage_rejects_content_not_matching_checksum(tmp_path: Path) -> None:
+    cache = InputCache(tmp_path / "cache", max_bytes=1024)
+    file = _stored_file(tmp_path, b"original")
+    Path(file.location).write_bytes(b"changed")
+    (tmp_path / "run").mkdir()
+
+    with pytest.raises(OSError, match="does not match its checksum"):
+        cache.stage(file, tmp_path / "run" / "input", CacheStats())
+    assert not list((tmp_path / "cache" / "blobs").rglob("*"))
+
+
+def test_evict_keeps_recent_and_in_use_blobs(tmp_path: Path) -> None:
+    cache = InputCache(tmp_path / "cache", max_bytes=1024)
+    run_dir = tmp_path / "run"
+    run_dir.mkdir()
+    files = [_stored_file(tmp_path, bytes([i]) * 100) for i in range(4)]
+    stats = CacheStats()
+    for i, file in enumerate(files):
+        cache.stage(file, run_dir / f"input_{i}", stats)
+        if i != 0:
+            # Only the first input is still in use by a run
+            (run_dir / f"input_{i}").unlink()
+        os.utime(cache._blob(file.checksum), (i, i))
+
+    cache.max_bytes = 250
+    assert cache.evict() == 200
+    cached = {path.name for path in (tmp_path / "cache" / "blobs").rglob("*") if path.is_file()}
+    # The oldest blob is in use, so the next oldest ones are evicted instead
+    assert cached == {files[0].checksum, files[3].checksum}
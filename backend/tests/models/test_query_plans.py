@@ -0,0 +1,126 @@
+import uuid
+from collections.abc import Generator
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Select, delete, desc, text
+from sqlmodel import Session, func, select
+
+from app.core.db import engine
+from app.models import File, Run, RunStatus, Tool, ToolStatus, User
+from tests.utils.utils import random_lower_string
+
+pytestmark = pytest.mark.slow
+
+USERS = 200
+ROWS_PER_USER = 100
+
+
+@pytest.fixture(scope="module")
+def seeded(db: Session) -> Generator[tuple[User, Run, File]]:
+    """Many users with many runs and files each, so plans reflect a large table."""
+    tool = Tool(name=f"tool-{random_lower_string()}", command="echo", status=ToolStatus.installed)
+    users = [User(email=f"{random_lower_string()}@example.com", hashed_password="") for _ in range(USERS)]
+    db.add(tool)
+    db.add_all(users)
+    db.commit()
+    now = datetime.utcnow()
+    statuses = [RunStatus.completed] * 48 + [RunStatus.failed, RunStatus.running]
+    user_groups = {}
+    for user in users:
+        runs = [
+            Run(
+                status=statuses[i % len(statuses)],
+                tool_id=tool.id,
+                owner_id=user.id,
+                created_at=now - timedelta(minutes=i),
+            )
+            for i in range(ROWS_PER_USER)
+        ]
+        groups = [
+            File(name=f"group-{i}", file_type="text", saved=True, is_group=True, owner_id=user.id, created_at=now)
+            for i in range(ROWS_PER_USER // 10)
+        ]
+        files = [
+            File(
+                name=f"file-{i}",
+                file_type="text",
+                size=i,
+                saved=i % 2 == 0,
+                owner_id=user.id,
+                run_id=runs[i].id,
+                parent_id=groups[i % len(groups)].id if i % 5 == 0 else None,
+                created_at=now - timedelta(minutes=i),
+            )
+            for i in range(ROWS_PER_USER)
+        ]
+        user_groups[user.id] = groups
+        db.add_all(runs)
+        db.add_all(groups)
+        db.add_all(files)
+    db.commit()
+    with engine.connect() as connection:
+        connection.execute(text("ANALYZE run"))
+        connection.execute(text("ANALYZE file"))
+        connection.commit()
+
+    user = users[0]
+    yield user, db.exec(select(Run).where(Run.owner_id == user.id)).first(), user_groups[user.id][0]
+
+    user_ids = [user.id for user in users]
+    db.execute(delete(File).where(File.owner_id.in_(user_ids)))
+    db.execute(delete(Run).where(Run.owner_id.in_(user_ids)))
+    db.execute(delete(User).where(User.id.in_(user_ids)))
+    db.execute(delete(Tool).where(Tool.id == tool.id))
+    db.commit()
+
+
+def explain(db: Session, statement: Select) -> str:
+    compiled = statement.compile(engine, compile_kwargs={"literal_binds": True})
+    return "\n".join(db.connection().execute(text(f"EXPLAIN {compiled}")).scalars())
+
+
+def test_run_listing_uses_owner_created_at_index(db: Session, seeded: tuple[User, Run, File]) -> None:
+    user, _, _ = seeded
+    plan = explain(db, select(Run).where(Run.owner_id == user.id).order_by(desc(Run.created_at)).limit(100))
+    assert "ix_run_owner_id_created_at" in plan
+
+
+def test_active_run_count_uses_partial_index(db: Session, seeded: tuple[User, Run, File]) -> None:
+    user, _, _ = seeded
+    plan = explain(
+        db,
+        select(func.count())
+        .select_from(Run)
+        .where(Run.owner_id == user.id)
+        .where(Run.status.in_(["pending", "running"])),
+    )
+    assert "ix_run_owner_id_active" in plan
+
+
+def test_file_listing_uses_top_level_index(db: Session, seeded: tuple[User, Run, File]) -> None:
+    user, _, _ = seeded
+    plan = explain(
+        db,
+        select(File)
+        .where(File.owner_id == user.id, File.saved, File.parent_id.is_(None))
+        .order_by(desc(File.created_at))
+        .limit(100),
+    )
+    assert "ix_file_owner_id_created_at_top_level" in plan
+
+
+def test_file_stats_use_covering_index(db: Session, seeded: tuple[User, Run, File]) -> None:
+    user, _, _ = seeded
+    plan = explain(db, select(func.sum(File.size)).where(File.owner_id == user.id, File.saved))
+    assert "ix_file_owner_id_saved" in plan
+
+
+@pytest.mark.parametrize("column", ["parent_id", "run_id"])
+def test_file_lookups_by_parent_and_run_use_indexes(
+    db: Session, seeded: tuple[User, Run, File], column: str
+) -> None:
+    _, run, group = seeded
+    value: uuid.UUID = group.id if column == "parent_id" else run.id
+    plan = explain(db, select(File).where(getattr(File, column) == value))
+    assert f"ix_file_{column}" in plan
@@ -0,0 +1,91 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.models import File, Run, RunStatus, Tool, ToolStatus
+from app.tasks import process_targets, scan_run_dir
+from tests.utils.user import create_random_user
+from tests.utils.utils import random_lower_string
+
+
+def _create_run(db: Session, targets: list[dict]) -> Run:
+    owner = create_random_user(db)
+    tool = Tool(
+        name=f"tool-{random_lower_string()}",
+        command="echo hello",
+        enabled=True,
+        status=ToolStatus.installed,
+        targets=targets,
+    )
+    db.add(tool)
+    db.commit()
+    run = Run(
+        status=RunStatus.running,
+        params={"SAMPLE": "s1"},
+        tool_id=tool.id,
+        owner_id=owner.id,
+        stdout="",
+        tags=["batch"],
+    )
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+@pytest.fixture
+def storage_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    storage = tmp_path / "storage"
+    monkeypatch.setattr(settings, "STORAGE_PATH", str(storage))
+    return storage
+
+
+def test_scan_run_dir_lists_nested_files(tmp_path: Path) -> None:
+    (tmp_path / "results").mkdir()
+    (tmp_path / "results" / "a.txt").write_text("a")
+    (tmp_path / "b.txt").write_text("b")
+
+    assert scan_run_dir(tmp_path) == [Path("b.txt"), Path("results/a.txt")]
+
+
+def test_process_targets_harvests_all_matches(db: Session, tmp_path: Path, storage_path: Path) -> None:
+    run = _create_run(
+        db,
+        targets=[
+            {"path": "{{ SAMPLE }}/*.tsv", "target_type": "tsv"},
+            {"path": "**/*.log", "target_type": "text", "required": False},
+        ],
+    )
+    run_dir = tmp_path / "run"
+    (run_dir / "s1").mkdir(parents=True)
+    for i in range(20):
+        (run_dir / "s1" / f"sample_{i}.tsv").write_text(f"row\t{i}\n")
+    (run_dir / "s1" / "run.log").write_text("done\n")
+
+    assert asyncio.run(process_targets(db, run, run_dir))
+
+    files = db.exec(select(File).where(File.run_id == run.id)).all()
+    assert len(files) == 21
+    assert {f.file_type for f in files} == {"tsv", "text"}
+    for file in files:
+        assert Path(file.location).is_relative_to(storage_path)
+        assert Path(file.location).stat().st_size == file.size
+        assert file.tags == ["batch"]
+        assert not file.saved
+
+
+def test_process_targets_fails_on_missing_required_target(db: Session, tmp_path: Path, storage_path: Path) -> None:
+    run = _create_run(db, targets=[{"path": "*.vcf", "target_type": "vcf"}])
+    run_dir = tmp_path / "run"
+    run_dir.mkdir()
+    (run_dir / "other.txt").write_text("x")
+
+    assert not asyncio.run(process_targets(db, run, run_dir))
+
+    db.refresh(run)
+    assert run.status == RunStatus.failed
+    assert "No files matched pattern '*.vcf'!" in run.stdout
+    assert not storage_path.exists()
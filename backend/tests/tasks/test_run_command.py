@@ -0,0 +1,47 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session
+
+from app.models import Run, RunStatus, Tool, ToolStatus
+from app.tasks import run_command_in_subprocess
+from app.wsmanager import manager
+from tests.utils.user import create_random_user
+from tests.utils.utils import count_queries, random_lower_string
+
+
+def _create_run(db: Session) -> Run:
+    owner = create_random_user(db)
+    tool = Tool(name=f"tool-{random_lower_string()}", command="echo", enabled=True, status=ToolStatus.installed)
+    db.add(tool)
+    db.commit()
+    run = Run(status=RunStatus.running, tool_id=tool.id, owner_id=owner.id, stdout="")
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+def test_run_command_batches_log_writes(db: Session, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    broadcast = []
+
+    async def record_broadcast(message: str, channel: str) -> None:
+        broadcast.append((channel, message))
+
+    monkeypatch.setattr(manager, "broadcast", record_broadcast)
+    run = _create_run(db)
+    expected = [f"line {i}" for i in range(1, 501)]
+
+    with count_queries() as statements:
+        returncode, stdout = asyncio.run(
+            run_command_in_subprocess(db, run.id, "for i in $(seq 1 500); do echo line $i; done", tmp_path)
+        )
+
+    assert returncode == 0
+    assert stdout.splitlines() == expected
+    # Every line is broadcast, but written in a few statements
+    assert len(broadcast) == len(expected)
+    assert len([s for s in statements if s.startswith("UPDATE run")]) < 10
+    db.refresh(run)
+    assert run.stdout.splitlines() == expected
@@ -0,0 +1,43 @@
+import asyncio
+from contextlib import AsyncExitStack
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session
+
+from app.models import CondaEnvHealth, Run, RunStatus
+from app.tasks import setup_conda_env
+from app.wsmanager import manager
+from tests.utils.conda import create_conda_env
+from tests.utils.user import create_random_user
+
+
+async def _setup(db: Session, run: Run) -> tuple[str, dict[str, str] | None] | None:
+    async with AsyncExitStack() as stack:
+        return await setup_conda_env(db, run, run.tool.command, stack)
+
+
+def test_setup_conda_env_fails_run_on_unhealthy_env(
+    db: Session, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    async def no_broadcast(message: str, channel: str) -> None:
+        pass
+
+    monkeypatch.setattr(manager, "broadcast", no_broadcast)
+    tool, _ = create_conda_env(db, tmp_path / "conda")
+    health = db.get(CondaEnvHealth, tool.conda_env_hash)
+    assert health
+    health.healthy = False
+    health.error = "checksum mismatch"
+    db.add(health)
+    owner = create_random_user(db)
+    run = Run(status=RunStatus.running, tool_id=tool.id, owner_id=owner.id, stdout="")
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+
+    assert asyncio.run(_setup(db, run)) is None
+
+    db.refresh(run)
+    assert run.status == RunStatus.failed
+    assert "Tool environment failed verification: checksum mismatch" in run.stdout
@@ -0,0 +1,115 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.models import File, Run, RunStatus, Tool, ToolStatus, User
+from app.tasks import symlink_input_files
+from tests.utils.user import create_random_user
+from tests.utils.utils import count_queries, random_lower_string
+
+
+@pytest.fixture(autouse=True)
+def no_input_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "INPUT_CACHE_PATH", None)
+
+
+def _create_files(db: Session, owner: User, directory: Path, count: int) -> list[File]:
+    directory.mkdir(parents=True, exist_ok=True)
+    files = []
+    for i in range(count):
+        location = directory / f"sample_{i}.txt"
+        location.write_text(f"sample {i}\n")
+        file = File(name=location.name, file_type="text", size=location.stat().st_size, location=str(location), owner_id=owner.id)
+        db.add(file)
+        files.append(file)
+    db.commit()
+    return files
+
+
+def _create_run(db: Session, owner: User, files: list[File]) -> Run:
+    tool = Tool(name=f"tool-{random_lower_string()}", command="cat", enabled=True, status=ToolStatus.installed)
+    db.add(tool)
+    db.commit()
+    run = Run(
+        status=RunStatus.running,
+        tool_id=tool.id,
+        owner_id=owner.id,
+        stdout="",
+        input_file_ids=[str(file.id) for file in files],
+    )
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+@pytest.mark.parametrize("count", [1, 50])
+def test_symlink_input_files_uses_one_query(db: Session, tmp_path: Path, count: int) -> None:
+    owner = create_random_user(db)
+    files = _create_files(db, owner, tmp_path / "storage", count)
+    run = _create_run(db, owner, files)
+    run_dir = tmp_path / "run"
+    run_dir.mkdir()
+    db.expire_all()
+
+    with count_queries() as statements:
+        assert asyncio.run(symlink_input_files(db, run, run_dir))
+
+    assert len([s for s in statements if "FROM file" in s]) == 1
+    for file in files:
+        staged = run_dir / Path(file.location).name
+        assert staged.is_symlink()
+        assert staged.resolve() == Path(file.location).resolve()
+
+
+def test_symlink_input_files_stages_collisions_deterministically(db: Session, tmp_path: Path) -> None:
+    owner = create_random_user(db)
+    first = _create_files(db, owner, tmp_path / "a", 2)
+    second = _create_files(db, owner, tmp_path / "b", 1)
+    # The same file twice and a different file with the same name
+    run = _create_run(db, owner, [first[1], first[0], first[1], second[0]])
+    run_dir = tmp_path / "run"
+    run_dir.mkdir()
+
+    assert asyncio.run(symlink_input_files(db, run, run_dir))
+
+    assert sorted(path.name for path in run_dir.iterdir()) == ["sample_0.txt", "sample_1.txt"]
+    assert (run_dir / "sample_0.txt").resolve() == Path(first[0].location).resolve()
+    assert (run_dir / "sample_1.txt").resolve() == Path(first[1].location).resolve()
+
+
+def test_symlink_input_files_fails_on_missing_file(db: Session, tmp_path: Path) -> None:
+    owner = create_random_user(db)
+    files = _create_files(db, owner, tmp_path / "storage", 2)
+    run = _create_run(db, owner, files)
+    db.delete(files[0])
+    db.commit()
+    run_dir = tmp_path / "run"
+    run_dir.mkdir()
+
+    assert not asyncio.run(symlink_input_files(db, run, run_dir))
+
+    db.refresh(run)
+    assert run.status == RunStatus.failed
+    assert "Input files not found!" in run.stdout
+    assert not any(run_dir.iterdir())
+
+
+def test_symlink_input_files_fails_on_file_without_location(db: Session, tmp_path: Path) -> None:
+    owner = create_random_user(db)
+    files = _create_files(db, owner, tmp_path / "storage", 2)
+    files[1].location = None
+    db.add(files[1])
+    db.commit()
+    run = _create_run(db, owner, files)
+    run_dir = tmp_path / "run"
+    run_dir.mkdir()
+
+    assert not asyncio.run(symlink_input_files(db, run, run_dir))
+
+    db.refresh(run)
+    assert run.status == RunStatus.failed
+    assert "Error symlinking files!" in run.stdout
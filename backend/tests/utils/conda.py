@@ -0,0 +1,30 @@
+import uuid
+from pathlib import Path
+
+from sqlmodel import Session
+
+from app.conda import shared_env_path
+from app.housekeeping import check_conda_env
+from app.models import Tool, ToolStatus
+from tests.utils.utils import random_lower_string
+
+
+def create_conda_env(db: Session, conda_path: Path) -> tuple[Tool, Path]:
+    """An installed tool with a minimal shared environment on disk, verified once."""
+    env_hash = uuid.uuid4().hex
+    path = shared_env_path(conda_path, env_hash)
+    (path / "conda-meta").mkdir(parents=True)
+    (path / "conda-meta" / "samtools-1.21-0.json").write_text('{"name": "samtools"}')
+    (path / "bin").mkdir()
+    (path / "bin" / "samtools").write_bytes(b"\x7fELF" * 16)
+    tool = Tool(
+        name=f"tool-{random_lower_string()}",
+        command="samtools --version",
+        status=ToolStatus.installed,
+        conda_env={"channels": ["bioconda"], "dependencies": ["samtools=1.21"]},
+        conda_env_hash=env_hash,
+    )
+    db.add(tool)
+    db.commit()
+    check_conda_env(db, env_hash, path, reset_baseline=True)
+    return tool, path
@@ -1,9 +1,21 @@
+import asyncio
 import random
 import string
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
 
 from fastapi.testclient import TestClient
+from sqlalchemy import Engine, NullPool, event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core.config import settings
+from app.core.db import engine
+
+# Pooled connections are bound to the event loop that opened them, and every
+# asyncio.run below starts a new one
+test_async_engine = create_async_engine(str(settings.SQLALCHEMY_DATABASE_URI), poolclass=NullPool)
 
 
 def random_lower_string() -> str:
@@ -24,3 +36,27 @@ def get_superuser_token_headers(client: TestClient) -> dict[str, str]:
     a_token = tokens["access_token"]
     headers = {"Authorization": f"Bearer {a_token}"}
     return headers
+
+
+@contextmanager
+def count_queries(bind: Engine = engine) -> Iterator[list[str]]:
+    """Collect every SQL statement executed on the engine inside the block."""
+    statements: list[str] = []
+
+    def before_cursor_execute(_conn, _cursor, statement, *_args) -> None:
+        statements.append(statement)
+
+    event.listen(bind, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(bind, "before_cursor_execute", before_cursor_execute)
+
+
+def call_with_async_session(route: Callable[..., Awaitable[Any]], **kwargs: Any) -> Any:
+    """Call an async route directly on a fresh AsyncSession, as get_async_db would."""
+    async def call() -> Any:
+        async with AsyncSession(test_async_engine, expire_on_commit=False) as session:
+            return await route(session=session, **kwargs)
+
+    return asyncio.run(call())